@@ -0,0 +1,7 @@
+import os, django
+
+
+# Benchmarks run against the project settings without touching the database
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'printestimate.settings')
+    django.setup()
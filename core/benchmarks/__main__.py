@@ -0,0 +1,43 @@
+import sys, argparse
+from . import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m core.benchmarks',
+        description='Packing and sheet layout benchmarks, run without a database')
+    parser.add_argument('names', nargs='*', 
+        help='benchmarks to run: binpacker, get_layout, sheet_fed, roll_fed')
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per case')
+    parser.add_argument('--save', metavar='PATH', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+        help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+    setup()
+
+    from .suite import run, save, load, compare
+    results = run(args.names, args.repeat)
+
+    print('%-12s %6s %9s %9s %9s %9s %10s %9s %8s %6s' % ('benchmark', 'cases', 
+        'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'peak KiB', 'outs', 'usage', 'errors'))
+    for result in results:
+        latency, memory, quality = result.latency, result.memory, result.quality
+        print('%-12s %6s %9.3f %9.3f %9.3f %9.3f %10.1f %9s %8.2f %6s' % (result.name, 
+            len(result.cases), latency['p50'], latency['p90'], latency['p99'], latency['max'], 
+            memory['peak_kib_mean'], quality['count'], quality['usage_mean'], result.errors))
+
+    if args.save:
+        save(results, args.save)
+        print('Saved baseline to %s' % args.save)
+
+    if args.compare:
+        regressions = compare(results, load(args.compare), args.threshold)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        if len(regressions) > 0:
+            sys.exit(1)
+        print('No regressions against %s' % args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+# Sizes a print shop commonly quotes on, as (width, length, uom)
+
+PARENT_SHEETS = [
+    (25, 38, 'inch'), (28, 40, 'inch'), (23, 35, 'inch'), (20, 30, 'inch'),
+    (12, 18, 'inch'), (13, 19, 'inch'), (320, 450, 'mm'), (640, 900, 'mm'), 
+    (700, 1000, 'mm'), (594, 841, 'mm'), (420, 594, 'mm'), (297, 420, 'mm')]
+
+FINAL_SIZES = [
+    (3.5, 2, 'inch'), (4, 6, 'inch'), (8.5, 11, 'inch'), (5.5, 8.5, 'inch'),
+    (8.5, 13, 'inch'), (210, 297, 'mm'), (148, 210, 'mm'), (105, 148, 'mm'), 
+    (99, 210, 'mm'), (55, 85, 'mm'), (35, 20, 'mm')]
+
+# Sheet-fed presses as (name, min width, max width, min length, max length, uom)
+SHEET_FED_PRESSES = [
+    ('GTO 52', 7, 14, 10, 20, 'inch'),
+    ('SM 74', 10, 20, 14, 29, 'inch'),
+    ('Digital SRA3', 100, 330, 148, 488, 'mm')]
+
+# Roll-fed presses as (name, min width, max width, 
+# min breakpoint length, max breakpoint length, uom)
+ROLL_FED_PRESSES = [
+    ('Latex 48', 25, 48, 48, 150, 'inch'),
+    ('Solvent 64', 30, 64, 48, 200, 'inch')]
+
+# Rolls as (width, length, uom) and the final sizes printed on them
+ROLLS = [(48, 2000, 'inch'), (60, 2000, 'inch')]
+ROLL_FINAL_SIZES = [(3, 3, 'inch'), (24, 36, 'inch'), (18, 24, 'inch'), (4, 6, 'inch')]
+ROLL_QUANTITIES = [40, 500, 5000]
@@ -0,0 +1,79 @@
+import time, argparse
+from . import setup
+from .catalogue import PARENT_SHEETS, FINAL_SIZES
+
+
+def _start():
+    pass
+
+
+# Packs every parent sheet and final size pair with rotation, serially and
+# through the layout pool. The pool runs the batch twice against a cold
+# layout cache in this process, the second time reusing what its workers
+# packed the first time.
+def run(workers=2, repeat=3):
+    from core.utils.shapes import Rectangle
+    from core.utils.layoutpool import LayoutPool
+    from core.utils.layoutstore import configure_layout_store
+
+    def _layout(size):
+        return Rectangle.Layout(width=size[0], length=size[1], uom=size[2])
+
+    def _evaluate(tasks):
+        return sum([Rectangle.get_layout(*task).count for task in tasks])
+
+    def _time(func):
+        timings = []
+        for i in range(repeat):
+            Rectangle.layout_cache.clear()
+            start = time.perf_counter()
+            count = func()
+            timings.append(time.perf_counter() - start)
+        return min(timings), count
+
+    configure_layout_store(None)
+    tasks = [(_layout(parent), _layout(final), True)
+        for parent in PARENT_SHEETS for final in FINAL_SIZES]
+
+    pool = LayoutPool(workers)
+    pool.warm(_start, [()] * workers)
+    try:
+        serial_time, serial_count = _time(lambda: _evaluate(tasks))
+
+        Rectangle.layout_cache.clear()
+        start = time.perf_counter()
+        pool.warm(Rectangle.get_layout, tasks)
+        cold_count = _evaluate(tasks)
+        cold_time = time.perf_counter() - start
+
+        def _pooled():
+            pool.warm(Rectangle.get_layout, tasks)
+            return _evaluate(tasks)
+        warm_time, warm_count = _time(_pooled)
+    finally:
+        pool.shutdown()
+
+    return {
+        'tasks': len(tasks), 'workers': workers,
+        'serial_time': serial_time, 'cold_time': cold_time, 'warm_time': warm_time,
+        'counts_match': serial_count == cold_count == warm_count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Layout pool against serial packing')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    setup()
+
+    result = run(args.workers, args.repeat)
+    print('%s tasks, %s workers' % (result['tasks'], result['workers']))
+    print('serial %12.3f ms' % (result['serial_time'] * 1000))
+    print('pool   %12.3f ms (workers cold)' % (result['cold_time'] * 1000))
+    print('pool   %12.3f ms (workers warm), %.1fx serial' % (result['warm_time'] * 1000,
+        result['serial_time'] / max(result['warm_time'], 1e-9)))
+    print('counts match: %s' % result['counts_match'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import time, argparse
+from . import setup
+from .catalogue import PARENT_SHEETS, FINAL_SIZES
+
+
+# Compares the guillotine packer with the default grid and MaxRects race
+# on every parent sheet and final size pair, with rotation
+def run(repeat=5):
+    from core.utils.binpacker import BinPacker
+    from core.utils.shapes import Rectangle
+    from core.utils.geometry import to_um
+
+    def _time(func):
+        start = time.perf_counter()
+        for i in range(repeat):
+            result = func()
+        return (time.perf_counter() - start) / repeat, len(result) if result is not None else 0
+
+    results = []
+    for (parent_width, parent_length, parent_uom) in PARENT_SHEETS:
+        for (child_width, child_length, child_uom) in FINAL_SIZES:
+            sizes = (to_um(parent_width, parent_uom), to_um(parent_length, parent_uom),
+                to_um(child_width, child_uom), to_um(child_length, child_uom))
+            guillotine_time, guillotine_count = _time(
+                lambda: BinPacker.pack_guillotine(*sizes, rotation=True))
+            default_time, default_count = _time(
+                lambda: Rectangle.binpacker(sizes[0], sizes[1], 'um', 
+                    sizes[2], sizes[3], 'um', True))
+            results.append({
+                'parent': '%sx%s%s' % (parent_width, parent_length, parent_uom),
+                'child': '%sx%s%s' % (child_width, child_length, child_uom),
+                'guillotine_count': guillotine_count, 'guillotine_time': guillotine_time,
+                'default_count': default_count, 'default_time': default_time})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Guillotine packing against the MaxRects race')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    setup()
+
+    results = run(args.repeat)
+    print('%-16s %-14s %10s %12s %10s %12s' % ('parent', 'child', 
+        'guillotine', 'ms', 'default', 'ms'))
+    for result in results:
+        print('%-16s %-14s %10s %12.3f %10s %12.3f' % (result['parent'], result['child'],
+            result['guillotine_count'], result['guillotine_time'] * 1000,
+            result['default_count'], result['default_time'] * 1000))
+
+    guillotine_total = sum([x['guillotine_time'] for x in results])
+    default_total = sum([x['default_time'] for x in results])
+    print('total: guillotine %.3f ms, default %.3f ms; more outs in %s, fewer in %s of %s pairs' % (
+        guillotine_total * 1000, default_total * 1000,
+        len([x for x in results if x['guillotine_count'] > x['default_count']]),
+        len([x for x in results if x['guillotine_count'] < x['default_count']]), len(results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import time, json, tracemalloc
+import numpy as np
+from . import catalogue
+
+
+class Benchmark:
+    # A named group of cases. Every case is a label and a function returning
+    # the layout quality of one call as a dict of count and usage.
+    def __init__(self, name, cases):
+        self.name = name
+        self.cases = cases
+
+    class Result:
+        def __init__(self, name, timings, allocations, cases, errors):
+            self.name = name
+            self.timings = timings
+            self.allocations = allocations
+            self.cases = cases
+            self.errors = errors
+
+        @property
+        def latency(self):
+            timings = np.array(self.timings) * 1000 if len(self.timings) > 0 else np.zeros(1)
+            return {
+                'p50': float(np.percentile(timings, 50)),
+                'p90': float(np.percentile(timings, 90)),
+                'p99': float(np.percentile(timings, 99)),
+                'max': float(timings.max()),
+                'mean': float(timings.mean())}
+
+        @property
+        def memory(self):
+            allocations = np.array(self.allocations) / 1024 if len(self.allocations) > 0 \
+                else np.zeros(1)
+            return {
+                'peak_kib_mean': float(allocations.mean()),
+                'peak_kib_max': float(allocations.max())}
+
+        @property
+        def quality(self):
+            counts = [x['count'] for x in self.cases.values()]
+            usages = [x['usage'] for x in self.cases.values()]
+            return {
+                'count': int(sum(counts)),
+                'usage_mean': float(np.mean(usages)) if len(usages) > 0 else 0}
+
+        def to_dict(self):
+            return {
+                'latency_ms': self.latency, 'memory': self.memory,
+                'quality': self.quality, 'errors': self.errors, 'cases': self.cases}
+
+
+def _label(*sizes):
+    return ' '.join(['%sx%s%s' % size for size in sizes])
+
+
+def get_benchmarks():
+    from core.utils.shapes import Rectangle
+    from core.utils.geometry import to_um
+    from estimation.machine.models import SheetFedPressMachine, RollFedPressMachine, \
+        ChildSheet
+
+    def _layout(size):
+        return Rectangle.Layout(width=size[0], length=size[1], uom=size[2])
+
+    def _binpacker(parent, final, rotate):
+        def run():
+            packed = Rectangle.binpacker(parent[0], parent[1], parent[2],
+                final[0], final[1], final[2], rotate)
+            count = len(packed) if packed is not None else 0
+            usage = (count * to_um(final[0], final[2]) * to_um(final[1], final[2])) / \
+                (to_um(parent[0], parent[2]) * to_um(parent[1], parent[2]))
+            return {'count': count, 'usage': round(usage * 100, 2)}
+        return run
+
+    def _get_layout(parent, final, rotate):
+        def run():
+            layout_meta = Rectangle.get_layout(_layout(parent), _layout(final), rotate)
+            return {'count': layout_meta.count, 'usage': layout_meta.usage}
+        return run
+
+    def _sheet_fed(press, parent, final, rotate):
+        name, min_width, max_width, min_length, max_length, uom = press
+        machine = SheetFedPressMachine(name=name, uom=uom,
+            min_sheet_width=min_width, max_sheet_width=max_width,
+            min_sheet_length=min_length, max_sheet_length=max_length)
+        def run():
+            layouts_meta, layout_type = machine.get_layouts_meta(
+                _layout(final), _layout(parent), rotate)
+            return {'count': layouts_meta[0].count * layouts_meta[1].count,
+                'usage': layouts_meta[1].usage}
+        return run
+
+    def _roll_fed(press, roll, final, quantity):
+        name, min_width, max_width, min_length, max_length, uom = press
+        machine = RollFedPressMachine(name=name, uom=uom,
+            min_sheet_width=min_width, max_sheet_width=max_width,
+            min_sheet_breakpoint_length=min_length, max_sheet_breakpoint_length=max_length)
+        final_layout = ChildSheet.Layout(width=final[0], length=final[1], uom=final[2])
+        def run():
+            layouts_meta, layout_type = machine.get_layouts_meta(final_layout,
+                _layout(roll), False, order_quantity=quantity, apply_breakpoint=True)
+            return {'count': layouts_meta[1].count, 'usage': layouts_meta[1].usage}
+        return run
+
+    pairs = [(parent, final, rotate) for parent in catalogue.PARENT_SHEETS
+        for final in catalogue.FINAL_SIZES for rotate in [False, True]]
+
+    return [
+        Benchmark('binpacker', [('%s rotate=%s' % (_label(parent, final), rotate),
+            _binpacker(parent, final, rotate)) for (parent, final, rotate) in pairs]),
+        Benchmark('get_layout', [('%s rotate=%s' % (_label(parent, final), rotate),
+            _get_layout(parent, final, rotate)) for (parent, final, rotate) in pairs]),
+        Benchmark('sheet_fed', [('%s %s rotate=%s' % (press[0], _label(parent, final), rotate),
+                _sheet_fed(press, parent, final, rotate))
+            for press in catalogue.SHEET_FED_PRESSES for (parent, final, rotate) in pairs]),
+        Benchmark('roll_fed', [('%s %s qty=%s' % (press[0], _label(roll, final), quantity),
+                _roll_fed(press, roll, final, quantity))
+            for press in catalogue.ROLL_FED_PRESSES for roll in catalogue.ROLLS
+            for final in catalogue.ROLL_FINAL_SIZES for quantity in catalogue.ROLL_QUANTITIES])]
+
+
+# Every call runs against a cold layout cache and without the layout store,
+# so that the packing itself is measured
+def run_benchmark(benchmark, repeat=5):
+    from core.utils.shapes import Rectangle
+    from core.utils.layoutstore import configure_layout_store
+
+    configure_layout_store(None)
+    timings = []
+    allocations = []
+    cases = {}
+    errors = 0
+
+    for (label, func) in benchmark.cases:
+        try:
+            for i in range(repeat):
+                Rectangle.layout_cache.clear()
+                start = time.perf_counter()
+                quality = func()
+                timings.append(time.perf_counter() - start)
+
+            Rectangle.layout_cache.clear()
+            tracemalloc.start()
+            func()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            allocations.append(peak)
+            cases[label] = quality
+        except ValueError:
+            # Sizes a machine cannot take are part of the catalogue
+            errors += 1
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    return Benchmark.Result(benchmark.name, timings, allocations, cases, errors)
+
+
+def run(names=None, repeat=5):
+    return [run_benchmark(benchmark, repeat) for benchmark in get_benchmarks()
+        if names is None or len(names) == 0 or benchmark.name in names]
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump({result.name: result.to_dict() for result in results}, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Compares results with a saved baseline. Returns a list of regressions:
+# latency or peak memory above the baseline by more than the threshold,
+# and cases that now get fewer outs.
+def compare(results, baseline, threshold=0.1):
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        current = result.to_dict()
+        for metric in ['p50', 'p90']:
+            before, after = base['latency_ms'][metric], current['latency_ms'][metric]
+            if before > 0 and (after - before) / before > threshold:
+                regressions.append('%s latency %s %.3fms -> %.3fms' %
+                    (result.name, metric, before, after))
+        before, after = base['memory']['peak_kib_mean'], current['memory']['peak_kib_mean']
+        if before > 0 and (after - before) / before > threshold:
+            regressions.append('%s memory %.1fKiB -> %.1fKiB' % (result.name, before, after))
+        for label, quality in current['cases'].items():
+            base_quality = base['cases'].get(label)
+            if base_quality is not None and quality['count'] < base_quality['count']:
+                regressions.append('%s %s count %s -> %s' %
+                    (result.name, label, base_quality['count'], quality['count']))
+    return regressions
@@ -1,8 +1,59 @@
-import math
+import math, bisect
+import numpy as np
 from rectpack import newPacker, MaxRectsBl, MaxRectsBaf
+from rectpack.geometry import Rectangle as PackedRect
+from .cutplanner import CutPlanner
+
+
+class GridBin:
+    # Packed bin produced by the closed-form grid engine. Mimics the parts
+    # of the rectpack bin interface consumed by Rectangle.get_layout.
+    def __init__(self, width, height, rects):
+        self.width = width
+        self.height = height
+        self.rects = rects
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __iter__(self):
+        return iter(self.rects)
+
+    def __getitem__(self, key):
+        return self.rects[key]
+
+    def rect_list(self):
+        return [(r.x, r.y, r.width, r.height, r.rid) for r in self.rects]
 
 
 class BinPacker:
+    # Guillotine packing falls back to the closed-form grids when a side has
+    # more raster points, or the sides have more raster point pairs than these
+    GUILLOTINE_RASTER_LIMIT = 400
+    GUILLOTINE_STATE_LIMIT = 2500
+
+    # Algorithms raced by pack_rectangles, None being the rectpack default
+    ALGORITHMS = [MaxRectsBaf, MaxRectsBl, None]
+
+    class Block:
+        # A uniform grid of cols x rows rectangles of size width x height
+        # whose bottom-left corner is placed at (x, y)
+        def __init__(self, x, y, cols, rows, width, height):
+            self.x = x
+            self.y = y
+            self.cols = cols
+            self.rows = rows
+            self.width = width
+            self.height = height
+
+        @property
+        def count(self):
+            return self.cols * self.rows
+
+        def get_rects(self):
+            return [PackedRect(self.x + (col * self.width),
+                    self.y + (row * self.height), self.width, self.height)
+                for row in range(self.rows) for col in range(self.cols)]
 
     @classmethod
     def estimate_rectangles(cls, parent_width, parent_length, child_width, child_length):
@@ -11,8 +62,392 @@ class BinPacker:
         if parent_area == 0 or child_area == 0:
             return 0
 
-        return math.floor(parent_area / child_area)
+        return math.floor(parent_area // child_area)
+
+    # Sizes are expected in integer micrometres so that the division is exact
+    @classmethod
+    def fit(cls, length, size):
+        if size <= 0 or length <= 0:
+            return 0
+        return int(length // size)
+
+    @classmethod
+    def get_grid_plans(cls, bin_width, bin_height, rect_width, rect_height, rotation=False):
+        fit = cls.fit
+
+        def _grid(width, height):
+            cols = fit(bin_width, width)
+            rows = fit(bin_height, height)
+            return [BinPacker.Block(0, 0, cols, rows, width, height)]
+
+        # Left block of i columns in one orientation,
+        # right block fills the remaining width in the other orientation
+        def _vertical_splits(width, height):
+            plans = []
+            left_rows = fit(bin_height, height)
+            right_rows = fit(bin_height, width)
+            for i in range(1, fit(bin_width, width) + 1):
+                right_cols = fit(bin_width - (i * width), height)
+                if right_cols > 0 and right_rows > 0:
+                    plans.append([
+                        BinPacker.Block(0, 0, i, left_rows, width, height),
+                        BinPacker.Block(i * width, 0, right_cols, right_rows, height, width)])
+            return plans
+
+        # Bottom block of j rows in one orientation,
+        # top block fills the remaining height in the other orientation
+        def _horizontal_splits(width, height):
+            plans = []
+            bottom_cols = fit(bin_width, width)
+            top_cols = fit(bin_width, height)
+            for j in range(1, fit(bin_height, height) + 1):
+                top_rows = fit(bin_height - (j * height), width)
+                if top_rows > 0 and top_cols > 0:
+                    plans.append([
+                        BinPacker.Block(0, 0, bottom_cols, j, width, height),
+                        BinPacker.Block(0, j * height, top_cols, top_rows, height, width)])
+            return plans
+
+        plans = [_grid(rect_width, rect_height)]
+        if rotation and rect_width != rect_height:
+            plans.append(_grid(rect_height, rect_width))
+            for (width, height) in [(rect_width, rect_height), (rect_height, rect_width)]:
+                plans += _vertical_splits(width, height)
+                plans += _horizontal_splits(width, height)
+
+        return plans
+
+    # Closed-form packing of identical rectangles using straight, rotated and
+    # two-block mixed grids. Returns the packed bin (None if nothing fits) and
+    # whether the count is proven to be the maximum. Without rotation the straight
+    # grid is always optimal; with rotation it is only proven when it reaches
+    # the area bound or the requested number of rectangles.
+    @classmethod
+    def pack_grid(cls, bin_width, bin_height, rect_width, rect_height,
+            rotation=False, count=None):
+        plans = cls.get_grid_plans(bin_width, bin_height,
+            rect_width, rect_height, rotation)
+        best_plan = None
+        best_key = (0, 0)
+
+        # On equal counts, prefer the plan whose dominant block sits at the origin
+        for plan in plans:
+            plan_key = (sum([block.count for block in plan]), plan[0].count)
+            if plan_key > best_key:
+                best_plan = plan
+                best_key = plan_key
+        best_count = best_key[0]
+
+        upper_bound = cls.estimate_rectangles(bin_width, bin_height,
+            rect_width, rect_height)
+        target = upper_bound if count is None else min(count, upper_bound)
+        is_optimal = not rotation or best_count >= target
+
+        if best_plan is None or best_count == 0:
+            return None, is_optimal
+
+        rects = []
+        for block in best_plan:
+            rects += block.get_rects()
+        rects.sort(key=lambda r: (r.y, r.x))
+
+        if count is not None:
+            rects = rects[:count]
+
+        packed_bin = GridBin(bin_width, bin_height, rects) if len(rects) > 0 else None
+        return packed_bin, is_optimal
+
+    # Left block of straight columns next to strips of staggered pinwheels,
+    # with the strips running along either side of the bin. A strip is as wide
+    # as both sides of the rect and holds four rects, two of them rotated, in
+    # every width plus height of its length; what is left of the width is
+    # filled with a grid. These layouts are not guillotine-cuttable, and
+    # rectpack rarely finds them in integer sizes. Returns the packed bin
+    # (None if no strip fits).
+    @classmethod
+    def pack_staggered(cls, bin_width, bin_height, rect_width, rect_height, count=None):
+        fit = cls.fit
+
+        def _strip(x0, length, width, height):
+            period = width + height
+            pieces = [(0, 0, width, height), (width, 0, height, width),
+                (0, height, height, width), (height, width, width, height)]
+            return [PackedRect(x0 + x, (i * period) + y, w, h)
+                for i in range(fit(length, period) + 1)
+                for (x, y, w, h) in pieces if (i * period) + y + h <= length]
+
+        def _plans(bin_width, bin_height, width, height):
+            best = []
+            strip_width = width + height
+            for (a, b) in [(width, height), (height, width)]:
+                for i in range(fit(bin_width, a) + 1):
+                    rest = bin_width - (i * a)
+                    strips = fit(rest, strip_width)
+                    if strips == 0:
+                        break
+                    rects = BinPacker.Block(0, 0, i, fit(bin_height, b), a, b).get_rects()
+                    for j in range(strips):
+                        rects += _strip((i * a) + (j * strip_width), bin_height, width, height)
+                    rest -= strips * strip_width
+                    blocks = [BinPacker.Block(bin_width - rest, 0, fit(rest, w), 
+                        fit(bin_height, h), w, h) for (w, h) in [(a, b), (b, a)]]
+                    rects += max(blocks, key=lambda block: block.count).get_rects()
+                    if len(rects) > len(best):
+                        best = rects
+            return best
+
+        rects = _plans(bin_width, bin_height, rect_width, rect_height)
+        transposed = [PackedRect(r.y, r.x, r.height, r.width) for r in 
+            _plans(bin_height, bin_width, rect_height, rect_width)]
+        if len(transposed) > len(rects):
+            rects = transposed
+
+        rects.sort(key=lambda r: (r.y, r.x))
+        if count is not None:
+            rects = rects[:count]
+
+        return GridBin(bin_width, bin_height, rects) if len(rects) > 0 else None
 
+    # Sizes along a side of the given length that are sums of piece sizes
+    @classmethod
+    def get_raster_points(cls, length, sizes, limit=None):
+        points = {0}
+        frontier = [0]
+        while len(frontier) > 0:
+            point = frontier.pop()
+            for size in sizes:
+                next_point = point + size
+                if size > 0 and next_point <= length and next_point not in points:
+                    points.add(next_point)
+                    frontier.append(next_point)
+                    if limit is not None and len(points) > limit:
+                        return None
+        return sorted(points)
+
+    # Raster points of a side that can be the remainder after cutting off 
+    # a raster point; these are enough for the guillotine recursion
+    @classmethod
+    def get_reduced_raster_points(cls, length, sizes, limit=None):
+        points = cls.get_raster_points(length, sizes, limit)
+        if points is None:
+            return None
+        return sorted({points[bisect.bisect_right(points, length - point) - 1]
+            for point in points})
+
+    # Guillotine-only packing of identical rectangles. Solves the recursion over
+    # reduced raster points top-down: every region is either filled with a
+    # straight or rotated grid, or cut in two at a raster point. Regions are
+    # memoized and a cut is skipped when the area bounds of its two sides cannot
+    # beat the best found so far. Returns the packed bin (None if nothing fits);
+    # every layout it returns can be produced with guillotine cuts.
+    @classmethod
+    def pack_guillotine(cls, bin_width, bin_height, rect_width, rect_height,
+            rotation=False, count=None):
+        # The grids and two-block plans are guillotine-cuttable,
+        # and optimal without rotation
+        grid, is_optimal = cls.pack_grid(bin_width, bin_height, 
+            rect_width, rect_height, rotation, count)
+        if is_optimal:
+            return grid
+
+        sizes = (rect_width, rect_height)
+        xs = cls.get_reduced_raster_points(bin_width, sizes, cls.GUILLOTINE_RASTER_LIMIT)
+        ys = cls.get_reduced_raster_points(bin_height, sizes, cls.GUILLOTINE_RASTER_LIMIT)
+        if xs is None or ys is None or len(xs) * len(ys) > cls.GUILLOTINE_STATE_LIMIT:
+            return grid
+
+        fit = cls.fit
+        rect_area = rect_width * rect_height
+        memo = {}
+
+        def _floor(points, value):
+            return points[bisect.bisect_right(points, value) - 1]
+
+        def _solve(x, y):
+            key = (x, y)
+            if key in memo:
+                return memo[key]
+            straight = fit(x, rect_width) * fit(y, rect_height)
+            rotated = fit(x, rect_height) * fit(y, rect_width)
+            best, choice = (straight, ('grid', False)) if straight >= rotated \
+                else (rotated, ('grid', True))
+            bound = (x * y) // rect_area
+
+            for (size, other, points, axis) in [(x, y, xs, 'x'), (y, x, ys, 'y')]:
+                for point in points[1:bisect.bisect_right(points, size // 2)]:
+                    if best >= bound:
+                        break
+                    rest = _floor(points, size - point)
+                    if ((point * other) // rect_area) + ((rest * other) // rect_area) <= best:
+                        continue
+                    first = _solve(point, y)[0] if axis == 'x' else _solve(x, point)[0]
+                    second = _solve(rest, y)[0] if axis == 'x' else _solve(x, rest)[0]
+                    if first + second > best:
+                        best, choice = first + second, (axis, point, rest)
+
+            memo[key] = (best, choice)
+            return memo[key]
+
+        def _get_rects(x, y, x0, y0):
+            best, choice = _solve(x, y)
+            if best == 0:
+                return []
+            if choice[0] == 'grid':
+                width, height = (rect_height, rect_width) if choice[1] else (rect_width, rect_height)
+                return BinPacker.Block(x0, y0, fit(x, width), fit(y, height), 
+                    width, height).get_rects()
+            axis, point, rest = choice
+            if axis == 'x':
+                return _get_rects(point, y, x0, y0) + _get_rects(rest, y, x0 + point, y0)
+            return _get_rects(x, point, x0, y0) + _get_rects(x, rest, x0, y0 + point)
+
+        best, choice = _solve(xs[-1], ys[-1])
+        if grid is not None and len(grid) >= best:
+            return grid
+
+        rects = _get_rects(xs[-1], ys[-1], 0, 0)
+        rects.sort(key=lambda r: (r.y, r.x))
+        if count is not None:
+            rects = rects[:count]
+
+        return GridBin(bin_width, bin_height, rects) if len(rects) > 0 else None
+
+    # Vectorized closed-form evaluation of many bin and rect pairs at once.
+    # Sizes are integer micrometres and are broadcast against each other.
+    # Uses the same straight, rotated and two-block grids as pack_grid and
+    # returns arrays of counts, rotated counts, cut counts (those CutPlanner
+    # plans for the same layout), usage and wastage (as fractions) of the best
+    # plan of every pair.
+    @classmethod
+    def evaluate_batch(cls, bin_widths, bin_heights, rect_widths, rect_heights,
+            rotation=False):
+        W, H, w, h = np.broadcast_arrays(*[np.asarray(x, dtype=np.int64)
+            for x in (bin_widths, bin_heights, rect_widths, rect_heights)])
+
+        def _fit(length, size):
+            return np.where((length > 0) & (size > 0), length // np.maximum(size, 1), 0)
+
+        def _ceil(a, b):
+            return -(-a // np.maximum(b, 1))
+
+        # Cuts between the columns and rows of a block, plus the
+        # trim of any leftover edge within the region it occupies
+        def _block_cuts(cols, rows, width, height, region_width, region_height):
+            cuts = np.maximum(cols - 1, 0) + (cols * width < region_width) + \
+                np.maximum(rows - 1, 0) + (rows * height < region_height)
+            return np.where((cols > 0) & (rows > 0), cuts, 0)
+
+        # Cuts CutPlanner plans for a left block of cols x rows rects of
+        # width x height at the origin, and a right block of other_cols x 
+        # other_rows rects next to it, both standing on the bottom edge. 
+        # Cutting the columns first, the columns of each block are stacked.
+        # Cutting the rows first, the slabs between the heights where both
+        # blocks have a row boundary are cut; slabs repeat every common
+        # multiple of the row heights, then come the slab where the shorter
+        # block ends and the single rows of the taller block.
+        def _two_block_cuts(cols, rows, width, height, other_cols, other_rows, 
+                other_width, other_height, region_width, region_height):
+            trim = (cols * width + other_cols * other_width < region_width)
+            both_cuts = cols + other_cols - 1 + trim
+            left_cuts, right_cuts = cols, other_cols + trim
+            left_height, right_height = rows * height, other_rows * other_height
+            is_stacked = (width == other_width) & (height == other_height) & \
+                (rows == other_rows)
+            column_cuts = np.where(rows > 0, rows - 1 + (left_height < region_height), 0) + \
+                np.where(is_stacked, 0, other_rows - 1 + (right_height < region_height))
+            by_columns = np.where(rows > 0, both_cuts, right_cuts) + column_cuts
+
+            period = np.lcm(np.maximum(height, 1), np.maximum(other_height, 1))
+            is_left_taller = left_height >= right_height
+            low = np.minimum(left_height, right_height)
+            high = np.maximum(left_height, right_height)
+            low_size = np.where(is_left_taller, other_height, height)
+            high_size = np.where(is_left_taller, height, other_height)
+            high_rows = np.where(is_left_taller, rows, other_rows)
+            periods = low // period
+            first_high = _ceil(low, high_size)
+            slab = periods * period
+            step = first_high * high_size
+            by_rows = (low - 1) // period + (high_rows - first_high) + (high < region_height) + \
+                np.where(periods > 0, both_cuts + period // np.maximum(height, 1) - 1 + 
+                    period // np.maximum(other_height, 1) - 1, 0) + \
+                np.where(low % period != 0, both_cuts + (low - slab) // np.maximum(low_size, 1) 
+                    - 1 + (low < step) + (step - slab) // np.maximum(high_size, 1) - 1, 0) + \
+                np.where(high_rows > first_high, 
+                    np.where(is_left_taller, left_cuts, right_cuts), 0)
+            # Without a left block, the right block is a plain grid
+            by_rows = np.where(rows > 0, by_rows, 
+                other_rows - 1 + (right_height < region_height) + right_cuts)
+            return np.minimum(by_columns, by_rows)
+
+        plans = []
+        cols, rows = _fit(W, w), _fit(H, h)
+        plans.append((cols * rows, cols * rows, np.zeros_like(W), 
+            _block_cuts(cols, rows, w, h, W, H)))
+
+        if rotation:
+            cols, rows = _fit(W, h), _fit(H, w)
+            plans.append((cols * rows, cols * rows, cols * rows,
+                _block_cuts(cols, rows, h, w, W, H)))
+
+            for (a, b, is_turned) in [(w, h, False), (h, w, True)]:
+                # Left block of i columns, right block rotated in the remaining width
+                max_cols = _fit(W, a)
+                left_rows, right_rows = _fit(H, b), _fit(H, a)
+                for i in range(1, int(max_cols.max(initial=0)) + 1):
+                    right_cols = _fit(W - (i * a), b)
+                    valid = (i <= max_cols) & (right_cols > 0) & (right_rows > 0)
+                    left, right = i * left_rows, right_cols * right_rows
+                    cuts = _two_block_cuts(i, left_rows, a, b, right_cols, right_rows, 
+                        b, a, W, H)
+                    plans.append((np.where(valid, left + right, 0), np.where(valid, left, 0),
+                        np.where(valid, left if is_turned else right, 0), cuts))
+
+                # Bottom block of j rows, top block rotated in the remaining height
+                max_rows = _fit(H, b)
+                bottom_cols, top_cols = _fit(W, a), _fit(W, b)
+                for j in range(1, int(max_rows.max(initial=0)) + 1):
+                    top_rows = _fit(H - (j * b), a)
+                    valid = (j <= max_rows) & (top_rows > 0) & (top_cols > 0)
+                    bottom, top = bottom_cols * j, top_cols * top_rows
+                    # The same as a left and right block with the axes swapped
+                    cuts = _two_block_cuts(j, bottom_cols, b, a, top_rows, top_cols, 
+                        a, b, H, W)
+                    plans.append((np.where(valid, bottom + top, 0), np.where(valid, bottom, 0),
+                        np.where(valid, bottom if is_turned else top, 0), cuts))
+
+        totals, firsts, rotated, cuts = [np.stack(x) for x in zip(*plans)]
+
+        # On equal counts, prefer the plan whose dominant block sits at the origin
+        score = (totals * (firsts.max(initial=0) + 1)) + firsts
+        best = np.argmax(score, axis=0)[np.newaxis]
+        count = np.take_along_axis(totals, best, 0)[0]
+        bin_area = W * H
+        usage = np.where(bin_area > 0, (count * w * h) / np.maximum(bin_area, 1), 0)
+
+        return {
+            'count': count,
+            'rotated': np.take_along_axis(rotated, best, 0)[0],
+            'cut_count': np.where(count > 0, np.take_along_axis(cuts, best, 0)[0], 0),
+            'usage': usage,
+            'wastage': 1 - usage
+        }
+
+    # Most rectangles that can fit in the bins by area alone
+    @classmethod
+    def get_area_bound(cls, rectangles, bins):
+        bin_area = sum([b[0] * b[1] for b in bins])
+        bound = 0
+        for area in sorted([r[0] * r[1] for r in rectangles]):
+            bin_area -= area
+            if bin_area < 0:
+                break
+            bound += 1
+        return bound
+
+    # Races the algorithms in a fixed order and stops as soon as one packs
+    # every rectangle the area bound allows. On equal counts the pack needing
+    # the fewest cuts wins, then the earlier algorithm.
     @classmethod
     def pack_rectangles(cls, rectangles, bins, rotation=False, algorithm=None):
         def _pack(algorithm=None):
@@ -29,14 +464,34 @@ class BinPacker:
             packer.pack()
 
             return packer
-        
-        algorithms = [MaxRectsBaf, MaxRectsBl, None]
+
+        def _cut_count(packer):
+            return sum([CutPlanner.count(b.width, b.height, 
+                [(r.x, r.y, r.width, r.height) for r in b]) for b in packer])
+
+        if algorithm is not None:
+            return _pack(algorithm)
+
+        upper_bound = cls.get_area_bound(rectangles, bins)
         most_output = None
+        most_output_count = -1
+        most_output_cuts = None
 
-        for algo in algorithms:
-            packer = _pack(algo) if algo is not None else _pack()
+        for algo in cls.ALGORITHMS:
+            packer = _pack(algo)
             packer_rect_count = len(packer.rect_list())
-            if most_output is None or packer_rect_count > len(most_output.rect_list()):
+            if packer_rect_count > most_output_count:
                 most_output = packer
+                most_output_count = packer_rect_count
+                most_output_cuts = None
+            elif packer_rect_count == most_output_count:
+                if most_output_cuts is None:
+                    most_output_cuts = _cut_count(most_output)
+                packer_cuts = _cut_count(packer)
+                if packer_cuts < most_output_cuts:
+                    most_output = packer
+                    most_output_cuts = packer_cuts
+            if most_output_count >= upper_bound:
+                break
 
         return most_output
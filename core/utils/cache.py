@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Thread-safe, size-bounded least-recently-used cache
+    # that keeps hit, miss and eviction counters. Every hit and put
+    # ticks the clock, which stamps the entry it touched.
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clock = 0
+        self._entries = OrderedDict()
+        self._stamps = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.clock += 1
+                self._stamps[key] = self.clock
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self.clock += 1
+            self._stamps[key] = self.clock
+            while len(self._entries) > self.maxsize:
+                evicted = self._entries.popitem(last=False)[0]
+                self._stamps.pop(evicted, None)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self._stamps.pop(key, None)
+            return self._entries.pop(key, default)
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+    # Entries hit or put after the clock read the given value
+    def items_since(self, clock):
+        with self._lock:
+            return [(key, value) for (key, value) in self._entries.items()
+                if self._stamps[key] > clock]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stamps.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
@@ -0,0 +1,53 @@
+import numpy as np
+from decimal import Decimal
+
+
+class CostingKernel:
+    # Costing of every order quantity of an estimate level in one array pass.
+    # Counts are rounded up on integers, so that they match the scalar costing
+    # exactly; durations stay unrounded floats until they are handed back.
+
+    # Stock quantities needed for the material quantities when every stock
+    # item yields output_per_item of them
+    @classmethod
+    def get_stock_quantities(cls, material_quantities, output_per_item=1):
+        totals = np.asarray(material_quantities, dtype=np.int64)
+        outs = max(int(output_per_item), 1)
+        return -(-totals // outs)
+
+    # Spoilage rates are percentages with two decimal places; the spoilage
+    # of a stock quantity is rounded up on integers, whether it is worked out
+    # for one quantity or for all of them
+    @classmethod
+    def get_spoilage_quantities(cls, stock_quantities, spoilage_rate=0):
+        rate = int(Decimal(str(spoilage_rate)) * 100)
+        return -(-np.asarray(stock_quantities, dtype=np.int64) * rate // 10000)
+
+    @classmethod
+    def get_spoilage_quantity(cls, stock_quantity, spoilage_rate=0):
+        return int(cls.get_spoilage_quantities([stock_quantity], spoilage_rate)[0])
+
+    # Hours to process the measures at the speed, with the set up and tear down
+    # hours of every day worked, before rounding
+    @classmethod
+    def get_durations(cls, measures, speed, set_up=None, tear_down=None,
+            contingency=0, hours_per_day=10):
+        durations = np.asarray(measures, dtype=float) / speed * ((contingency / 100) + 1)
+        if set_up is not None and tear_down is not None:
+            misc_hours = set_up + tear_down
+            days = np.ceil(durations / (hours_per_day - misc_hours))
+            durations = durations + (misc_hours * days)
+        return durations
+
+    # Costs of an expense rate charged on every quantity, the hours or
+    # measures of hour and measure based expenses
+    @classmethod
+    def get_costs(cls, rate, quantities):
+        return float(rate) * np.asarray(quantities, dtype=float)
+
+    # Rounded as the builtin round does, on the exact binary value; numpy
+    # rounds the value scaled by a power of ten, which may round half cents
+    # the other way
+    @classmethod
+    def round_durations(cls, durations, digits=2):
+        return np.array([round(float(duration), digits) for duration in durations])
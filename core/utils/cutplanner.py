@@ -0,0 +1,211 @@
+import numpy as np
+
+
+class CutPlanner:
+    # Derives the guillotine cut tree of a packed layout. Every region is split
+    # by all of its through-cuts along one axis at once; the pieces that come out
+    # identical are stacked and cut together, so their cuts are only counted once.
+    # Separating cuts are found with a sort and sweep, and identical pieces are
+    # planned once through a memo, which keeps the planner at O(n log n) for the
+    # grid-like layouts produced by the packer.
+
+    class Cut:
+        __slots__ = ('axis', 'position', 'start', 'end', 'stack')
+        # Cut along x = position from y = start to y = end,
+        # or along y = position from x = start to x = end
+        X = 'x'
+        Y = 'y'
+
+        def __init__(self, axis, position, start, end, stack=1):
+            self.axis = axis
+            self.position = position
+            self.start = start
+            self.end = end
+            self.stack = stack
+
+        def translate(self, dx, dy, stack=1):
+            offset, cross_offset = (dx, dy) if self.axis == CutPlanner.Cut.X else (dy, dx)
+            return CutPlanner.Cut(self.axis, self.position + offset,
+                self.start + cross_offset, self.end + cross_offset, self.stack * stack)
+
+        def to_list(self):
+            return [self.axis, self.position, self.start, self.end, self.stack]
+
+        def __repr__(self):
+            return 'Cut(%s=%s, %s..%s, x%s)' % (self.axis, self.position,
+                self.start, self.end, self.stack)
+
+    class Plan:
+        def __init__(self, count=0, cuts=None, is_guillotine=True):
+            self.count = count
+            self.cuts = cuts if cuts is not None else []
+            self.is_guillotine = is_guillotine
+
+    # rects are (x, y, width, height) tuples within a bin whose corner is at the origin
+    @classmethod
+    def plan(cls, bin_width, bin_height, rects):
+        memo = {}
+        rects = [tuple(rect[:4]) for rect in rects]
+        if len(rects) == 0:
+            return CutPlanner.Plan()
+        count, cuts, is_guillotine = cls._plan_region(0, 0, bin_width, bin_height, rects, memo)
+        return CutPlanner.Plan(count, cuts, is_guillotine)
+
+    @classmethod
+    def count(cls, bin_width, bin_height, rects):
+        return cls.plan(bin_width, bin_height, rects).count
+
+    # Plan of a grid of cols x rows identical rects at the origin, in closed form.
+    # Gives the same plan as plan() on the rects of the grid: the through-cuts
+    # along x, then the cuts of one column, stacked over all columns.
+    @classmethod
+    def plan_grid(cls, bin_width, bin_height, rect_width, rect_height, cols, rows):
+        def __get_positions__(size, count, length):
+            positions = [i * size for i in range(1, count)]
+            if count * size < length:
+                positions.append(count * size)
+            return positions
+
+        if cols <= 0 or rows <= 0:
+            return CutPlanner.Plan()
+
+        x_cuts = __get_positions__(rect_width, cols, bin_width)
+        y_cuts = __get_positions__(rect_height, rows, bin_height)
+        if len(x_cuts) > 0:
+            cuts = [CutPlanner.Cut(CutPlanner.Cut.X, position, 0, bin_height)
+                    for position in x_cuts] + \
+                [CutPlanner.Cut(CutPlanner.Cut.Y, position, 0, rect_width, cols)
+                    for position in y_cuts]
+        else:
+            cuts = [CutPlanner.Cut(CutPlanner.Cut.Y, position, 0, bin_width)
+                for position in y_cuts]
+        return CutPlanner.Plan(len(cuts), cuts, True)
+
+    # Cut counts of the first counts rects, row by row, of cols x rows grids,
+    # which is what pack_grid keeps for a rect count, on arrays. Gives the
+    # counts plan() gives: cutting the columns first, the full columns and the
+    # longer ones are stacked; cutting the rows first, the full rows are, and
+    # the last row is cut on its own.
+    @classmethod
+    def count_grids(cls, bin_widths, bin_heights, rect_widths, rect_heights,
+            cols, rows, counts):
+        W, H, w, h, cols, rows, counts = np.broadcast_arrays(*[np.asarray(x, dtype=np.int64)
+            for x in (bin_widths, bin_heights, rect_widths, rect_heights, cols, rows, counts)])
+
+        def __column_cuts__(stack):
+            return np.where(stack > 0, stack - 1 + (stack * h < H), 0)
+
+        counts = np.minimum(counts, cols * rows)
+        full_rows = counts // np.maximum(cols, 1)
+        rest = counts % np.maximum(cols, 1)
+        used_cols = np.where(full_rows > 0, cols, rest)
+        used_rows = full_rows + (rest > 0)
+
+        x_cuts = np.maximum(used_cols - 1, 0) + (used_cols * w < W)
+        y_cuts = np.maximum(used_rows - 1, 0) + (used_rows * h < H)
+        by_columns = x_cuts + np.where(rest > 0, __column_cuts__(full_rows + 1), 0) + \
+            __column_cuts__(full_rows)
+        by_rows = y_cuts + np.where(full_rows > 0, cols - 1 + (cols * w < W), 0) + rest
+        by_columns = np.where(x_cuts > 0, by_columns, by_rows)
+        by_rows = np.where(y_cuts > 0, by_rows, by_columns)
+        return np.where(counts > 0, np.minimum(by_columns, by_rows), 0)
+
+    # Positions along one axis where a cut does not cross any interval,
+    # including the trim after the last interval
+    @classmethod
+    def get_separations(cls, lo, hi, intervals):
+        positions = []
+        reach = lo
+        for (start, end) in sorted(intervals):
+            if start >= reach and start > lo:
+                positions.append(start)
+            reach = max(reach, end)
+        if reach < hi:
+            positions.append(reach)
+        return positions
+
+    @classmethod
+    def _plan_region(cls, x0, y0, width, height, rects, memo, signature=None):
+        if signature is None:
+            signature = (width, height, tuple(sorted(
+                [(x - x0, y - y0, w, h) for (x, y, w, h) in rects])))
+        if signature not in memo:
+            memo[signature] = cls._plan_relative(width, height, signature[2], memo)
+        count, cuts, is_guillotine = memo[signature]
+        return count, [cut.translate(x0, y0) for cut in cuts], is_guillotine
+
+    @classmethod
+    def _plan_relative(cls, width, height, rects, memo):
+        x_cuts = cls.get_separations(0, width, [(x, x + w) for (x, y, w, h) in rects])
+        y_cuts = cls.get_separations(0, height, [(y, y + h) for (x, y, w, h) in rects])
+
+        if len(x_cuts) == 0 and len(y_cuts) == 0:
+            if len(rects) <= 1:
+                return 0, [], True
+            return cls._plan_non_guillotine(width, height, rects)
+
+        options = []
+        if len(x_cuts) > 0:
+            options.append(cls._split(CutPlanner.Cut.X, x_cuts, width, height, rects, memo))
+        if len(y_cuts) > 0:
+            options.append(cls._split(CutPlanner.Cut.Y, y_cuts, width, height, rects, memo))
+        return min(options, key=lambda option: option[0])
+
+    @classmethod
+    def _split(cls, axis, positions, width, height, rects, memo):
+        is_x = axis == CutPlanner.Cut.X
+        length = width if is_x else height
+        cross_length = height if is_x else width
+        bounds = [0] + positions + [length]
+        cuts = [CutPlanner.Cut(axis, position, 0, cross_length) for position in positions]
+        count = len(positions)
+        is_guillotine = True
+
+        # Assign the rects to the pieces between the cuts, sorted by their start
+        pieces = [[] for i in range(len(bounds) - 1)]
+        starts = sorted(rects, key=lambda rect: rect[0] if is_x else rect[1])
+        piece = 0
+        for rect in starts:
+            start = rect[0] if is_x else rect[1]
+            while start >= bounds[piece + 1]:
+                piece += 1
+            pieces[piece].append(rect)
+
+        # Identical pieces are stacked and cut together
+        stacks = {}
+        for i, piece_rects in enumerate(pieces):
+            if len(piece_rects) == 0:
+                continue
+            lo, hi = bounds[i], bounds[i + 1]
+            x0, y0 = (lo, 0) if is_x else (0, lo)
+            piece_width, piece_height = (hi - lo, height) if is_x else (width, hi - lo)
+            signature = (piece_width, piece_height, tuple(sorted(
+                [(x - x0, y - y0, w, h) for (x, y, w, h) in piece_rects])))
+            if signature in stacks:
+                stacks[signature][1] += 1
+            else:
+                stacks[signature] = [(x0, y0, piece_width, piece_height, piece_rects), 1]
+
+        for signature, ((x0, y0, piece_width, piece_height, piece_rects), stack) in stacks.items():
+            piece_count, piece_cuts, piece_is_guillotine = cls._plan_region(
+                x0, y0, piece_width, piece_height, piece_rects, memo, signature)
+            count += piece_count
+            cuts += [cut.translate(0, 0, stack) for cut in piece_cuts]
+            is_guillotine = is_guillotine and piece_is_guillotine
+
+        return count, cuts, is_guillotine
+
+    # Pieces that cannot be separated by a through-cut need partial cuts;
+    # count one cut per distinct inner edge on each axis
+    @classmethod
+    def _plan_non_guillotine(cls, width, height, rects):
+        x_edges = set()
+        y_edges = set()
+        for (x, y, w, h) in rects:
+            x_edges.update([x, x + w])
+            y_edges.update([y, y + h])
+        x_edges = sorted(edge for edge in x_edges if 0 < edge < width)
+        y_edges = sorted(edge for edge in y_edges if 0 < edge < height)
+        cuts = [CutPlanner.Cut(CutPlanner.Cut.X, edge, 0, height) for edge in x_edges] + \
+            [CutPlanner.Cut(CutPlanner.Cut.Y, edge, 0, width) for edge in y_edges]
+        return len(cuts), cuts, False
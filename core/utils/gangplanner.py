@@ -0,0 +1,99 @@
+import math
+from .binpacker import BinPacker
+
+
+class GangPlanner:
+    # Gangs several jobs on one sheet layout that is run for all of them.
+    # A layout holding n copies of a job needs ceil(quantity / n) sheets, so
+    # the run length is set by the job that is worst served. For a run length
+    # r every job needs ceil(quantity / r) copies on the sheet; the shortest
+    # run whose copies still pack is found by bisection, between the bound
+    # given by the sheet area and the copies each job can take alone, and
+    # the run with one copy of every job.
+
+    class Job:
+        # Size in integer micrometres of one copy of the job, the quantity
+        # to produce and the most copies that fit the sheet on their own
+        def __init__(self, width, height, quantity, limit=None):
+            self.width = width
+            self.height = height
+            self.quantity = quantity
+            self.limit = limit
+
+        @property
+        def area(self):
+            return self.width * self.height
+
+    class Plan:
+        def __init__(self, run_length, counts, rects, evaluated=0):
+            self.run_length = run_length
+            # copies of each job on the sheet
+            self.counts = counts
+            # (x, y, width, height, job index, is_rotated) of every copy
+            self.rects = rects
+            self.evaluated = evaluated
+
+    @classmethod
+    def get_demands(cls, jobs, run_length):
+        return [math.ceil(job.quantity / run_length) for job in jobs]
+
+    # Shortest run whose copies fit the sheet by area and by the limits of the jobs
+    @classmethod
+    def get_lower_bound(cls, bin_width, bin_height, jobs):
+        def _fits(run_length):
+            demands = cls.get_demands(jobs, run_length)
+            return sum([demand * job.area for (demand, job) in zip(demands, jobs)]) <= \
+                bin_width * bin_height
+
+        lower = max([math.ceil(job.quantity / job.limit) if job.limit else 1 for job in jobs])
+        upper = max([job.quantity for job in jobs])
+        while lower < upper:
+            middle = (lower + upper) // 2
+            if _fits(middle):
+                upper = middle
+            else:
+                lower = middle + 1
+        return lower
+
+    @classmethod
+    def plan(cls, bin_width, bin_height, jobs, rotation=False):
+        def __pack__(run_length):
+            demands = cls.get_demands(jobs, run_length)
+            rects = [(job.width, job.height, i) for (i, job) in enumerate(jobs)
+                for copy in range(demands[i])]
+            if sum([w * h for (w, h, i) in rects]) > bin_width * bin_height:
+                return None
+            packer = BinPacker.pack_rectangles(rects, [(bin_width, bin_height)], rotation)
+            packed = packer[0] if len(packer) > 0 else []
+            if len(packed) < len(rects):
+                return None
+            return [(rect.x, rect.y, rect.width, rect.height, rect.rid,
+                    (rect.width, rect.height) != (jobs[rect.rid].width, jobs[rect.rid].height))
+                for rect in packed]
+
+        if len(jobs) == 0:
+            return GangPlanner.Plan(0, [], [])
+
+        lower = cls.get_lower_bound(bin_width, bin_height, jobs)
+        upper = max([job.quantity for job in jobs])
+        best = __pack__(upper)
+        evaluated = 1
+        if best is None:
+            raise ValueError('The jobs do not fit together on the sheet.')
+
+        # Runs are bisected as if packing them were monotonic
+        while lower < upper:
+            middle = (lower + upper) // 2
+            rects = __pack__(middle)
+            evaluated += 1
+            if rects is not None:
+                best, upper = rects, middle
+            else:
+                lower = middle + 1
+
+        counts = [0] * len(jobs)
+        for rect in best:
+            counts[rect[4]] += 1
+        run_length = max([math.ceil(job.quantity / count)
+            for (job, count) in zip(jobs, counts)])
+        return GangPlanner.Plan(run_length, counts, best, evaluated)
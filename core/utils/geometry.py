@@ -0,0 +1,35 @@
+from measurement.measures import Distance
+from .measures import Measure
+
+
+# Fixed-point geometry on integer micrometres. Packing and machine layouts
+# compare and convert lengths on these instead of measurement.Distance objects,
+# which keeps comparisons exact; convert back to Distance only at the API boundary.
+
+# Micrometres per unit of each distance unit
+UNIT_FACTORS = {uom: round(Distance(**{uom: 1}).um)
+    for (uom, label) in Measure.UNITS[Measure.DISTANCE]}
+
+
+def to_um(value, uom):
+    if value is None or uom is None:
+        return 0
+    return round(value * UNIT_FACTORS[uom])
+
+
+def from_um(value, uom):
+    return value / UNIT_FACTORS[uom]
+
+
+def convert(value, from_uom, to_uom):
+    if from_uom == to_uom:
+        return value
+    return from_um(to_um(value, from_uom), to_uom)
+
+
+def to_distance(value, uom):
+    return Distance(**{uom: from_um(value, uom)})
+
+
+def area_from_um(value, uom):
+    return value / (UNIT_FACTORS[uom] ** 2)
@@ -0,0 +1,111 @@
+import math
+
+
+class Imposition:
+    # Signature layouts of booklet pages on the press sheet of a machine.
+    # A signature of n pages is printed on both sides of a sheet: sheetwise
+    # with a plate for each side holding n/2 pages, or work-and-turn with one
+    # plate holding all n pages, which is printed on both sides and cut into
+    # two signatures. The page grids of every signature are worked out once per
+    # sheet format; looking up a page size only divides the sheet by them.
+    SHEETWISE = 'sheetwise'
+    WORK_AND_TURN = 'work-and-turn'
+    METHODS = [SHEETWISE, WORK_AND_TURN]
+    PAGES = [4, 8, 16, 32]
+
+    class Signature:
+        # Grid of across x around pages on one plate
+        def __init__(self, pages, method, across, around):
+            self.pages = pages
+            self.method = method
+            self.across = across
+            self.around = around
+
+        @property
+        def plate_count(self):
+            return 2 if self.method == Imposition.SHEETWISE else 1
+
+        # Signatures printed by every copy of the plate grid
+        @property
+        def signatures_per_grid(self):
+            return 2 if self.method == Imposition.WORK_AND_TURN else 1
+
+    class Entry:
+        def __init__(self, signature, count=0, is_rotated=False):
+            self.signature = signature
+            # copies of the plate grid on the sheet
+            self.count = count
+            self.is_rotated = is_rotated
+
+        @property
+        def pages(self):
+            return self.signature.pages
+
+        @property
+        def method(self):
+            return self.signature.method
+
+        @property
+        def plate_count(self):
+            return self.signature.plate_count
+
+        # Signatures per press sheet
+        @property
+        def outs(self):
+            return self.count * self.signature.signatures_per_grid
+
+        def get_sheet_count(self, quantity):
+            return math.ceil(quantity / self.outs) if self.outs > 0 else 0
+
+    class Table:
+        # Signatures of a sheet format, sizes in integer micrometres
+        def __init__(self, width, length):
+            self.width = width
+            self.length = length
+            self.signatures = {(pages, method): Imposition.get_signatures(pages, method)
+                for pages in Imposition.PAGES for method in Imposition.METHODS}
+            self.entries = {}
+
+        # Best entry of a signature for pages of the given size
+        def get(self, page_width, page_length, pages, method=None):
+            method = method or Imposition.SHEETWISE
+            key = (page_width, page_length, pages, method)
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = Imposition.Entry(self.signatures[(pages, method)][0])
+                for signature in self.signatures[(pages, method)]:
+                    width, length = signature.across * page_width, signature.around * page_length
+                    for (is_rotated, (grid_width, grid_length)) in enumerate(
+                            [(width, length), (length, width)]):
+                        count = (self.width // grid_width) * (self.length // grid_length) \
+                            if grid_width > 0 and grid_length > 0 else 0
+                        if count > entry.count:
+                            entry = Imposition.Entry(signature, count, bool(is_rotated))
+                self.entries[key] = entry
+            return entry
+
+        # Signatures making up a booklet, the largest that fit first.
+        # Page counts are rounded up to a multiple of four.
+        def get_booklet(self, page_width, page_length, page_count, method=None):
+            remaining = math.ceil(page_count / 4) * 4
+            entries = []
+            for pages in sorted(Imposition.PAGES, reverse=True):
+                entry = self.get(page_width, page_length, pages, method)
+                while entry.outs > 0 and remaining >= pages:
+                    entries.append(entry)
+                    remaining -= pages
+            if remaining > 0:
+                raise ValueError('The pages do not fit on the press sheet.')
+            return entries
+
+    # Page grids with across and around in powers of two, since each fold halves a side
+    @classmethod
+    def get_signatures(cls, pages, method):
+        pages_per_plate = pages // 2 if method == Imposition.SHEETWISE else pages
+        signatures = []
+        across = 1
+        while across <= pages_per_plate:
+            signatures.append(Imposition.Signature(pages, method,
+                across, pages_per_plate // across))
+            across *= 2
+        return signatures
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+
+class LayoutPool:
+    # Runs layout computations in a pool of worker processes, since packing is
+    # pure Python and threads would only take turns on the GIL. Workers keep
+    # their layout cache between tasks, so layouts packed for an earlier task
+    # are reused, and send back the packing records of every layout a task
+    # used, which are put into the layout cache of this process. The caller then evaluates the results against that single warm
+    # cache, so parallel and serial runs pick the same layouts.
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                    initializer=_init_worker)
+            return self._executor
+
+    # Runs func(*args) for every args in tasks and merges the layouts packed
+    # along the way into the layout cache. Returns the number of merged layouts.
+    # Within a worker, tasks are left to the caller rather than nesting pools.
+    def warm(self, func, tasks):
+        from .shapes import Rectangle
+
+        if _is_worker:
+            return 0
+        futures = [self.executor.submit(_run_task, func, args) for args in tasks]
+        merged = 0
+        for future in futures:
+            for (key, record) in future.result():
+                if key not in Rectangle.layout_cache:
+                    layout_meta = Rectangle.LayoutMeta.from_record(record).freeze()
+                    Rectangle.layout_cache.put(key, layout_meta)
+                    merged += 1
+        return merged
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+# Workers run their tasks serially. The pool and locks inherited from the
+# parent are dropped, since they may have been held while forking.
+def _init_worker():
+    global _layout_pool, _is_worker, _lock
+
+    _layout_pool = None
+    _is_worker = True
+    _lock = threading.Lock()
+
+
+def _run_task(func, args):
+    from .shapes import Rectangle
+
+    clock = Rectangle.layout_cache.clock
+    try:
+        func(*args)
+    except Exception:
+        # Errors, like sizes that do not fit, raise again once evaluated by the caller
+        pass
+    return [(key, layout_meta.to_record()) for (key, layout_meta)
+        in Rectangle.layout_cache.items_since(clock)]
+
+
+_layout_pool = None
+_is_worker = False
+_lock = threading.Lock()
+
+
+# Returns the shared layout pool, sized by LAYOUT_WORKERS or two workers when unset
+def get_layout_pool():
+    global _layout_pool
+    with _lock:
+        if _layout_pool is None:
+            _layout_pool = LayoutPool(getattr(settings, 'LAYOUT_WORKERS', 0) or 2)
+    return _layout_pool
+
+
+# Parallel packing only pays off once the tasks outweigh sending them and their
+# records between processes, so it is on by default with more than one worker
+# and at least LAYOUT_POOL_MIN_TASKS tasks
+def is_parallel(tasks):
+    return getattr(settings, 'LAYOUT_WORKERS', 0) > 1 and \
+        len(tasks) >= getattr(settings, 'LAYOUT_POOL_MIN_TASKS', 8)
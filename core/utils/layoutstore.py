@@ -0,0 +1,151 @@
+import os, json, time, sqlite3, threading
+from django.conf import settings
+
+
+class LayoutStore:
+    # On-disk layout store backed by an SQLite file in WAL mode, so that every
+    # worker process on a node can read and write it concurrently. Entries are
+    # evicted least-recently-used first once max_entries is exceeded.
+    # Storage errors are swallowed: the store is only an optimization.
+    # Reads are kept from writing: access times are written in batches of
+    # touch_batch, and the size is only checked every evict_interval puts,
+    # so the store may run over max_entries by that many entries per process.
+
+    def __init__(self, path, max_entries=100000, timeout=5, touch_batch=64, 
+            evict_interval=100):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.touch_batch = touch_batch
+        self.evict_interval = evict_interval
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # sqlite connections must not cross threads or forked processes
+        pid = os.getpid()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS layouts ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'accessed_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS layouts_accessed_at '
+                'ON layouts (accessed_at)')
+            self._local.connection = connection
+            self._local.pid = pid
+            self._local.touches = {}
+        return connection
+
+    # Access times of the keys read since the last flush
+    @property
+    def touches(self):
+        # a new thread or forked process starts without any
+        connection = self.connection
+        return self._local.touches
+
+    @classmethod
+    def to_key(cls, key):
+        return json.dumps(key, separators=(',', ':'))
+
+    def get(self, key):
+        try:
+            store_key = self.to_key(key)
+            row = self.connection.execute(
+                'SELECT value FROM layouts WHERE key = ?', (store_key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            touches = self.touches
+            touches[store_key] = time.time()
+            if len(touches) >= self.touch_batch:
+                self.flush()
+            self.hits += 1
+            return json.loads(row[0])
+        except sqlite3.Error:
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        try:
+            self.connection.execute('INSERT OR REPLACE INTO layouts '
+                '(key, value, accessed_at) VALUES (?, ?, ?)',
+                (self.to_key(key), json.dumps(value, separators=(',', ':')), time.time()))
+            self.puts += 1
+            if self.puts % self.evict_interval == 0:
+                self._evict()
+        except sqlite3.Error:
+            pass
+
+    # Writes the pending access times
+    def flush(self):
+        try:
+            touches = self.touches
+            if len(touches) > 0:
+                rows = [(accessed_at, store_key) for (store_key, accessed_at) in touches.items()]
+                touches.clear()
+                self.connection.executemany(
+                    'UPDATE layouts SET accessed_at = ? WHERE key = ?', rows)
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            self.touches.clear()
+            self.connection.execute('DELETE FROM layouts')
+        except sqlite3.Error:
+            pass
+
+    def __len__(self):
+        try:
+            return self.connection.execute('SELECT COUNT(*) FROM layouts').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self),
+            'maxsize': self.max_entries
+        }
+
+    def _evict(self):
+        self.flush()
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            cursor = self.connection.execute('DELETE FROM layouts WHERE key IN ('
+                'SELECT key FROM layouts ORDER BY accessed_at, rowid LIMIT ?)', (excess,))
+            self.evictions += cursor.rowcount
+
+
+_layout_store = None
+_is_configured = False
+_lock = threading.Lock()
+
+
+# Returns the shared layout store, or None when LAYOUT_STORE_PATH is not set
+def get_layout_store():
+    global _layout_store, _is_configured
+    if not _is_configured:
+        path = getattr(settings, 'LAYOUT_STORE_PATH', None)
+        max_entries = getattr(settings, 'LAYOUT_STORE_MAX_ENTRIES', 100000)
+        configure_layout_store(path, max_entries)
+    return _layout_store
+
+
+def configure_layout_store(path, max_entries=100000):
+    global _layout_store, _is_configured
+    with _lock:
+        _layout_store = LayoutStore(path, max_entries) if path else None
+        _is_configured = True
+    return _layout_store
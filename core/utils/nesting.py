@@ -0,0 +1,133 @@
+import math
+import numpy as np
+
+
+class RasterNester:
+    # Nests copies of an irregular outline on a sheet using occupancy bitmaps.
+    # Outlines are rasterized conservatively: a cell is set whenever the outline
+    # may touch it, so copies whose bitmaps do not overlap never overlap either.
+    # For every pair of orientations the offsets at which two copies would
+    # overlap are worked out once, by correlating their bitmaps. Placing a copy
+    # then only ORs its forbidden offsets into one map per orientation, and the
+    # next copy goes to the lowest, then leftmost, free position of any of them.
+
+    # Cells along the longer side of the outline, and most cells of a sheet
+    RESOLUTION = 32
+    MAX_CELLS = 4000000
+
+    class Nest:
+        def __init__(self, cell, placements, area):
+            # size of a cell in the units of the outline
+            self.cell = cell
+            # (x, y, angle) of the lower left corner of the bounding box of every copy
+            self.placements = placements
+            self.area = area
+
+        @property
+        def count(self):
+            return len(self.placements)
+
+    @classmethod
+    def get_area(cls, points):
+        xs, ys = np.asarray(points, dtype=float).T
+        return abs(np.dot(xs, np.roll(ys, -1)) - np.dot(ys, np.roll(xs, -1))) / 2
+
+    # Points turned counterclockwise by a multiple of 90 degrees, moved so
+    # that their bounding box starts at the origin
+    @classmethod
+    def rotate_points(cls, points, angle):
+        points = np.asarray(points, dtype=float)
+        for i in range((angle // 90) % 4):
+            points = np.column_stack([-points[:, 1], points[:, 0]])
+        return points - points.min(axis=0)
+
+    # Cells that the outline may touch: those whose centre is inside the outline
+    # or within half a cell diagonal of one of its edges
+    @classmethod
+    def rasterize(cls, points, cell):
+        points = np.asarray(points, dtype=float)
+        width, height = points.max(axis=0)
+        cols, rows = max(math.ceil(width / cell), 1), max(math.ceil(height / cell), 1)
+        cx, cy = np.meshgrid((np.arange(cols) + 0.5) * cell, (np.arange(rows) + 0.5) * cell)
+        cx, cy = cx.ravel()[:, np.newaxis], cy.ravel()[:, np.newaxis]
+        x0, y0 = points[:, 0][np.newaxis], points[:, 1][np.newaxis]
+        x1, y1 = np.roll(x0, -1, axis=1), np.roll(y0, -1, axis=1)
+
+        # Even-odd rule over the edges crossing the horizontal through the centre
+        crosses = ((y0 > cy) != (y1 > cy)) & \
+            (cx < (x1 - x0) * (cy - y0) / np.where(y1 != y0, y1 - y0, 1) + x0)
+        inside = np.count_nonzero(crosses, axis=1) % 2 == 1
+
+        dx, dy = x1 - x0, y1 - y0
+        lengths = np.maximum(dx * dx + dy * dy, 1e-12)
+        t = np.clip(((cx - x0) * dx + (cy - y0) * dy) / lengths, 0, 1)
+        distances = np.hypot(x0 + t * dx - cx, y0 + t * dy - cy).min(axis=1)
+        near = distances <= cell * math.sqrt(2) / 2
+
+        return (inside | near).reshape(rows, cols)
+
+    # Offsets (row, col) of mask_b relative to mask_a at which the two overlap,
+    # as a boolean map shifted so that no offset is negative
+    @classmethod
+    def get_no_fit(cls, mask_a, mask_b):
+        rows = mask_a.shape[0] + mask_b.shape[0] - 1
+        cols = mask_a.shape[1] + mask_b.shape[1] - 1
+        fa = np.fft.rfft2(mask_a.astype(float), (rows, cols))
+        fb = np.fft.rfft2(mask_b[::-1, ::-1].astype(float), (rows, cols))
+        overlap = np.fft.irfft2(fa * fb, (rows, cols)) > 0.5
+        # overlap[i, j] is for mask_b placed at (i - rows_b + 1, j - cols_b + 1)
+        return overlap
+
+    @classmethod
+    def nest(cls, bin_width, bin_height, points, rotation=False, count=None,
+            resolution=None):
+        resolution = resolution or cls.RESOLUTION
+        angles = [0, 180] + ([90, 270] if rotation else [])
+        outlines = [cls.rotate_points(points, angle) for angle in angles]
+        width, height = outlines[0].max(axis=0)
+        area = cls.get_area(points)
+        if width <= 0 or height <= 0 or width > max(bin_width, bin_height) or \
+                height > max(bin_width, bin_height):
+            return RasterNester.Nest(0, [], area)
+
+        cell = max(width, height) / resolution
+        cell = max(cell, math.sqrt(bin_width * bin_height / cls.MAX_CELLS))
+        rows, cols = int(bin_height // cell), int(bin_width // cell)
+        masks = [cls.rasterize(outline, cell) for outline in outlines]
+
+        # Positions where a copy of each orientation stays within the sheet
+        forbidden = []
+        for mask in masks:
+            blocked = np.ones((rows, cols), dtype=bool)
+            if mask.shape[0] <= rows and mask.shape[1] <= cols:
+                blocked[:rows - mask.shape[0] + 1, :cols - mask.shape[1] + 1] = False
+            forbidden.append(blocked)
+        no_fits = [[cls.get_no_fit(masks[b], masks[a]) for b in range(len(masks))]
+            for a in range(len(masks))]
+
+        placements = []
+        while count is None or len(placements) < count:
+            best = None
+            for (a, blocked) in enumerate(forbidden):
+                position = int(np.argmin(blocked.ravel()))
+                if not blocked.flat[position] and (best is None or position < best[1]):
+                    best = (a, position)
+            if best is None:
+                break
+
+            b, position = best
+            row, col = divmod(position, cols)
+            placements.append((col * cell, row * cell, angles[b]))
+
+            # Block the offsets at which any orientation would overlap this copy
+            for a in range(len(masks)):
+                no_fit = no_fits[a][b]
+                top, left = row - masks[a].shape[0] + 1, col - masks[a].shape[1] + 1
+                r0, c0 = max(top, 0), max(left, 0)
+                r1 = min(top + no_fit.shape[0], rows)
+                c1 = min(left + no_fit.shape[1], cols)
+                if r0 < r1 and c0 < c1:
+                    forbidden[a][r0:r1, c0:c1] |= \
+                        no_fit[r0 - top:r1 - top, c0 - left:c1 - left]
+
+        return RasterNester.Nest(cell, placements, area)
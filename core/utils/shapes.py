@@ -1,9 +1,21 @@
-import math
+import math, copy
+from array import array
+from django.conf import settings
 from django.db import models
 from rest_framework import serializers
 from core.utils.measures import Measure, CostingMeasure
 from measurement.measures import Distance, Volume
 from .binpacker import BinPacker
+from .cache import LRUCache
+from .layoutstore import get_layout_store
+from .geometry import to_um, from_um
+from .cutplanner import CutPlanner
+from .nesting import RasterNester
+
+# Format of the layout records kept in the layout store, part of their keys so
+# that records of an older format are never read. Bumped for integer micrometre
+# keys, the layout arrays and the planned cuts.
+LAYOUT_RECORD_VERSION = 5
 
 
 class Shape(models.Model):
@@ -146,6 +158,23 @@ class Rectangle(Shape):
         def __str__(self):
             return '%sx%s %s' % (self.width, self.length, self.uom)
 
+        def __setattr__(self, name, value):
+            if self.__dict__.get('is_frozen', False):
+                raise AttributeError("Cannot set '%s' on a frozen %s" %
+                    (name, type(self).__qualname__))
+            super().__setattr__(name, value)
+
+        # Copies of a frozen layout are mutable again
+        def __copy__(self):
+            clone = type(self).__new__(type(self))
+            clone.__dict__.update(self.__dict__)
+            clone.__dict__.pop('is_frozen', None)
+            return clone
+
+        def freeze(self):
+            self.__dict__['is_frozen'] = True
+            return self
+
         def _to_measurement(self, value):
             m = Distance(inch=0)
             if value is not None and self.uom is not None:
@@ -190,21 +219,80 @@ class Rectangle(Shape):
         def get_pack_size_as_rect(self):
             return self.width, self.length, self.uom
 
+        @property
+        def width_um(self):
+            return to_um(self.width, self.uom)
+
+        @property
+        def length_um(self):
+            return to_um(self.length, self.uom)
+
         def eq(self, layout:'Rectangle.Layout'):
-            return self.width_measurement.mm == layout.width_measurement.mm and \
-                self.length_measurement.mm == layout.length_measurement.mm
+            return self.width_um == layout.width_um and \
+                self.length_um == layout.length_um
 
         def gte(self, layout:'Rectangle.Layout', rotate=False):
-            is_gte = self.width_measurement.mm >= layout.width_measurement.mm and \
-                self.length_measurement.mm >= layout.length_measurement.mm
+            width, length = self.width_um, self.length_um
+            is_gte = width >= layout.width_um and length >= layout.length_um
             if rotate and not is_gte:
-                is_gte = self.width_measurement.mm >= layout.length_measurement.mm and \
-                self.length_measurement.mm >= layout.width_measurement.mm
+                is_gte = width >= layout.length_um and length >= layout.width_um
             return is_gte
     
+    class LayoutSequence:
+        # Read-only sequence of packed layouts kept as parallel arrays. Layout
+        # objects are only created when an item is read, passed through the
+        # transform if there is one, and frozen if the sequence is frozen.
+        def __init__(self, xs=(), ys=(), widths=(), lengths=(), rotations=(), 
+                uom=None, transform=None):
+            self.xs = array('d', xs)
+            self.ys = array('d', ys)
+            self.widths = array('d', widths)
+            self.lengths = array('d', lengths)
+            self.rotations = array('b', rotations)
+            self.uom = uom
+            self.transform = transform
+            self.is_frozen = False
+
+        def __len__(self):
+            return len(self.xs)
+
+        def __iter__(self):
+            for key in range(len(self)):
+                yield self._get(key)
+
+        def __getitem__(self, key):
+            if isinstance(key, slice):
+                return [self._get(i) for i in range(*key.indices(len(self)))]
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError('layout index out of range')
+            return self._get(key)
+
+        def _get(self, key):
+            layout = Rectangle.Layout(key + 1, self.xs[key], self.ys[key], 
+                self.widths[key], self.lengths[key], bool(self.rotations[key]), uom=self.uom)
+            if self.transform is not None:
+                layout = self.transform(layout)
+            return layout.freeze() if self.is_frozen else layout
+
+        # Returns a sequence over the same positions whose items are passed through func
+        def map(self, func):
+            sequence = copy.copy(self)
+            if self.transform is None:
+                sequence.transform = func
+            else:
+                transform = self.transform
+                sequence.transform = lambda layout: func(transform(layout))
+            return sequence
+
+        def freeze(self):
+            self.is_frozen = True
+            return self
+
     class LayoutMeta:
         def __init__(self, bin, rect, layouts, count, usage, wastage, rotate, 
-                name=None, cut_count=0):
+                name=None, cut_count=0, cuts=None):
             self.name = name
             self.bin = bin
             self.rect = rect
@@ -214,11 +302,72 @@ class Rectangle(Shape):
             self.wastage = wastage
             self.rotate = rotate
             self.cut_count = cut_count
+            # sequence of guillotine cuts making up cut_count
+            self.cuts = cuts if cuts is not None else []
 
         def __str__(self):
             return self.name
 
+        def __setattr__(self, name, value):
+            if self.__dict__.get('is_frozen', False):
+                raise AttributeError("Cannot set '%s' on a frozen LayoutMeta" % name)
+            super().__setattr__(name, value)
+
+        @property
+        def fields(self):
+            return {
+                'bin': self.bin, 'rect': self.rect, 'layouts': self.layouts,
+                'count': self.count, 'usage': self.usage, 'wastage': self.wastage,
+                'rotate': self.rotate, 'name': self.name, 'cut_count': self.cut_count,
+                'cuts': self.cuts}
+
+        # Layout meta shared through the layout cache is frozen, together with 
+        # the packed layouts it holds. The bin and rect belong to the caller.
+        def freeze(self):
+            if isinstance(self.layouts, Rectangle.LayoutSequence):
+                layouts = self.layouts.freeze()
+            else:
+                layouts = self.layouts if isinstance(self.layouts, tuple) else tuple(self.layouts)
+                for layout in layouts:
+                    layout.freeze()
+            self.__dict__['layouts'] = layouts
+            self.__dict__['rotate'] = tuple(self.rotate)
+            self.__dict__['cuts'] = tuple(self.cuts)
+            self.__dict__['is_frozen'] = True
+            return self
+
+        # Returns a new layout meta with the given fields replaced,
+        # frozen if this one is frozen
+        def replace(self, **kwargs):
+            fields = self.fields
+            fields.update(kwargs)
+            layout_meta = Rectangle.LayoutMeta(**fields)
+            if self.__dict__.get('is_frozen', False):
+                layout_meta.freeze()
+            return layout_meta
+
+        # Plain representation of the packing result, as kept in the layout store
+        def to_record(self):
+            layouts = self.layouts
+            return {
+                'layouts': {'x': list(layouts.xs), 'y': list(layouts.ys), 
+                    'width': list(layouts.widths), 'length': list(layouts.lengths),
+                    'is_rotated': list(layouts.rotations), 'uom': layouts.uom},
+                'count': self.count, 'usage': self.usage, 'wastage': self.wastage,
+                'rotate': list(self.rotate), 'cut_count': self.cut_count,
+                'cuts': [cut.to_list() for cut in self.cuts]}
+
+        @classmethod
+        def from_record(cls, record):
+            layouts = record['layouts']
+            layouts = Rectangle.LayoutSequence(layouts['x'], layouts['y'], 
+                layouts['width'], layouts['length'], layouts['is_rotated'], layouts['uom'])
+            cuts = [CutPlanner.Cut(*cut) for cut in record.get('cuts', [])]
+            return cls(None, None, layouts, record['count'], record['usage'], 
+                record['wastage'], record['rotate'], None, record['cut_count'], cuts)
+
     costing_measures = [CostingMeasure.AREA, CostingMeasure.PERIMETER, CostingMeasure.QUANTITY]
+    layout_cache = LRUCache(getattr(settings, 'LAYOUT_CACHE_SIZE', 2048))
     length_value = models.FloatField(null=False, blank=False)
     width_value = models.FloatField(null=False, blank=False)
     size_uom = models.CharField(max_length=30, null=False, blank=False,
@@ -288,92 +437,183 @@ class Rectangle(Shape):
             'width_value': self.width_value,
             'size_uom': self.size_uom}
 
+    # Layout cache key made of the packing sizes in integer micrometres, so
+    # float noise does not split entries. Units are kept since the packed
+    # layouts are expressed in them.
+    @classmethod
+    def get_layout_key(cls, parent_layout, child_layout, rotate=False, 
+            childCount=None, childLayoutLimit=None, guillotine=False):
+        parent_width, parent_length, parent_uom = parent_layout.get_pack_size_as_bin()
+        child_width, child_length, child_uom = child_layout.get_pack_size_as_rect()
+        return (to_um(parent_width, parent_uom), to_um(parent_length, parent_uom), 
+            parent_uom, to_um(child_width, child_uom), to_um(child_length, child_uom), 
+            child_uom, bool(rotate), childCount, childLayoutLimit, bool(guillotine))
+
     # Returns the following:
     # layouts, count, usage, wastage, indices of rotated rectangles
+    # Results are shared through the layout cache and are therefore frozen;
+    # use LayoutMeta.replace to derive a modified copy. On a cache miss the
+    # shared on-disk layout store is checked before packing, if configured.
+    # With guillotine, only layouts a guillotine cutter can produce are packed.
     @classmethod
     def get_layout(cls, parent_layout, child_layout, rotate=False, name=None, 
-            childCount=None, childLayoutLimit=None):
+            childCount=None, childLayoutLimit=None, guillotine=False):
+        # Irregular outlines are nested instead of packed
+        if isinstance(child_layout, Polygon.Layout) and len(child_layout.points) > 0:
+            return Polygon.get_layout(parent_layout, child_layout, rotate, name, 
+                childCount, childLayoutLimit)
+
+        key = cls.get_layout_key(parent_layout, child_layout, rotate, 
+            childCount, childLayoutLimit, guillotine)
+        layout_meta = cls.layout_cache.get(key)
+
+        if layout_meta is None:
+            layout_store = get_layout_store()
+            store_key = (LAYOUT_RECORD_VERSION,) + key
+            record = layout_store.get(store_key) if layout_store is not None else None
+            if record is not None:
+                try:
+                    layout_meta = Rectangle.LayoutMeta.from_record(record)
+                except (KeyError, TypeError, ValueError):
+                    # Records that cannot be read are packed again and replaced
+                    layout_meta = None
+            if layout_meta is None:
+                layout_meta = cls._compute_layout(parent_layout, child_layout, rotate,
+                    childCount, childLayoutLimit, guillotine)
+                if layout_store is not None:
+                    layout_store.put(store_key, layout_meta.to_record())
+            layout_meta.freeze()
+            cls.layout_cache.put(key, layout_meta)
+
+        return layout_meta.replace(bin=parent_layout, rect=child_layout, name=name)
+
+    # Scores every parent layout against its child layout in one vectorized pass
+    # using the closed-form grids, without packing the individual rectangles.
+    # Either list may hold a single layout, which is then paired with all of the
+    # other list. Returns layout meta without layouts, one per pair.
+    @classmethod
+    def get_layouts_batch(cls, parent_layouts, child_layouts, rotate=False, name=None):
         def __round__(number):
-            return round(number * 100, 2)
+            return round(float(number) * 100, 2)
+
+        if len(parent_layouts) == 1 and len(child_layouts) > 1:
+            parent_layouts = parent_layouts * len(child_layouts)
+        elif len(child_layouts) == 1 and len(parent_layouts) > 1:
+            child_layouts = child_layouts * len(parent_layouts)
+        elif len(parent_layouts) != len(child_layouts):
+            raise ValueError('Parent and child layouts must be of the same length, '
+                'or one of them must hold a single layout.')
+
+        parent_sizes = [layout.get_pack_size_as_bin() for layout in parent_layouts]
+        child_sizes = [layout.get_pack_size_as_rect() for layout in child_layouts]
+        results = BinPacker.evaluate_batch(
+            [to_um(width, uom) for (width, length, uom) in parent_sizes],
+            [to_um(length, uom) for (width, length, uom) in parent_sizes],
+            [to_um(width, uom) for (width, length, uom) in child_sizes],
+            [to_um(length, uom) for (width, length, uom) in child_sizes], rotate)
+
+        return [Rectangle.LayoutMeta(parent_layout, child_layout, 
+                Rectangle.LayoutSequence(uom=child_layout.uom), int(count), 
+                __round__(usage), __round__(wastage), [], name, int(cut_count))
+            for (parent_layout, child_layout, count, usage, wastage, cut_count) in zip(
+                parent_layouts, child_layouts, results['count'], results['usage'],
+                results['wastage'], results['cut_count'])]
 
-        def __get_usage__(pw, pl, pu, cw, cl, cu, count):
-            d_cw = Distance(**{cu: cw})
-            d_cl = Distance(**{cu: cl})
-            d_pw = Distance(**{pu: pw})
-            d_pl = Distance(**{pu: pl})
-            ca = d_cw.mm * d_cl.mm * count
-            pa = d_pw.mm * d_pl.mm
-            return (ca / pa)
+    @classmethod
+    def _compute_layout(cls, parent_layout, child_layout, rotate=False,
+            childCount=None, childLayoutLimit=None, guillotine=False):
+        def __round__(number):
+            return round(number * 100, 2)
 
         def __get_layouts__(packer, rotated, uom=None):
-            layouts = []
-            if packer is not None:
-                for key, rect in enumerate(packer.rect_list()):
-                    x, y, width, length, rid = rect
-                    is_rotated = key in rotated
-                    layout = Rectangle.Layout(key + 1, x, y, width, length, is_rotated, uom=uom)
-                    layouts.append(layout) 
-
-                    if childLayoutLimit is not None and key > childLayoutLimit:
-                        break 
-
-            return layouts
+            rects = packer.rect_list() if packer is not None else []
+            if childLayoutLimit is not None:
+                rects = rects[:childLayoutLimit + 2]
+            rotated = set(rotated)
+
+            return Rectangle.LayoutSequence(
+                [from_um(rect[0], uom) for rect in rects], 
+                [from_um(rect[1], uom) for rect in rects],
+                [from_um(rect[2], uom) for rect in rects], 
+                [from_um(rect[3], uom) for rect in rects],
+                [key in rotated for key in range(len(rects))], uom)
         
-        def __get_cut_count__(packer, bin_width, bin_length, rotated):
-            cut_count = 0
-            if packer is not None:
-                unique_x = []
-                unique_y = []
-                for idx, rect in enumerate(packer):
-                    x = rect.x 
-                    y = rect.y 
-                    w = rect.width 
-                    h = rect.height
-                    is_rotated = idx in rotated
-                    if x not in unique_x:
-                        if x > 0:
-                            unique_x.append(x)
-                        if x+w < bin_width and x+(w*2) > bin_width:
-                            unique_x.append(x+w)
-                    if y not in unique_y:
-                        if y > 0:
-                            unique_y.append(y)
-                        if y+h < bin_length and y+(h*2) > bin_length:
-                            unique_y.append(y+h)
-                cut_count = len(unique_x) + len(unique_y)
-            
-            return cut_count
+        def __get_cut_plan__(packer, bin_width, bin_length, uom=None):
+            rects = [(rect.x, rect.y, rect.width, rect.height) 
+                for rect in packer] if packer is not None else []
+            cut_plan = CutPlanner.plan(bin_width, bin_length, rects)
+            cuts = [CutPlanner.Cut(cut.axis, from_um(cut.position, uom), from_um(cut.start, uom),
+                from_um(cut.end, uom), cut.stack) for cut in cut_plan.cuts]
+            return cut_plan.count, cuts
 
         parent_width, parent_length, parent_uom = parent_layout.get_pack_size_as_bin()
         child_width, child_length, child_uom = child_layout.get_pack_size_as_rect()
+        parent_width, parent_length = to_um(parent_width, parent_uom), to_um(parent_length, parent_uom)
+        child_width, child_length = to_um(child_width, child_uom), to_um(child_length, child_uom)
+
+        # Unrotated packs are the straight grid, which is built in closed form
+        # so that long runsheets do not go through every packed piece
+        cols = BinPacker.fit(parent_width, child_width)
+        rows = BinPacker.fit(parent_length, child_length)
+        if not rotate and not guillotine and (childCount is None or childCount >= cols * rows):
+            return cls._compute_grid_layout(parent_width, parent_length, 
+                child_width, child_length, child_uom, cols, rows, childLayoutLimit)
 
         packer = Rectangle.binpacker( 
-            parent_width, parent_length, parent_uom,
-            child_width, child_length, child_uom, rotate, 
-            childCount)
+            parent_width, parent_length, 'um',
+            child_width, child_length, 'um', rotate, 
+            childCount, guillotine)
 
         count = len(packer) if packer is not None else 0
-        usage = __get_usage__(parent_width, parent_length, parent_uom, 
-            child_width, child_length, child_uom, count) if packer is not None else 0
+        usage = (child_width * child_length * count) / (parent_width * parent_length) \
+            if packer is not None else 0
         wastage = 1 - usage
         # list of index of rectangles that have been rotated
         rotated = [i for i, x in enumerate(packer) if x.width != child_width and x.height != child_length] if \
             packer is not None and rotate else []
         layouts = __get_layouts__(packer, rotated, uom=child_uom)
-        cut_count = __get_cut_count__(packer, parent_width, parent_length, rotated)
+        cut_count, cuts = __get_cut_plan__(packer, parent_width, parent_length, uom=child_uom)
 
-        layout_meta = Rectangle.LayoutMeta(parent_layout, child_layout, layouts, count, 
-            __round__(usage), __round__(wastage), rotated, name, cut_count)
+        layout_meta = Rectangle.LayoutMeta(None, None, layouts, count, 
+            __round__(usage), __round__(wastage), rotated, None, cut_count, cuts)
         return layout_meta
 
+    # Layout meta of a grid of cols x rows children, sizes in micrometres.
+    # Matches what _compute_layout gives for the packed grid.
+    @classmethod
+    def _compute_grid_layout(cls, parent_width, parent_length, child_width, child_length,
+            uom, cols, rows, childLayoutLimit=None):
+        def __round__(number):
+            return round(number * 100, 2)
+
+        count = cols * rows
+        limit = count if childLayoutLimit is None else min(count, childLayoutLimit + 2)
+        width, length = from_um(child_width, uom), from_um(child_length, uom)
+        layouts = Rectangle.LayoutSequence(
+            [from_um((i % cols) * child_width, uom) for i in range(limit)],
+            [from_um((i // cols) * child_length, uom) for i in range(limit)],
+            [width] * limit, [length] * limit, [False] * limit, uom)
+
+        cut_plan = CutPlanner.plan_grid(parent_width, parent_length, 
+            child_width, child_length, cols, rows)
+        cuts = [CutPlanner.Cut(cut.axis, from_um(cut.position, uom), from_um(cut.start, uom),
+            from_um(cut.end, uom), cut.stack) for cut in cut_plan.cuts]
+        usage = (child_width * child_length * count) / (parent_width * parent_length) \
+            if count > 0 else 0
+
+        return Rectangle.LayoutMeta(None, None, layouts, count, 
+            __round__(usage), __round__(1 - usage), [], None, cut_plan.count, cuts)
+
+    # Packs in integer micrometres; the packed bin is returned in micrometres.
+    # Sizes already in micrometres are passed with 'um' as their unit.
     @classmethod
     def binpacker(cls, 
             parent_width, parent_length, parent_uom,
-            child_width, child_length, child_uom, rotate, childRectCount=None):
+            child_width, child_length, child_uom, rotate, childRectCount=None,
+            guillotine=False):
 
         def __get_size__(unit, distance):
-            d = Distance(**{unit: distance})
-            return distance if unit == parent_uom else getattr(d, parent_uom)
+            return distance if unit == 'um' else to_um(distance, unit)
         
         parent_width = __get_size__(parent_uom, parent_width)
         parent_length = __get_size__(parent_uom, parent_length) 
@@ -384,36 +624,67 @@ class Rectangle(Shape):
         child_dimensions = (child_width, child_length)
 
         params = parent_dimensions + child_dimensions
-        estimate_count = (BinPacker.estimate_rectangles(*params) 
-            if childRectCount is None else childRectCount) 
+
+        if guillotine:
+            return BinPacker.pack_guillotine(*params, rotation=rotate, 
+                count=childRectCount)
+
+        # Try the closed-form grids first and only run rectpack
+        # when the grid cannot be proven to be the best layout
+        grid, is_optimal = BinPacker.pack_grid(*params, rotation=rotate,
+            count=childRectCount)
+        if is_optimal:
+            return grid
+
+        estimate_count = (BinPacker.estimate_rectangles(*params)
+            if childRectCount is None else childRectCount)
+
+        # Staggered strips are built in closed form too, so only
+        # run rectpack when they do not reach the bound either
+        staggered = BinPacker.pack_staggered(*params, count=childRectCount) \
+            if rotate and child_width != child_length else None
+        if staggered is not None and len(staggered) >= estimate_count and \
+                (grid is None or len(staggered) > len(grid)):
+            return staggered
+
         child_rects = [child_dimensions] * estimate_count
         parent_rect = [parent_dimensions]
+        packed = None
 
-        if rotate:
+        # Rotating a square child gives the same pack, so skip that pass,
+        # as well as the unrotated pass once the rotated one reaches the bound
+        if rotate and child_width != child_length:
             packer1 = BinPacker.pack_rectangles(child_rects, parent_rect, True)
-            packer2 = BinPacker.pack_rectangles(child_rects, parent_rect, False)
-            if len(packer1) > 0 or len(packer2) > 0:
-                p1 = len(packer1[0]) if len(packer1) > 0 else 0
-                p2 = len(packer2[0]) if len(packer2) > 0 else 0
-                return packer1[0] if p1 > p2 else packer2[0]
+            p1 = len(packer1[0]) if len(packer1) > 0 else 0
+            if p1 >= estimate_count:
+                packed = packer1[0]
             else:
-                None
+                packer2 = BinPacker.pack_rectangles(child_rects, parent_rect, False)
+                if len(packer1) > 0 or len(packer2) > 0:
+                    p2 = len(packer2[0]) if len(packer2) > 0 else 0
+                    packed = packer1[0] if p1 > p2 else packer2[0]
         else:
             x = BinPacker.pack_rectangles(child_rects, parent_rect, False)
-            return x[0] if len(x) > 0 else None
+            packed = x[0] if len(x) > 0 else None
+
+        if staggered is not None and (packed is None or len(staggered) > len(packed)):
+            packed = staggered
+
+        # Prefer the grid on ties since it is always guillotine-cuttable
+        if packed is None or (grid is not None and len(grid) >= len(packed)):
+            return grid
+        return packed
 
     def eq(self, rectangle):
         self._validate(rectangle)
-        return self.width.mm == rectangle.width.mm and self.length.mm == rectangle.length.mm
+        return self.layout.eq(rectangle.layout)
 
     def gte(self, rectangle):
         self._validate(rectangle)
-        return self.width.mm >= rectangle.width.mm and self.length.mm >= rectangle.length.mm
+        return self.layout.gte(rectangle.layout)
 
     def within_bounds(self, width, length, unit):
-        w = Distance(**{unit: width})
-        l = Distance(**{unit: length})
-        return (self.width >= w and self.length >= l) or (self.width >= l and self.length >= w)
+        return self.layout.gte(Rectangle.Layout(width=width, length=length, uom=unit), True)
 
     def _validate(self, rectangle):
         if not isinstance(rectangle, Rectangle):
@@ -433,6 +704,106 @@ class Rectangle(Shape):
         return str_name
 
 
+class Polygon(Rectangle):
+    # Rectangle whose pieces are cut to an irregular outline. The outline is a
+    # list of [x, y] points in the size unit, within the width and length.
+    class Layout(Rectangle.Layout):
+        def __init__(self, points=(), angle=0, **kwargs):
+            super().__init__(**kwargs)
+            self.points = [tuple(point) for point in points]
+            # counterclockwise turn of the outline, a multiple of 90 degrees
+            self.angle = angle
+            if len(self.points) > 0 and not self.width and not self.length:
+                width, length = RasterNester.rotate_points(self.points, angle).max(axis=0)
+                self.width, self.length = float(width), float(length)
+
+        @property
+        def outline(self):
+            return [tuple(point) for point in 
+                RasterNester.rotate_points(self.points, self.angle).tolist()]
+
+        @property
+        def area(self):
+            if len(self.points) == 0:
+                return super().area
+            return float(RasterNester.get_area(self.points))
+
+    class LayoutSequence(Rectangle.LayoutSequence):
+        def __init__(self, xs=(), ys=(), widths=(), lengths=(), rotations=(), 
+                uom=None, transform=None, angles=(), points=()):
+            super().__init__(xs, ys, widths, lengths, rotations, uom, transform)
+            self.angles = array('h', angles)
+            self.points = points
+
+        def _get(self, key):
+            layout = Polygon.Layout(i=key + 1, x=self.xs[key], y=self.ys[key], 
+                width=self.widths[key], length=self.lengths[key], 
+                is_rotated=bool(self.rotations[key]), uom=self.uom, 
+                points=self.points, angle=self.angles[key])
+            if self.transform is not None:
+                layout = self.transform(layout)
+            return layout.freeze() if self.is_frozen else layout
+
+    layout_cache = LRUCache(getattr(settings, 'LAYOUT_CACHE_SIZE', 2048))
+    outline = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def layout(self):
+        return Polygon.Layout(width=self.width_value, length=self.length_value, 
+            uom=self.size_uom, points=self.outline or ())
+
+    # Nests copies of the outline of the child layout on the parent layout, see
+    # RasterNester. Returns layout meta like Rectangle.get_layout, whose layouts
+    # are placed at the corner of their bounding box. Rotation allows quarter
+    # turns; half turns are always tried. Nested pieces are die-cut, so there
+    # are no guillotine cuts.
+    @classmethod
+    def get_layout(cls, parent_layout, child_layout, rotate=False, name=None, 
+            childCount=None, childLayoutLimit=None, guillotine=False):
+        def __round__(number):
+            return round(number * 100, 2)
+
+        if not isinstance(child_layout, Polygon.Layout) or len(child_layout.points) == 0:
+            return Rectangle.get_layout(parent_layout, child_layout, rotate, name, 
+                childCount, childLayoutLimit, guillotine)
+
+        parent_width, parent_length, parent_uom = parent_layout.get_pack_size_as_bin()
+        uom = child_layout.uom
+        points = tuple((to_um(x, uom), to_um(y, uom)) 
+            for (x, y) in child_layout.outline)
+        key = (to_um(parent_width, parent_uom), to_um(parent_length, parent_uom), 
+            parent_uom, points, uom, bool(rotate), childCount, childLayoutLimit)
+        layout_meta = Polygon.layout_cache.get(key)
+
+        if layout_meta is None:
+            bin_width, bin_length = key[0], key[1]
+            nest = RasterNester.nest(bin_width, bin_length, points, rotate, childCount)
+            placements = nest.placements
+            if childLayoutLimit is not None:
+                placements = placements[:childLayoutLimit + 2]
+            sizes = {angle: RasterNester.rotate_points(points, angle).max(axis=0)
+                for angle in set([angle for (x, y, angle) in placements])}
+            layouts = Polygon.LayoutSequence(
+                [from_um(x, uom) for (x, y, angle) in placements],
+                [from_um(y, uom) for (x, y, angle) in placements],
+                [from_um(sizes[angle][0], uom) for (x, y, angle) in placements],
+                [from_um(sizes[angle][1], uom) for (x, y, angle) in placements],
+                [angle % 180 == 90 for (x, y, angle) in placements], uom, 
+                angles=[angle for (x, y, angle) in placements], 
+                points=child_layout.outline)
+            usage = (nest.area * nest.count) / (bin_width * bin_length) \
+                if bin_width > 0 and bin_length > 0 else 0
+            rotated = [i for (i, (x, y, angle)) in enumerate(placements) if angle % 180 == 90]
+            layout_meta = Rectangle.LayoutMeta(None, None, layouts, nest.count, 
+                __round__(usage), __round__(1 - usage), rotated).freeze()
+            Polygon.layout_cache.put(key, layout_meta)
+
+        return layout_meta.replace(bin=parent_layout, rect=child_layout, name=name)
+
+
 class Liquid(Shape):
     costing_measures = [CostingMeasure.VOLUME]
     volume_value = models.FloatField(null=True, blank=True)
@@ -492,6 +863,9 @@ class RectangleLayoutSerializer(serializers.Serializer):
     length = serializers.FloatField()
     is_rotated = serializers.BooleanField(required=False)
     uom = serializers.CharField()
+    points = serializers.ListField(child=serializers.ListField(
+        child=serializers.FloatField(), min_length=2, max_length=2), required=False)
+    angle = serializers.IntegerField(required=False)
 
     def update(self, instance, validated_data):
         resourcetype = validated_data.get('resourcetype', instance.resourcetype)
@@ -505,9 +879,21 @@ class RectangleLayoutSerializer(serializers.Serializer):
         return instance
 
     def create(self, validated_data):
+        if len(validated_data.get('points', [])) > 0:
+            return Polygon.Layout(**validated_data)
+        validated_data.pop('points', None)
+        validated_data.pop('angle', None)
         return Rectangle.Layout(**validated_data)
 
 
+class CutSerializer(serializers.Serializer):
+    axis = serializers.CharField()
+    position = serializers.FloatField()
+    start = serializers.FloatField()
+    end = serializers.FloatField()
+    stack = serializers.IntegerField()
+
+
 class RectangleLayoutMetaSerializer(serializers.Serializer):
     name = serializers.CharField()
     bin = RectangleLayoutSerializer()
@@ -518,9 +904,11 @@ class RectangleLayoutMetaSerializer(serializers.Serializer):
     wastage = serializers.FloatField()
     rotate = serializers.ListField(child=serializers.IntegerField())
     cut_count = serializers.IntegerField()
+    cuts = CutSerializer(many=True, required=False)
 
     def create(self, validated_data):
-        return Rectangle.LayoutMeta(**validated_data)
+        cuts = [CutPlanner.Cut(**x) for x in validated_data.pop('cuts', [])]
+        return Rectangle.LayoutMeta(cuts=cuts, **validated_data)
 
     def update(self, instance, validated_data):
         instance.name = validated_data.get('name', instance.name)
@@ -532,4 +920,6 @@ class RectangleLayoutMetaSerializer(serializers.Serializer):
         instance.wastage = validated_data.get('wastage', instance.wastage)
         instance.rotate = validated_data.get('rotate', instance.rotate)
         instance.cut_count = validated_data.get('cut_count', instance.cut_count)
+        if 'cuts' in validated_data:
+            instance.cuts = [CutPlanner.Cut(**x) for x in validated_data.get('cuts')]
         return instance
\ No newline at end of file
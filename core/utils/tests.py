@@ -1,6 +1,24 @@
+import pytest, math
+import numpy as np
+from decimal import Decimal
 from .measures import Measure
 from .binpacker import BinPacker
-from .shapes import Rectangle
+from .shapes import Rectangle, Polygon, LAYOUT_RECORD_VERSION
+from .cache import LRUCache
+from .layoutstore import LayoutStore, configure_layout_store
+from .geometry import to_um, from_um, convert
+from .cutplanner import CutPlanner
+from .gangplanner import GangPlanner
+from .nesting import RasterNester
+from .costing import CostingKernel
+from .imposition import Imposition
+from .layoutpool import is_parallel, _run_task
+
+
+@pytest.fixture
+def layout_store(tmp_path):
+    yield configure_layout_store(tmp_path / 'layouts.sqlite3')
+    configure_layout_store(None)
 
 
 # Create your tests here.
@@ -52,4 +70,419 @@ def test_binpacker_get_layout_2(db):
 
     assert layout is not None
     assert layout.count == 4
-    assert layout.cut_count == 3
\ No newline at end of file
+    assert layout.cut_count == 3
+
+def test_binpacker__pack_grid_straight(db):
+    packed, is_optimal = BinPacker.pack_grid(12, 16, 4, 5, False)
+
+    assert is_optimal
+    assert len(packed) == 9
+    assert packed.rect_list()[0] == (0, 0, 4, 5, None)
+
+
+def test_binpacker__pack_grid_mixed(db):
+    packed, is_optimal = BinPacker.pack_grid(34, 28, 4, 5, True)
+
+    assert is_optimal
+    assert len(packed) == 47
+    rotated = [r for r in packed if r.width == 5]
+    assert len(rotated) == 42
+
+
+def test_binpacker__pack_grid_child_count(db):
+    packed, is_optimal = BinPacker.pack_grid(48, 2000, 45, 150, False, count=4)
+
+    assert is_optimal
+    assert len(packed) == 4
+    assert [r.y for r in packed] == [0, 150, 300, 450]
+
+
+def test_binpacker__pack_grid_not_proven(db):
+    packed, is_optimal = BinPacker.pack_grid(16, 27, 8, 10, True)
+
+    assert not is_optimal
+    assert len(packed) == 4
+
+
+def test_rectangle__get_layout_cache(db):
+    Rectangle.layout_cache.clear()
+    Rectangle.layout_cache.reset_stats()
+    parent = Rectangle.Layout(width=12, length=16, uom='inch')
+    child = Rectangle.Layout(width=4, length=5, uom='inch')
+    child_mm = Rectangle.Layout(width=101.6, length=127, uom='mm')
+
+    first = Rectangle.get_layout(parent, child, True, 'First')
+    second = Rectangle.get_layout(parent, child, True, 'Second')
+
+    assert Rectangle.layout_cache.stats['misses'] == 1
+    assert Rectangle.layout_cache.stats['hits'] == 1
+    assert first.name == 'First' and second.name == 'Second'
+    assert first.layouts is second.layouts
+
+    Rectangle.get_layout(parent, child_mm, True)
+    assert Rectangle.layout_cache.stats['misses'] == 2
+
+
+def test_rectangle__get_layout_cache_is_frozen(db):
+    parent = Rectangle.Layout(width=12, length=16, uom='inch')
+    child = Rectangle.Layout(width=4, length=5, uom='inch')
+
+    layout_meta = Rectangle.get_layout(parent, child, True)
+
+    with pytest.raises(AttributeError):
+        layout_meta.count = 0
+    with pytest.raises(AttributeError):
+        layout_meta.layouts[0].x = 100
+
+    replaced = layout_meta.replace(name='Replaced')
+    assert replaced.name == 'Replaced' and replaced.count == layout_meta.count
+
+
+def test_lru_cache__eviction(db):
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    clock = cache.clock
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert 'b' not in cache
+    assert cache.items_since(clock) == [('a', 1), ('c', 3)]
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats['evictions'] == 1
+
+
+def test_layout_store__round_trip(db, tmp_path):
+    store = LayoutStore(tmp_path / 'layouts.sqlite3', max_entries=2, evict_interval=1)
+    store.put((1, 'inch', True), {'count': 9})
+    store.put((2, 'inch', True), {'count': 4})
+    store.get((1, 'inch', True))
+    store.put((3, 'inch', True), {'count': 1})
+
+    assert store.get((1, 'inch', True)) == {'count': 9}
+    assert store.get((2, 'inch', True)) is None
+    assert len(store) == 2 and store.evictions == 1
+
+
+def test_layout_store__batches_writes(db, tmp_path):
+    store = LayoutStore(tmp_path / 'layouts.sqlite3', max_entries=2, touch_batch=2, 
+        evict_interval=3)
+
+    def _get_accessed_at(key):
+        return store.connection.execute('SELECT accessed_at FROM layouts WHERE key = ?',
+            (LayoutStore.to_key(key),)).fetchone()[0]
+
+    store.put((1,), {'count': 9})
+    accessed_at = _get_accessed_at((1,))
+    store.get((1,))
+    assert _get_accessed_at((1,)) == accessed_at
+    store.get((1,))
+    store.put((2,), {'count': 4})
+    store.get((2,))
+    assert _get_accessed_at((1,)) > accessed_at
+
+    # The size is checked on every third put only
+    store.put((3,), {'count': 1})
+    assert len(store) == 2 and store.evictions == 1
+    assert store.get((1,)) is None
+    store.put((4,), {'count': 2})
+    store.put((5,), {'count': 1})
+    assert len(store) == 4
+    store.put((6,), {'count': 3})
+    assert len(store) == 2 and store.evictions == 4
+    assert store.get((4,)) is None and store.get((6,)) == {'count': 3}
+
+
+def test_rectangle__get_layout_reads_layout_store(db, layout_store):
+    Rectangle.layout_cache.clear()
+    parent = Rectangle.Layout(width=12, length=16, uom='inch')
+    child = Rectangle.Layout(width=4, length=5, uom='inch')
+
+    computed = Rectangle.get_layout(parent, child, True)
+    Rectangle.layout_cache.clear()
+    stored = Rectangle.get_layout(parent, child, True)
+
+    assert layout_store.hits == 1 and len(layout_store) == 1
+    assert stored.count == computed.count and stored.cut_count == computed.cut_count
+    assert [(x.i, x.x, x.y, x.width, x.length, x.is_rotated) for x in stored.layouts] == \
+        [(x.i, x.x, x.y, x.width, x.length, x.is_rotated) for x in computed.layouts]
+
+
+def test_rectangle__get_layout_skips_unreadable_records(db, layout_store):
+    Rectangle.layout_cache.clear()
+    parent = Rectangle.Layout(width=12, length=16, uom='inch')
+    child = Rectangle.Layout(width=4, length=5, uom='inch')
+    key = Rectangle.get_layout_key(parent, child, True)
+    layout_store.put(key, [[0, 0, 4, 5, False]])
+    layout_store.put((LAYOUT_RECORD_VERSION,) + key, [[0, 0, 4, 5, False]])
+
+    layout_meta = Rectangle.get_layout(parent, child, True)
+    assert layout_meta.count == 9
+    assert layout_store.get((LAYOUT_RECORD_VERSION,) + key)['count'] == 9
+
+
+def test_geometry__to_um(db):
+    assert to_um(8.5, 'inch') == 215900
+    assert to_um(21.59, 'cm') == to_um(215.9, 'mm') == to_um(8.5, 'inch')
+    assert from_um(to_um(8.8, 'inch'), 'inch') == 8.8
+    assert convert(508, 'mm', 'inch') == 20
+
+
+def test_rectangle__get_layouts_batch(db):
+    parents = [Rectangle.Layout(width=12, length=16, uom='inch'),
+        Rectangle.Layout(width=34, length=28, uom='inch'),
+        Rectangle.Layout(width=3, length=3, uom='inch')]
+    child = Rectangle.Layout(width=101.6, length=127, uom='mm')
+
+    layouts = Rectangle.get_layouts_batch(parents, [child], True)
+
+    assert [x.count for x in layouts] == [9, 47, 0]
+    assert layouts[0].usage == 93.75 and layouts[0].cut_count == 5
+    assert layouts[2].usage == 0 and layouts[2].cut_count == 0
+    assert layouts[1].bin is parents[1] and layouts[1].rect is child
+
+
+def test_rectangle__layout_sequence(db):
+    sequence = Rectangle.LayoutSequence([0, 4], [0, 0], [4, 5], [5, 4], [False, True], 'inch')
+    mapped = sequence.map(lambda layout: Rectangle.Layout(layout.i, layout.x, 
+        layout.y, layout.width * 2, layout.length, layout.is_rotated, layout.uom))
+
+    assert len(mapped) == 2 and mapped.xs is sequence.xs
+    assert sequence[-1].i == 2 and sequence[-1].is_rotated
+    assert [x.width for x in mapped] == [8, 10]
+    assert [x.x for x in sequence[:1]] == [0]
+
+
+def test_cut_planner__plan_stacks_identical_strips(db):
+    rects = [(x * 4, y * 5, 4, 5) for x in range(3) for y in range(3)]
+
+    plan = CutPlanner.plan(12, 16, rects)
+
+    assert plan.count == 5 and plan.is_guillotine
+    assert [(cut.axis, cut.position, cut.stack) for cut in plan.cuts] == \
+        [('x', 4, 1), ('x', 8, 1), ('y', 5, 3), ('y', 10, 3), ('y', 15, 3)]
+
+
+def test_cut_planner__plan_non_guillotine(db):
+    # pinwheel of four 3x1 rects around a 1x1 hole
+    rects = [(0, 0, 3, 1), (3, 0, 1, 3), (1, 3, 3, 1), (0, 1, 1, 3)]
+
+    plan = CutPlanner.plan(4, 4, rects)
+
+    assert not plan.is_guillotine
+    assert plan.count == 4
+
+
+def test_binpacker__pack_guillotine(db):
+    packed = BinPacker.pack_guillotine(250, 380, 35, 20, True)
+    grid, is_optimal = BinPacker.pack_grid(250, 380, 35, 20, True)
+    plan = CutPlanner.plan(250, 380, [(r.x, r.y, r.width, r.height) for r in packed])
+
+    assert len(packed) == 135 and len(grid) == 134
+    assert plan.is_guillotine
+
+
+def test_rectangle__get_layout_guillotine(db):
+    parent = Rectangle.Layout(width=20, length=20, uom='inch')
+    child = Rectangle.Layout(width=7, length=3, uom='inch')
+
+    layout = Rectangle.get_layout(parent, child, True)
+    guillotine_layout = Rectangle.get_layout(parent, child, True, guillotine=True)
+
+    assert layout.count == 17
+    assert guillotine_layout.count == 16
+
+
+def test_benchmarks__compare(db):
+    from core.benchmarks.suite import Benchmark, compare
+    baseline = Benchmark.Result('binpacker', [0.001] * 10, [1024], 
+        {'a': {'count': 9, 'usage': 93.75}}, 0)
+    slower = Benchmark.Result('binpacker', [0.002] * 10, [1024], 
+        {'a': {'count': 8, 'usage': 83.33}}, 0)
+
+    regressions = compare([slower], {'binpacker': baseline.to_dict()})
+
+    assert len(compare([baseline], {'binpacker': baseline.to_dict()})) == 0
+    assert len(regressions) == 3
+
+
+def test_binpacker__pack_rectangles_stops_at_area_bound(db):
+    rects = [(4, 5)] * 9
+
+    packer = BinPacker.pack_rectangles(rects, [(12, 15)], True)
+
+    assert len(packer[0]) == 9
+
+
+def test_binpacker__pack_rectangles_is_deterministic(db):
+    rects = [(332, 290)] * 40
+
+    counts = [(len(packer[0]), CutPlanner.count(1300, 2600, 
+            [(r.x, r.y, r.width, r.height) for r in packer[0]])) for packer in 
+        [BinPacker.pack_rectangles(rects, [(1300, 2600)], True) for i in range(3)]]
+
+    assert counts[0] == counts[1] == counts[2]
+
+
+def test_rectangle__get_layout_staggered(db):
+    parent = Rectangle.Layout(width=13, length=26, uom='inch')
+    child = Rectangle.Layout(width=3.32, length=2.9, uom='inch')
+
+    layout = Rectangle.get_layout(parent, child, True)
+
+    assert layout.count == 32
+    assert Rectangle.get_layout(Rectangle.Layout(width=26, length=13, uom='inch'), 
+        child, True).count == 32
+
+
+def test_layout_pool__worker_keeps_cache(db):
+    parent = Rectangle.Layout(width=20, length=26, uom='inch')
+    child = Rectangle.Layout(width=3.5, length=2, uom='inch')
+    Rectangle.layout_cache.clear()
+    misses = Rectangle.layout_cache.misses
+
+    first = _run_task(Rectangle.get_layout, (parent, child, True))
+    second = _run_task(Rectangle.get_layout, (parent, child, True))
+
+    # The second task reuses the layout packed for the first
+    assert len(first) == 1
+    assert [key for (key, record) in second] == [key for (key, record) in first]
+    assert Rectangle.layout_cache.misses == misses + 1
+
+
+def test_layout_pool__is_parallel(db, settings):
+    settings.LAYOUT_POOL_MIN_TASKS = 8
+    settings.LAYOUT_WORKERS = 0
+    assert not is_parallel([()] * 100)
+    settings.LAYOUT_WORKERS = 1
+    assert not is_parallel([()] * 100)
+    settings.LAYOUT_WORKERS = 2
+    assert not is_parallel([()] * 2)
+    assert is_parallel([()] * 8)
+
+
+def test_cut_planner__plan_grid(db):
+    for (bin_width, bin_height, cols, rows) in [(100, 60, 10, 3), (105, 65, 10, 3), 
+            (10, 60, 1, 3), (15, 20, 1, 1), (100, 20, 10, 1), (10, 20, 1, 1)]:
+        rects = [(col * 10, row * 20, 10, 20) for row in range(rows) for col in range(cols)]
+        plan = CutPlanner.plan(bin_width, bin_height, rects)
+        grid_plan = CutPlanner.plan_grid(bin_width, bin_height, 10, 20, cols, rows)
+
+        assert grid_plan.count == plan.count
+        assert [cut.to_list() for cut in grid_plan.cuts] == [cut.to_list() for cut in plan.cuts]
+
+
+def test_cut_planner__count_grids(db):
+    # Rects kept row by row, as pack_grid keeps them for a count
+    for (bin_width, bin_height) in [(100, 60), (105, 65), (30, 60), (10, 60), (10, 20)]:
+        cols, rows = bin_width // 10, bin_height // 20
+        counts = list(range(1, cols * rows + 2))
+        cut_counts = CutPlanner.count_grids(bin_width, bin_height, 10, 20, cols, rows, counts)
+        for (count, cut_count) in zip(counts, cut_counts):
+            grid, is_optimal = BinPacker.pack_grid(bin_width, bin_height, 10, 20,
+                count=count if count < cols * rows else None)
+            rects = [(rect.x, rect.y, rect.width, rect.height) for rect in grid]
+            assert cut_count == CutPlanner.count(bin_width, bin_height, rects)
+
+
+def test_binpacker__evaluate_batch_cut_count(db):
+    # Two-block plans of both orientations, with and without trims
+    sizes = [(55, 17, 5, 2), (38, 46, 1, 7), (250, 380, 35, 20), (20, 20, 7, 3), 
+        (100, 63, 9, 4), (61, 29, 6, 11), (12, 16, 4, 5)]
+    results = BinPacker.evaluate_batch(*zip(*sizes), True)
+
+    for (i, (bin_width, bin_height, rect_width, rect_height)) in enumerate(sizes):
+        packed, is_optimal = BinPacker.pack_grid(bin_width, bin_height, 
+            rect_width, rect_height, True)
+        plan = CutPlanner.plan(bin_width, bin_height, 
+            [(r.x, r.y, r.width, r.height) for r in packed])
+
+        assert results['count'][i] == len(packed)
+        assert results['cut_count'][i] == plan.count
+    assert list(results['cut_count'][:2]) == [24, 27]
+
+
+def test_gang_planner__plan(db):
+    # One half of the sheet for the first job, four quarters of the other half
+    # for the second meet both quantities in a run of 1000
+    jobs = [GangPlanner.Job(30, 40, 1000), GangPlanner.Job(15, 20, 4000)]
+    plan = GangPlanner.plan(60, 40, jobs)
+    assert plan.run_length == 1000
+    assert plan.counts == [1, 4]
+    assert GangPlanner.get_lower_bound(60, 40, jobs) == 1000
+    assert len(plan.rects) == sum(plan.counts)
+    for (x, y, width, height, i, is_rotated) in plan.rects:
+        assert x + width <= 60 and y + height <= 40
+
+    with pytest.raises(ValueError):
+        GangPlanner.plan(60, 40, [GangPlanner.Job(50, 40, 10), GangPlanner.Job(20, 20, 10)])
+
+
+def test_raster_nester__nest(db):
+    # Triangles pair up into rectangles once half turns are allowed
+    triangle = [(0, 0), (2, 0), (0, 3)]
+    nest = RasterNester.nest(25, 19, triangle, True)
+    assert nest.count > 72
+    assert nest.area == 3
+
+    grid = np.zeros((int(19 // nest.cell), int(25 // nest.cell)), dtype=int)
+    for (x, y, angle) in nest.placements:
+        mask = RasterNester.rasterize(RasterNester.rotate_points(triangle, angle), nest.cell)
+        row, col = round(y / nest.cell), round(x / nest.cell)
+        assert row + mask.shape[0] <= grid.shape[0] and col + mask.shape[1] <= grid.shape[1]
+        grid[row:row + mask.shape[0], col:col + mask.shape[1]] += mask
+    assert grid.max() == 1
+
+    assert RasterNester.nest(25, 19, triangle, True, count=10).count == 10
+    assert RasterNester.nest(1, 1, triangle).count == 0
+
+
+def test_polygon__get_layout(db):
+    parent_layout = Rectangle.Layout(width=25, length=38, uom='inch')
+    square = Polygon.Layout(points=[(0, 0), (2, 0), (2, 3), (0, 3)], uom='inch')
+    assert (square.width, square.length, square.area) == (2, 3, 6)
+    assert Rectangle.get_layout(parent_layout, square).count == \
+        Rectangle.get_layout(parent_layout, Rectangle.Layout(width=2, length=3, uom='inch')).count
+
+    triangle = Polygon.Layout(points=[(0, 0), (2, 0), (0, 3)], uom='inch')
+    layout_meta = Rectangle.get_layout(parent_layout, triangle, True, 'Nest')
+    assert layout_meta.name == 'Nest' and layout_meta.rect is triangle
+    assert layout_meta.count == len(layout_meta.layouts)
+    assert layout_meta.usage == round(layout_meta.count * 3 / (25 * 38) * 100, 2)
+    assert layout_meta.cut_count == 0
+    assert Rectangle.get_layout(parent_layout, triangle, True) is not layout_meta
+    for layout in layout_meta.layouts:
+        assert layout.x + layout.width <= 25 and layout.y + layout.length <= 38
+        assert layout.is_rotated == (layout.angle in [90, 270])
+
+
+def test_imposition_table__get_booklet(db):
+    table = Imposition.Table(to_um(25, 'inch'), to_um(38, 'inch'))
+    page_width, page_length = to_um(8.5, 'inch'), to_um(11, 'inch')
+
+    # Four pages a side fit twice, turned, as a 2x2 grid
+    entry = table.get(page_width, page_length, 8)
+    assert (entry.outs, entry.plate_count) == (2, 2)
+    assert table.get(page_width, page_length, 8) is entry
+    entry = table.get(page_width, page_length, 8, Imposition.WORK_AND_TURN)
+    assert (entry.outs, entry.plate_count) == (2, 1)
+    assert table.get(page_width, page_length, 32).outs == 0
+
+    entries = table.get_booklet(page_width, page_length, 38)
+    assert [entry.pages for entry in entries] == [16, 16, 8]
+    assert sum([entry.get_sheet_count(1000) for entry in entries]) == 2500
+    assert sum([entry.plate_count for entry in entries]) == 6
+    with pytest.raises(ValueError):
+        table.get_booklet(to_um(40, 'inch'), page_length, 4)
+
+
+def test_costing_kernel(db):
+    stock_quantities = CostingKernel.get_stock_quantities([100, 2500, 2501], 4)
+    assert list(stock_quantities) == [25, 625, 626]
+    # 10% of 2500 is exactly 250, which floats would round up to 251
+    assert list(CostingKernel.get_spoilage_quantities([2500, 2501], Decimal('10.00'))) == [250, 251]
+    assert list(CostingKernel.get_spoilage_quantities([2500], 0)) == [0]
+
+    durations = CostingKernel.get_durations([4000, 20000], 2000, 0.5, 0.5)
+    assert [round(float(duration), 2) for duration in durations] == [3.0, 12.0]
+    assert list(CostingKernel.get_durations([3000], 2000, contingency=10)) == [3000 / 2000 * 1.1]
@@ -1,6 +1,15 @@
 import math, copy
+import numpy as np
+from django.conf import settings
 from django.db import models
-from core.utils.shapes import Rectangle
+from core.utils.shapes import Rectangle, Polygon
+from core.utils.binpacker import BinPacker
+from core.utils.cutplanner import CutPlanner
+from core.utils.cache import LRUCache
+from core.utils.gangplanner import GangPlanner
+from core.utils.imposition import Imposition
+from core.utils.geometry import UNIT_FACTORS, to_um, from_um, to_distance, area_from_um
+from core.utils.layoutpool import get_layout_pool, is_parallel
 from core.utils.measures import Measure, CostingMeasure, Quantity
 from measurement.measures import Distance, Area
 from polymorphic.models import PolymorphicModel
@@ -61,6 +70,70 @@ class PressMachine(Machine):
         null=False, blank=False)
     material_type = Item.PAPER
 
+    class Constraints:
+        # Limits of a press in integer micrometres, see core.utils.geometry.
+        # Compiled once per saved version of a machine and never changed.
+        __slots__ = ('min_width', 'max_width', 'min_length', 'max_length', 
+            'min_breakpoint_length', 'max_breakpoint_length', 'make_ready_spoilage_length',
+            'margin_x', 'margin_y')
+
+        def __init__(self, **kwargs):
+            for name in PressMachine.Constraints.__slots__:
+                object.__setattr__(self, name, kwargs.get(name, 0))
+
+        def __setattr__(self, name, value):
+            raise AttributeError("Cannot set '%s' on Constraints" % name)
+
+        @property
+        def min_printable_width(self):
+            return self.min_width - (self.margin_x * 2)
+
+        @property
+        def max_printable_width(self):
+            return self.max_width - (self.margin_x * 2)
+
+    constraints_cache = LRUCache(getattr(settings, 'MACHINE_CONSTRAINTS_CACHE_SIZE', 256))
+    imposition_cache = LRUCache(getattr(settings, 'MACHINE_CONSTRAINTS_CACHE_SIZE', 256))
+
+    def compile_constraints(self):
+        return PressMachine.Constraints()
+
+    # The limit fields the constraints are compiled from
+    @property
+    def constraints_version(self):
+        return ()
+
+    # Constraints are cached by machine and version, so that layouts of a 
+    # machine do not convert its limits on every call
+    @property
+    def constraints(self):
+        key = (self.pk, self.constraints_version)
+        constraints = PressMachine.constraints_cache.get(key)
+        if constraints is None:
+            constraints = self.compile_constraints()
+            PressMachine.constraints_cache.put(key, constraints)
+        return constraints
+
+    # Signature layouts on the largest printable sheet of the machine, 
+    # cached by machine and version like the constraints
+    @property
+    def imposition_table(self):
+        key = (self.pk, self.constraints_version)
+        table = PressMachine.imposition_cache.get(key)
+        if table is None:
+            constraints = self.constraints
+            table = Imposition.Table(constraints.max_printable_width, 
+                constraints.max_length or constraints.max_breakpoint_length)
+            PressMachine.imposition_cache.put(key, table)
+        return table
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        for cache in [PressMachine.constraints_cache, PressMachine.imposition_cache]:
+            for (key, value) in cache.items():
+                if key[0] == self.pk and key[1] != self.constraints_version:
+                    cache.pop(key)
+
     # Get sheet layout given the following:
     # raw_material_layout - the layout of the raw material
     # final_material_layout - the layout of the final material after converting the raw material
@@ -128,59 +201,96 @@ class RollFedPressMachine(PressMachine):
     def max_printable_width_measurement(self):
         return self._to_measurement(self.max_printable_width)
 
-    def _validate_raw_material(self, material_layout):
-        # returns width, length where length is always the longer dimension
-        def _get_material_dimensions(material_layout):
-            width, length = ((material_layout.width_measurement, material_layout.length_measurement)
-                if material_layout.length > material_layout.width 
-                else (material_layout.length_measurement, material_layout.width_measurement))
-            return width, length
+    @property
+    def constraints_version(self):
+        return (self.uom, self.min_sheet_width, self.max_sheet_width, 
+            self.min_sheet_breakpoint_length, self.max_sheet_breakpoint_length,
+            self.make_ready_spoilage_length, self.horizontal_margin, self.vertical_margin)
+
+    def compile_constraints(self):
+        return PressMachine.Constraints(
+            min_width=to_um(self.min_sheet_width, self.uom),
+            max_width=to_um(self.max_sheet_width, self.uom),
+            min_breakpoint_length=to_um(self.min_sheet_breakpoint_length, self.uom),
+            max_breakpoint_length=to_um(self.max_sheet_breakpoint_length, self.uom),
+            make_ready_spoilage_length=to_um(self.make_ready_spoilage_length, self.uom),
+            margin_x=to_um(self.horizontal_margin, self.uom),
+            margin_y=to_um(self.vertical_margin, self.uom))
 
-        width, length = _get_material_dimensions(material_layout)
+    def _validate_raw_material(self, material_layout):
+        # width, length where length is always the longer dimension
+        constraints = self.constraints
+        width, length = sorted([to_um(material_layout.width, material_layout.uom),
+            to_um(material_layout.length, material_layout.uom)])
 
-        if length < self.min_breakpoint_length_measurement:
+        if length < constraints.min_breakpoint_length:
             raise ValueError('length of material cannot be lesser than the minimum breakpoint length.',
-                length, 'vs.', self.min_breakpoint_length_measurement)
+                to_distance(length, material_layout.uom), 'vs.', 
+                self.min_breakpoint_length_measurement)
 
-        if getattr(width, self.uom) < self.min_sheet_width:
+        if width < constraints.min_width:
             raise ValueError('width of material cannot be lesser than the minimum sheet width.',
-                width, 'vs.', self.min_sheet_width)
+                to_distance(width, material_layout.uom), 'vs.', self.min_sheet_width)
 
-        if getattr(width, self.uom) > self.max_sheet_width:
+        if width > constraints.max_width:
             raise ValueError('width of material cannot be greather than the maximum sheet width.',
-                width, 'vs.', self.max_sheet_width)
+                to_distance(width, material_layout.uom), 'vs.', self.max_sheet_width)
 
     def get_layouts_meta(self, final_material_layout, raw_material_layout, rotate=False, 
             order_quantity=1, spoilage_rate=0, apply_breakpoint=False):
+        runsheet_to_final_layouts = self.get_layouts_meta_for_quantities(final_material_layout,
+            raw_material_layout, [order_quantity], spoilage_rate, apply_breakpoint)[0]
         
+        return runsheet_to_final_layouts, Machine.ROLL_FED_PRESS
+
+    # Runsheet width and final material length, in the machine uom, and the 
+    # final material area in square micrometres, which hold for every quantity
+    def _get_runsheet_sizes(self, final_material_layout, raw_material_layout):
         if final_material_layout.width == 0:
             raise ValueError('Final material layout width should not be equal to zero')
 
         self._validate_raw_material(raw_material_layout)
+        constraints = self.constraints
 
-        def _get_runsheet_layouts(quantity):
-            def _get_runsheet_width(final_material_width):
-                printable_width = raw_material_layout.width_measurement - (self.margin_x_measurement*2)
-                count = round(printable_width / final_material_width, 4)
-                return math.floor(count) * final_material_width
+        def _get_runsheet_width(final_material_width):
+            printable_width = to_um(raw_material_layout.width, raw_material_layout.uom) - \
+                (constraints.margin_x * 2)
+            count = printable_width // final_material_width if final_material_width > 0 else 0
+            return max(count, 0) * final_material_width
+
+        final_width, final_length, final_uom = final_material_layout.get_pack_size_as_rect()
+        final_width, final_length = to_um(final_width, final_uom), to_um(final_length, final_uom)
+        runsheet_width = from_um(_get_runsheet_width(final_width), self.uom)
+        final_material_length = from_um(final_length, self.uom)
 
-            def _create_layout(width, length, uom):
-                layout = Rectangle.Layout(width=width, length=length, uom=uom)
-                return layout
+        if runsheet_width == 0:
+            raise ValueError('Final sheet width does not fit within the printable area of the raw material.')
+        
+        final_material_area = to_um(final_material_layout.width, final_material_layout.uom) * \
+            to_um(final_material_layout.length, final_material_layout.uom)
+        return round(runsheet_width, 4), round(final_material_length, 4), final_material_area
+
+    # Returns the layouts of every order quantity. Only the runsheet length 
+    # depends on the quantity, so the runsheet width and the cutsheet grid are 
+    # worked out once; the runsheet-to-cutsheet layouts are plain grids built
+    # in closed form, see Rectangle.get_layout.
+    def get_layouts_meta_for_quantities(self, final_material_layout, raw_material_layout, 
+            order_quantities, spoilage_rate=0, apply_breakpoint=False):
+        runsheet_width, final_material_length, final_material_area = \
+            self._get_runsheet_sizes(final_material_layout, raw_material_layout)
+        constraints = self.constraints
+        min_breakpoint_length = from_um(constraints.min_breakpoint_length, self.uom)
+        max_breakpoint_length = from_um(constraints.max_breakpoint_length, self.uom)
+
+        def _create_layout(width, length, uom):
+            layout = Rectangle.Layout(width=width, length=length, uom=uom)
+            return layout
+
+        layout_limit = 100
 
+        def _get_runsheet_layouts(quantity):
             quantity = float(quantity)
-            runsheet_width_measurement = _get_runsheet_width(
-                final_material_layout.total_width_measurement)
-            runsheet_width = getattr(runsheet_width_measurement, self.uom)
-            final_material_length = getattr(final_material_layout.total_length_measurement, self.uom)
-
-            if runsheet_width == 0:
-                raise ValueError('Final sheet width does not fit within the printable area of the raw material.')
-            
-            runsheet_width = round(runsheet_width, 4)
-            final_material_length = round(final_material_length, 4)
-            total_item_area_measurement = final_material_layout.area_measurement * quantity
-            total_item_area = getattr(total_item_area_measurement, 'sq_%s' % self.uom)
+            total_item_area = area_from_um(final_material_area * quantity, self.uom)
             total_item_length = (round(total_item_area, 4) / runsheet_width)
 
             # Round up to the nearest final material length multiple        
@@ -189,16 +299,16 @@ class RollFedPressMachine(PressMachine):
             layouts = []
 
             if apply_breakpoint:
-                if self.min_sheet_breakpoint_length > total_item_length:
-                    runsheet_length = self.min_sheet_breakpoint_length
-                elif total_item_length > self.max_sheet_breakpoint_length:
-                    runsheet_length = self.max_sheet_breakpoint_length
+                if min_breakpoint_length > total_item_length:
+                    runsheet_length = min_breakpoint_length
+                elif total_item_length > max_breakpoint_length:
+                    runsheet_length = max_breakpoint_length
                 
                 if total_item_length > runsheet_length:
                     remainder_length = total_item_length % runsheet_length
                     if remainder_length > 0:
-                        if self.min_sheet_breakpoint_length > remainder_length:
-                            remainder_length = self.min_sheet_breakpoint_length
+                        if min_breakpoint_length > remainder_length:
+                            remainder_length = min_breakpoint_length
                         remainder_rect = _create_layout(runsheet_width, 
                             remainder_length, self.uom)
                         remainder_layout = Rectangle.get_layout(remainder_rect, 
@@ -206,7 +316,6 @@ class RollFedPressMachine(PressMachine):
                             False, 'Runsheet-to-cutsheet-remainder')
                         layouts.append(remainder_layout)
 
-            layout_limit = 100
             runsheet_layout = _create_layout(runsheet_width, runsheet_length, self.uom)
             runsheet_to_cutsheet = Rectangle.get_layout(runsheet_layout, 
                 final_material_layout, False, 'Runsheet-to-cutsheet', 
@@ -220,10 +329,54 @@ class RollFedPressMachine(PressMachine):
             layouts.insert(0, parent_to_runsheet)
             return layouts     
 
-        quantity = order_quantity * (1+(spoilage_rate/100))
-        runsheet_to_final_layouts = _get_runsheet_layouts(quantity)
-        
-        return runsheet_to_final_layouts, Machine.ROLL_FED_PRESS
+        return [_get_runsheet_layouts(order_quantity * (1+(spoilage_rate/100)))
+            for order_quantity in order_quantities]
+
+    # Closed form of get_layouts_meta_for_quantities, without breakpoints, for
+    # dense ranges of order quantities. The runsheet lengths are worked out on
+    # arrays; as the runsheet-to-cutsheet layouts are straight grids, and the
+    # runsheets are laid out on the raw material row by row, their counts and
+    # cut counts follow from the lengths without packing or caching a layout
+    # per quantity. Returns arrays of the runsheet lengths in the machine uom,
+    # the runsheets per raw material, the cutsheets per runsheet and the cut
+    # counts of both layouts.
+    def get_runs_for_quantities(self, final_material_layout, raw_material_layout,
+            order_quantities, spoilage_rate=0):
+        runsheet_width, final_material_length, final_material_area = \
+            self._get_runsheet_sizes(final_material_layout, raw_material_layout)
+        factor = UNIT_FACTORS[self.uom]
+
+        quantities = [float(order_quantity * (1+(spoilage_rate/100)))
+            for order_quantity in order_quantities]
+        # Areas are rounded half to even on their decimal value, as
+        # get_layouts_meta_for_quantities does and numpy does not
+        total_item_areas = np.array([round(area_from_um(final_material_area * quantity,
+            self.uom), 4) for quantity in quantities], dtype=float)
+        quantities = np.array(quantities, dtype=float)
+        runsheet_lengths = total_item_areas / runsheet_width
+        runsheet_lengths -= np.remainder(runsheet_lengths, -final_material_length)
+
+        raw_width, raw_length, raw_uom = raw_material_layout.get_pack_size_as_bin()
+        final_width, final_length, final_uom = final_material_layout.get_pack_size_as_rect()
+        raw_width, raw_length = to_um(raw_width, raw_uom), to_um(raw_length, raw_uom)
+        final_width, final_length = to_um(final_width, final_uom), to_um(final_length, final_uom)
+        width, lengths = to_um(runsheet_width, self.uom), np.rint(runsheet_lengths * factor)
+
+        cutsheets = BinPacker.evaluate_batch(width, lengths, final_width, final_length)
+        estimated_runsheet_counts = np.ceil(quantities / np.maximum(cutsheets['count'], 1))
+        cols = BinPacker.fit(raw_width, width)
+        rows = np.where(lengths > 0, raw_length // np.maximum(lengths, 1), 0)
+        runsheet_counts = np.minimum(estimated_runsheet_counts, cols * rows)
+        runsheet_cut_counts = CutPlanner.count_grids(raw_width, raw_length, width, lengths,
+            cols, rows, estimated_runsheet_counts)
+
+        return {
+            'runsheet_length': runsheet_lengths,
+            'runsheet_count': runsheet_counts.astype(np.int64),
+            'cutsheet_count': cutsheets['count'],
+            'runsheet_cut_count': runsheet_cut_counts,
+            'cutsheet_cut_count': cutsheets['cut_count']
+        }
 
 
 class SheetFedPressMachine(PressMachine):
@@ -233,35 +386,244 @@ class SheetFedPressMachine(PressMachine):
     max_sheet_width = models.FloatField(default=0)
     uom = models.CharField(max_length=30, default='mm',
         choices=Measure.UNITS[Measure.DISTANCE])
-    
-    def get_layouts_meta(self, final_material_layout, raw_material_layout, rotate=False):
-        # Dirty workaround for the floating point-number lossy 
-        # implementation in python-measurements package
-        def _is_gte(x, y):
-            return x.mm > y.mm or math.isclose(x.mm, y.mm)
 
-        def _get_attr(obj, attr):
-            return getattr(obj, attr) if hasattr(obj, attr) else 0
+    GREEDY = 'Greedy'
+    EXHAUSTIVE = 'Exhaustive'
+    STRATEGIES = [
+        (GREEDY, 'Greedy'),
+        (EXHAUSTIVE, 'Exhaustive')
+    ]
+    # Maximum number of equal splits tried along each side of the raw material
+    MAX_SPLITS = 12
+
+    @property
+    def constraints_version(self):
+        return (self.uom, self.min_sheet_width, self.max_sheet_width, 
+            self.min_sheet_length, self.max_sheet_length)
+
+    def compile_constraints(self):
+        return PressMachine.Constraints(
+            min_width=to_um(self.min_sheet_width, self.uom),
+            max_width=to_um(self.max_sheet_width, self.uom),
+            min_length=to_um(self.min_sheet_length, self.uom),
+            max_length=to_um(self.max_sheet_length, self.uom))
+
+    class RunsheetSplit:
+        def __init__(self, layouts_meta, greedy_layouts_meta, candidates=0, evaluated=0):
+            self.layouts_meta = layouts_meta
+            self.greedy_layouts_meta = greedy_layouts_meta
+            self.candidates = candidates
+            self.evaluated = evaluated
+
+        @classmethod
+        def get_count(cls, layouts_meta):
+            return layouts_meta[0].count * layouts_meta[1].count
+
+        @property
+        def count(self):
+            return self.get_count(self.layouts_meta)
+
+        @property
+        def greedy_count(self):
+            return self.get_count(self.greedy_layouts_meta)
+
+        @property
+        def improvement(self):
+            return self.count - self.greedy_count
 
-        def _to_distance(value, uom):
-            return Distance(**{uom: value})
+        @property
+        def improvement_rate(self):
+            if self.greedy_count == 0:
+                return 0
+            return round(self.improvement / self.greedy_count * 100, 2)
+
+    class GangLayout:
+        class Job:
+            def __init__(self, layout, quantity, count, run_length):
+                self.layout = layout
+                self.quantity = quantity
+                self.count = count
+                self.run_length = run_length
+
+            @property
+            def produced(self):
+                return self.count * self.run_length
+
+            @property
+            def overs(self):
+                return self.produced - self.quantity
+
+        def __init__(self, parent_to_runsheet, jobs, layouts, run_length, evaluated=0):
+            self.parent_to_runsheet = parent_to_runsheet
+            self.jobs = jobs
+            self.layouts = layouts
+            self.run_length = run_length
+            self.evaluated = evaluated
+
+        @property
+        def runsheet(self):
+            return self.parent_to_runsheet.rect
+
+        @property
+        def count(self):
+            return len(self.layouts)
+
+        # Raw material sheets cut into the runsheets of the run
+        @property
+        def sheet_count(self):
+            return math.ceil(self.run_length / max(self.parent_to_runsheet.count, 1))
+
+        @property
+        def usage(self):
+            width, length, uom = self.runsheet.get_pack_size_as_bin()
+            area = to_um(width, uom) * to_um(length, uom)
+            used = sum([to_um(layout.width, layout.uom) * to_um(layout.length, layout.uom)
+                for layout in self.layouts])
+            return round(used / area * 100, 2) if area > 0 else 0
+
+    # With parallel, the orientations are packed at once in the layout pool
+    # before being compared; it defaults to is_parallel of the two orientations.
+    # The exhaustive strategy searches all runsheet splits, see get_runsheet_split.
+    def get_layouts_meta(self, final_material_layout, raw_material_layout, rotate=False,
+            guillotine=False, parallel=None, strategy=GREEDY):
+        if strategy == SheetFedPressMachine.EXHAUSTIVE:
+            runsheet_split = self.get_runsheet_split(final_material_layout, 
+                raw_material_layout, rotate, guillotine)
+            return runsheet_split.layouts_meta, Machine.SHEET_FED_PRESS
+
+        orientations = [
+            (raw_material_layout.width, raw_material_layout.length, raw_material_layout.uom),
+            (raw_material_layout.length, raw_material_layout.width, raw_material_layout.uom)]
+        tasks = [(width, length, uom, final_material_layout, rotate, guillotine)
+            for (width, length, uom) in orientations]
+
+        if parallel is None:
+            parallel = is_parallel(tasks)
+        if parallel:
+            get_layout_pool().warm(self.get_orientation_layouts_meta, tasks)
+
+        return_layouts_meta = None
+        return_child_count = 0
+        for task in tasks:
+            layouts_meta = self.get_orientation_layouts_meta(*task)
+            child_count = layouts_meta[0].count * layouts_meta[1].count
+            # The first orientation wins ties
+            if return_layouts_meta is None or child_count > return_child_count:
+                return_layouts_meta = layouts_meta
+                return_child_count = child_count
+
+        return return_layouts_meta, Machine.SHEET_FED_PRESS
+
+    # Enumerates the runsheet sizes the press takes, in both orientations of the
+    # raw material: equal splits of each side, press-max strips and what remains
+    # of the raw material after one. Candidates are ranked by the closed-form
+    # estimate of the batch evaluator and then packed, skipping those whose area
+    # bound cannot beat the best total outs per raw sheet found so far.
+    # The greedy choice is evaluated first, so the result is never worse.
+    def get_runsheet_split(self, final_material_layout, raw_material_layout, 
+            rotate=False, guillotine=False):
+        def _get_sizes(side, machine_min, machine_max):
+            splits = min(side // max(machine_min, 1), SheetFedPressMachine.MAX_SPLITS)
+            sizes = set([side // i for i in range(1, max(splits, 1) + 1)])
+            sizes.update([machine_max, side - machine_max])
+            return [size for size in sizes 
+                if machine_min <= size <= min(side, machine_max) and size > 0]
+
+        def _fits(width, length):
+            return (width >= final_width and length >= final_length) or \
+                (rotate and width >= final_length and length >= final_width)
+
+        constraints = self.constraints
+        raw_uom = raw_material_layout.uom
+        final_width, final_length, final_uom = final_material_layout.get_pack_size_as_rect()
+        final_width, final_length = to_um(final_width, final_uom), to_um(final_length, final_uom)
+        final_area = final_width * final_length
+        if final_area == 0:
+            raise ValueError('Final material layout width should not be equal to zero')
+
+        greedy_layouts_meta = None
+        candidates = {}
+        for (raw_width, raw_length) in [
+                (raw_material_layout.width, raw_material_layout.length),
+                (raw_material_layout.length, raw_material_layout.width)]:
+            layouts_meta = self.get_orientation_layouts_meta(raw_width, raw_length, raw_uom, 
+                final_material_layout, rotate, guillotine)
+            if greedy_layouts_meta is None or SheetFedPressMachine.RunsheetSplit.get_count(
+                    layouts_meta) > SheetFedPressMachine.RunsheetSplit.get_count(greedy_layouts_meta):
+                greedy_layouts_meta = layouts_meta
+
+            width, length = to_um(raw_width, raw_uom), to_um(raw_length, raw_uom)
+            for rs_width in _get_sizes(width, constraints.min_width, constraints.max_width):
+                for rs_length in _get_sizes(length, constraints.min_length, 
+                        constraints.max_length):
+                    if _fits(rs_width, rs_length):
+                        candidates[(width, length, rs_width, rs_length)] = \
+                            (width * length // (rs_width * rs_length)) * \
+                            (rs_width * rs_length // final_area)
+
+        keys = list(candidates.keys())
+        raw_layouts = [Rectangle.Layout(width=from_um(width, raw_uom), 
+            length=from_um(length, raw_uom), uom=raw_uom) for (width, length, x, y) in keys]
+        runsheet_layouts = [ParentSheet.Layout(width=from_um(rs_width, raw_uom), 
+            length=from_um(rs_length, raw_uom), uom=raw_uom) for (x, y, rs_width, rs_length) in keys]
+        estimates = {}
+        if len(keys) > 0:
+            parent_estimates = Rectangle.get_layouts_batch(raw_layouts, runsheet_layouts, rotate)
+            child_estimates = Rectangle.get_layouts_batch(runsheet_layouts, 
+                [final_material_layout], rotate)
+            estimates = {key: parent.count * child.count for (key, parent, child) 
+                in zip(keys, parent_estimates, child_estimates)}
+
+        best_layouts_meta = greedy_layouts_meta
+        best_count = SheetFedPressMachine.RunsheetSplit.get_count(greedy_layouts_meta)
+        evaluated = 0
+        for key in sorted(keys, key=lambda key: (-estimates[key], -candidates[key])):
+            if candidates[key] <= best_count:
+                continue
+            width, length, rs_width, rs_length = key
+            layouts_meta = self.get_runsheet_layouts_meta(from_um(width, raw_uom), 
+                from_um(length, raw_uom), raw_uom, from_um(rs_width, raw_uom), 
+                from_um(rs_length, raw_uom), final_material_layout, rotate, guillotine)
+            evaluated += 1
+            count = SheetFedPressMachine.RunsheetSplit.get_count(layouts_meta)
+            if count > best_count:
+                best_layouts_meta = layouts_meta
+                best_count = count
+
+        return SheetFedPressMachine.RunsheetSplit(best_layouts_meta, greedy_layouts_meta,
+            len(keys), evaluated)
+
+    # Returns the parent-to-runsheet and runsheet-to-cutsheet layouts
+    # of a raw material of the given width and length
+    def get_orientation_layouts_meta(self, raw_width, raw_length, raw_uom,
+            final_material_layout, rotate=False, guillotine=False):
+        rs_width, rs_length = self.get_greedy_runsheet_size(raw_width, raw_length, raw_uom,
+            final_material_layout, rotate)
+        return self.get_runsheet_layouts_meta(raw_width, raw_length, raw_uom,
+            rs_width, rs_length, final_material_layout, rotate, guillotine)
+
+    # Picks the runsheet size by halving the raw material until it fits the press.
+    # Returns width, length in the uom of the raw material.
+    def get_greedy_runsheet_size(self, raw_width, raw_length, raw_uom,
+            final_material_layout, rotate=False):
+        # Lengths are compared in integer micrometres. Halves are 
+        # compared by doubling the other side so they stay exact.
+        constraints = self.constraints
 
         def _get_length(length, uom, m_length_value=0, m_length_uom='inch'):
             runsheet_length_base = length
-            input_length = _to_distance(length, uom)
-            machine_max_length = _to_distance(self.max_sheet_length, self.uom)
-            machine_min_length = _to_distance(self.min_sheet_length, self.uom)
-            material_length = _to_distance(m_length_value, m_length_uom)
-
-            if input_length.mm > machine_max_length.mm:
-                halved_input_length = input_length / 2
-                if _is_gte(material_length, halved_input_length):
-                    runsheet_length_base = _get_attr(material_length, uom)
-                elif _is_gte(machine_max_length, halved_input_length) and \
-                        _is_gte(halved_input_length, machine_min_length):
+            input_length = to_um(length, uom)
+            machine_max_length = constraints.max_length
+            machine_min_length = constraints.min_length
+            material_length = to_um(m_length_value, m_length_uom)
+
+            if input_length > machine_max_length:
+                if material_length * 2 >= input_length:
+                    runsheet_length_base = from_um(material_length, uom)
+                elif machine_max_length * 2 >= input_length >= machine_min_length * 2:
                     runsheet_length_base = length / 2
-                elif machine_max_length.mm > halved_input_length.mm > material_length.mm:
-                    runsheet_length_base = _get_attr(machine_max_length, uom)
+                elif machine_max_length * 2 > input_length > material_length * 2:
+                    runsheet_length_base = from_um(machine_max_length, uom)
                 else:
                     runsheet_length_base = _get_length(length/2, uom)
                     
@@ -270,74 +632,118 @@ class SheetFedPressMachine(PressMachine):
         def _get_width(width, uom, rs_length_value=0, rs_length_uom='inch',
                 m_width_value=0, m_width_uom='inch'):
             runsheet_width_base = width
-            runsheet_length = _to_distance(rs_length_value, rs_length_uom)
-            input_width = _to_distance(width, uom)
-            machine_max_width = _to_distance(self.max_sheet_width, self.uom)
-            machine_min_width = _to_distance(self.min_sheet_width, self.uom)
-            material_width = _to_distance(m_width_value, m_width_uom)
-
-            if input_width.mm > machine_max_width.mm:
-                halved_input_width = input_width / 2
+            runsheet_length = to_um(rs_length_value, rs_length_uom)
+            input_width = to_um(width, uom)
+            machine_max_width = constraints.max_width
+            machine_min_width = constraints.min_width
+            material_width = to_um(m_width_value, m_width_uom)
+
+            if input_width > machine_max_width:
                 input_width_less_rs_length = input_width - runsheet_length
-                if _is_gte(material_width, halved_input_width):
-                    runsheet_width_base = _get_attr(material_width, uom)
-                elif _is_gte(machine_max_width, halved_input_width) and \
-                        _is_gte(halved_input_width, machine_min_width) and \
-                        input_width_less_rs_length.mm > halved_input_width.mm:
+                if material_width * 2 >= input_width:
+                    runsheet_width_base = from_um(material_width, uom)
+                elif machine_max_width * 2 >= input_width >= machine_min_width * 2 and \
+                        input_width_less_rs_length * 2 > input_width:
                     runsheet_width_base = width / 2
-                elif rotate and input_width_less_rs_length.mm > 0 and \
-                        _is_gte(machine_max_width, input_width_less_rs_length) and \
-                        _is_gte(input_width_less_rs_length, machine_min_width):
+                elif rotate and input_width_less_rs_length > 0 and \
+                        machine_max_width >= input_width_less_rs_length >= machine_min_width:
                     runsheet_width_base = width - rs_length_value
-                elif machine_max_width.mm > halved_input_width.mm > material_width.mm:
-                    runsheet_width_base = _get_attr(machine_max_width, uom)
+                elif machine_max_width * 2 > input_width > material_width * 2:
+                    runsheet_width_base = from_um(machine_max_width, uom)
                 else:
                     runsheet_width_base = _get_width(width/2, uom)
                     
             return runsheet_width_base
         
-        def _create_parentsheet_layout(width, length, uom):
-            return ParentSheet.Layout(width=width, length=length, uom=uom)
-
-        def _get_parentsheet_layout_meta(item_width, item_length, item_uom, 
-                material_width, material_length, material_uom):
-            rs_length = _get_length(item_length, item_uom, material_length, material_uom)
-            rs_width = _get_width(item_width, item_uom, rs_length, item_uom, 
-                material_width, material_uom)
-            item_layout = Rectangle.Layout(width=item_width, length=item_length, uom=item_uom)
-            parent_layout = _create_parentsheet_layout(rs_width, rs_length, item_uom)
-            layout_meta = ParentSheet.get_layout(item_layout, parent_layout, rotate, 'Parent-to-runsheet')
-            return layout_meta
-
-        def _rotate_material(child_layout):
-            if child_layout is not None:
-                return ChildSheet.Layout(
-                    margin_top=child_layout.margin_right, margin_right=child_layout.margin_bottom,
-                    margin_bottom=child_layout.margin_left, margin_left=child_layout.margin_top,
-                    width=child_layout.length, length=child_layout.width, uom=child_layout.uom, 
-                    is_rotated=True)
-
-        item_to_parent_layout_meta = _get_parentsheet_layout_meta(
-            raw_material_layout.width, raw_material_layout.length, raw_material_layout.uom, 
-            final_material_layout.width, final_material_layout.length, final_material_layout.uom)
+        rs_length = _get_length(raw_length, raw_uom, 
+            final_material_layout.length, final_material_layout.uom)
+        rs_width = _get_width(raw_width, raw_uom, rs_length, raw_uom, 
+            final_material_layout.width, final_material_layout.uom)
+        return rs_width, rs_length
+
+    def get_runsheet_layouts_meta(self, raw_width, raw_length, raw_uom, 
+            rs_width, rs_length, final_material_layout, rotate=False, guillotine=False):
+        item_layout = Rectangle.Layout(width=raw_width, length=raw_length, uom=raw_uom)
+        parent_layout = ParentSheet.Layout(width=rs_width, length=rs_length, uom=raw_uom)
+        item_to_parent_layout_meta = ParentSheet.get_layout(item_layout, parent_layout, 
+            rotate, 'Parent-to-runsheet', guillotine)
         parent_to_child_layout_meta = ChildSheet.get_layout(
-            item_to_parent_layout_meta.rect, final_material_layout, rotate, 'Runsheet-to-cutsheet')
-        child_count = item_to_parent_layout_meta.count * parent_to_child_layout_meta.count
-
-        rotated_item_to_parent_layout_meta = _get_parentsheet_layout_meta(
-            raw_material_layout.length, raw_material_layout.width, raw_material_layout.uom,
-            final_material_layout.width, final_material_layout.length, final_material_layout.uom)
-        rotated_parent_to_child_layout_meta = ChildSheet.get_layout(
-            rotated_item_to_parent_layout_meta.rect, final_material_layout, rotate, 'Runsheet-to-cutsheet')
-        rotated_child_count = rotated_item_to_parent_layout_meta.count * rotated_parent_to_child_layout_meta.count
-
-        return_layouts_meta = [item_to_parent_layout_meta, parent_to_child_layout_meta]
-
-        if child_count < rotated_child_count:
-            return_layouts_meta = [rotated_item_to_parent_layout_meta, 
-                rotated_parent_to_child_layout_meta]
-
-        return return_layouts_meta, Machine.SHEET_FED_PRESS
+            item_to_parent_layout_meta.rect, final_material_layout, rotate, 
+            'Runsheet-to-cutsheet', guillotine)
+
+        return [item_to_parent_layout_meta, parent_to_child_layout_meta]
+
+    # Gangs final sizes with their quantities on the runsheets of a raw material,
+    # in the orientation of the raw material needing the fewest sheets, see
+    # GangPlanner. The runsheet is the greedy one of the largest final size.
+    def get_gang_layout(self, final_material_layouts, quantities, raw_material_layout,
+            rotate=False):
+        # Copies of a job are numbered by the index of the job
+        def __to_child__(layout, i, x, y, is_rotated, uom):
+            child = copy.copy(layout)
+            child.i = i
+            child.x = from_um(x, uom)
+            child.y = from_um(y, uom)
+            if is_rotated:
+                child.is_rotated = True
+                child.width, child.length = layout.length, layout.width
+                if isinstance(child, ChildSheet.Layout):
+                    child.margin_top, child.margin_right, child.margin_bottom, \
+                        child.margin_left = (layout.margin_right, layout.margin_bottom, 
+                            layout.margin_left, layout.margin_top)
+            return child
+
+        if len(final_material_layouts) != len(quantities):
+            raise ValueError('Every final material layout must have a quantity.')
+        if len(final_material_layouts) == 0:
+            raise ValueError('At least one final material layout is required.')
+
+        raw_uom = raw_material_layout.uom
+        largest = max(final_material_layouts, key=lambda layout: 
+            to_um(layout.width, layout.uom) * to_um(layout.length, layout.uom))
+        best = None
+
+        for (raw_width, raw_length) in [
+                (raw_material_layout.width, raw_material_layout.length),
+                (raw_material_layout.length, raw_material_layout.width)]:
+            rs_width, rs_length = self.get_greedy_runsheet_size(raw_width, raw_length, 
+                raw_uom, largest, rotate)
+            item_layout = Rectangle.Layout(width=raw_width, length=raw_length, uom=raw_uom)
+            parent_layout = ParentSheet.Layout(width=rs_width, length=rs_length, uom=raw_uom)
+            parent_to_runsheet = ParentSheet.get_layout(item_layout, parent_layout, 
+                rotate, 'Parent-to-runsheet')
+            if parent_to_runsheet.count == 0:
+                continue
+
+            runsheet = parent_to_runsheet.rect
+            jobs = []
+            for (layout, quantity) in zip(final_material_layouts, quantities):
+                width, length, uom = layout.get_pack_size_as_rect()
+                # No job takes more copies than on a runsheet of its own
+                limit = ChildSheet.get_layout(runsheet, layout, rotate).count
+                jobs.append(GangPlanner.Job(to_um(width, uom), to_um(length, uom), 
+                    quantity, limit))
+
+            bin_width, bin_length, bin_uom = runsheet.get_pack_size_as_bin()
+            try:
+                plan = GangPlanner.plan(to_um(bin_width, bin_uom), to_um(bin_length, bin_uom), 
+                    jobs, rotate)
+            except ValueError:
+                continue
+
+            layouts = [__to_child__(final_material_layouts[i], i, x, y, is_rotated, bin_uom) 
+                for (x, y, width, length, i, is_rotated) in plan.rects]
+            gang_layout = SheetFedPressMachine.GangLayout(parent_to_runsheet, 
+                [SheetFedPressMachine.GangLayout.Job(layout, quantity, count, plan.run_length)
+                    for (layout, quantity, count) 
+                    in zip(final_material_layouts, quantities, plan.counts)],
+                layouts, plan.run_length, plan.evaluated)
+            if best is None or gang_layout.sheet_count < best.sheet_count:
+                best = gang_layout
+
+        if best is None:
+            raise ValueError('The final material layouts do not fit together on a runsheet.')
+        return best
 
 
 class ParentSheet:
@@ -369,13 +775,14 @@ class ParentSheet:
     # layouts, count, usage, wastage, indices of rotated rectangles
     @classmethod
     def get_layout(cls, rect_layout:Rectangle, parent_layout:'ParentSheet.Layout', 
-            rotate=False, name=None):
-        layouts = []
+            rotate=False, name=None, guillotine=False):
         layout_meta = Rectangle.get_layout(
-            rect_layout, parent_layout, rotate, name)
+            rect_layout, parent_layout, rotate, name, guillotine=guillotine)
+        # Layouts are built lazily, so keep the parent layout as it is now
+        parent_template = copy.copy(parent_layout)
 
-        for layout in layout_meta.layouts:
-            parent = copy.copy(parent_layout)
+        def __to_parent__(layout):
+            parent = copy.copy(parent_template)
             parent.i = layout.i 
             parent.x = layout.x 
             parent.y = layout.y 
@@ -389,11 +796,10 @@ class ParentSheet:
                 parent.padding_right = parent.padding_bottom
                 parent.padding_bottom = parent.padding_left
                 parent.padding_left = temp_padding
-            layouts.append(parent)
-
-        layout_meta.layouts = layouts
+            return parent
 
-        return layout_meta
+        layouts = layout_meta.layouts.map(__to_parent__)
+        return layout_meta.replace(layouts=layouts)
 
 
 class ChildSheet:
@@ -435,16 +841,19 @@ class ChildSheet:
     @classmethod
     def get_layout(cls, parent_layout:ParentSheet.Layout,
             child_layout:'ChildSheet.Layout', rotate=False, 
-            name='Parent-to-cutsheet'):
-        layouts = []
+            name='Parent-to-cutsheet', guillotine=False):
         layout_meta = Rectangle.get_layout(
-            parent_layout, child_layout, rotate, name)
+            parent_layout, child_layout, rotate, name, guillotine=guillotine)
+        # Layouts are built lazily, so keep the child layout as it is now
+        child_template = copy.copy(child_layout)
 
-        for layout in layout_meta.layouts:
-            child = copy.copy(child_layout)
+        def __to_child__(layout):
+            child = copy.copy(child_template)
             child.i = layout.i 
             child.x = layout.x 
             child.y = layout.y 
+            if isinstance(layout, Polygon.Layout):
+                child.angle = layout.angle
             if layout.is_rotated:
                 child.is_rotated = layout.is_rotated
                 child.width = layout.width 
@@ -455,8 +864,7 @@ class ChildSheet:
                     child.margin_right = child.margin_bottom
                     child.margin_bottom = child.margin_left
                     child.margin_left = temp
-            layouts.append(child)
-
-        layout_meta.layouts = layouts
+            return child
 
-        return layout_meta
\ No newline at end of file
+        layouts = layout_meta.layouts.map(__to_child__)
+        return layout_meta.replace(layouts=layouts)
\ No newline at end of file
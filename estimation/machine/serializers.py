@@ -3,6 +3,7 @@ from rest_polymorphic.serializers import PolymorphicSerializer
 from inventory.properties.models import Paper
 from core.utils.format import Inflect
 from core.utils.shapes import Rectangle, RectangleLayoutSerializer, RectangleLayoutMetaSerializer
+from core.utils.geometry import UNIT_FACTORS
 from estimation.models import Machine, SheetFedPressMachine, RollFedPressMachine, ParentSheet, ChildSheet
 from django.shortcuts import get_object_or_404
 
@@ -182,11 +183,27 @@ class SheetLayoutMetaSerializer(RectangleLayoutMetaSerializer):
     layouts = PolymorphicSheetLayoutSerializer(many=True)
 
 
+# Layouts to pack need a distance unit and a size
+def validate_sheet_layout(value):
+    if value.get('uom') not in UNIT_FACTORS:
+        raise serializers.ValidationError('%s is not a distance unit.' % value.get('uom'))
+    if value.get('width') <= 0 or value.get('length') <= 0:
+        raise serializers.ValidationError('Width and length must be greater than zero.')
+    return value
+
+
 class GetSheetLayoutSerializer(serializers.Serializer):
     material_layout = ChildSheetLayoutSerializer()
     item_layout = RectangleLayoutSerializer()
     bleed = serializers.BooleanField(default=False)
     rotate = serializers.BooleanField(default=False)
+    guillotine = serializers.BooleanField(default=False)
+
+    def validate_material_layout(self, value):
+        return validate_sheet_layout(value)
+
+    def validate_item_layout(self, value):
+        return validate_sheet_layout(value)
 
     def parse(self, validated_data):
         material_layout_data = validated_data.get('material_layout')
@@ -197,8 +214,126 @@ class GetSheetLayoutSerializer(serializers.Serializer):
 
         bleed = validated_data.get('bleed', False)
         rotate = validated_data.get('rotate', False)
+        guillotine = validated_data.get('guillotine', False)
+
+        return material_layout, item_layout, bleed, rotate, guillotine
+
+
+class GetSheetFedMachineSheetLayoutSerializer(GetSheetLayoutSerializer):
+    strategy = serializers.ChoiceField(choices=SheetFedPressMachine.STRATEGIES,
+        default=SheetFedPressMachine.GREEDY)
+
+    def parse(self, validated_data):
+        strategy = validated_data.get('strategy', SheetFedPressMachine.GREEDY)
+        return (*super().parse(validated_data), strategy)
 
-        return material_layout, item_layout, bleed, rotate
+
+class RunsheetSplitSerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    greedy_count = serializers.IntegerField()
+    improvement = serializers.IntegerField()
+    improvement_rate = serializers.FloatField()
+    candidates = serializers.IntegerField()
+    evaluated = serializers.IntegerField()
+
+
+class GetSheetFedMachineGangLayoutSerializer(serializers.Serializer):
+    material_layouts = ChildSheetLayoutSerializer(many=True)
+    quantities = serializers.ListField(child=serializers.IntegerField(min_value=1))
+    item_layout = RectangleLayoutSerializer()
+    rotate = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if len(data.get('material_layouts')) == 0:
+            raise serializers.ValidationError('At least one material layout is required.')
+        if len(data.get('material_layouts')) != len(data.get('quantities')):
+            raise serializers.ValidationError('Every material layout must have a quantity.')
+        return data
+
+    def parse(self, validated_data):
+        material_layouts = [ChildSheet.Layout(**x) 
+            for x in validated_data.get('material_layouts')]
+        quantities = validated_data.get('quantities')
+
+        item_layout_data = validated_data.get('item_layout')
+        item_layout = Rectangle.Layout(**item_layout_data)
+
+        rotate = validated_data.get('rotate', False)
+
+        return material_layouts, quantities, item_layout, rotate
+
+
+class GangLayoutJobSerializer(serializers.Serializer):
+    layout = PolymorphicSheetLayoutSerializer()
+    quantity = serializers.IntegerField()
+    count = serializers.IntegerField()
+    produced = serializers.IntegerField()
+    overs = serializers.IntegerField()
+
+
+class GangLayoutSerializer(serializers.Serializer):
+    parent_to_runsheet = SheetLayoutMetaSerializer()
+    runsheet = PolymorphicSheetLayoutSerializer()
+    layouts = PolymorphicSheetLayoutSerializer(many=True)
+    jobs = GangLayoutJobSerializer(many=True)
+    count = serializers.IntegerField()
+    usage = serializers.FloatField()
+    run_length = serializers.IntegerField()
+    sheet_count = serializers.IntegerField()
+    evaluated = serializers.IntegerField()
+
+
+# A batch of layout requests: either entries, each the body of a single
+# request, or the cross product of material_layouts (or a single
+# material_layout) and item_layouts with the remaining fields shared by
+# every entry. With summary, only the count, usage and cuts of every entry
+# are given, from the closed-form evaluator, where the view supports it.
+class SheetLayoutsBatchSerializer(serializers.Serializer):
+    entries = serializers.ListField(child=serializers.DictField(), required=False)
+    material_layout = serializers.DictField(required=False)
+    material_layouts = serializers.ListField(child=serializers.DictField(), required=False)
+    item_layouts = serializers.ListField(child=serializers.DictField(), required=False)
+    parallel = serializers.BooleanField(required=False, allow_null=True, default=None)
+    summary = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if 'material_layout' in data:
+            if 'material_layouts' in data:
+                raise serializers.ValidationError(
+                    'Provide either material_layout or material_layouts.')
+            data['material_layouts'] = [data.pop('material_layout')]
+
+        is_cross = 'material_layouts' in data or 'item_layouts' in data
+        if ('entries' in data) == is_cross:
+            raise serializers.ValidationError(
+                'Provide either entries, or material_layouts and item_layouts.')
+        if is_cross and ('material_layouts' not in data or 'item_layouts' not in data):
+            raise serializers.ValidationError(
+                'Both material_layouts and item_layouts are required.')
+        if len(data.get('entries', data.get('item_layouts'))) == 0:
+            raise serializers.ValidationError('At least one entry is required.')
+        if data.get('summary') and not self.context.get('summary', False):
+            raise serializers.ValidationError('Summaries are not given for these layouts.')
+        return data
+
+    def get_entries(self, validated_data):
+        if 'entries' in validated_data:
+            return validated_data.get('entries')
+
+        options = {key: value for (key, value) in self.initial_data.items() 
+            if key not in self.fields}
+        return [{**options, 'material_layout': material_layout, 'item_layout': item_layout}
+            for material_layout in validated_data.get('material_layouts')
+            for item_layout in validated_data.get('item_layouts')]
+
+
+class SheetLayoutSummarySerializer(serializers.Serializer):
+    bin = PolymorphicSheetLayoutSerializer()
+    rect = PolymorphicSheetLayoutSerializer()
+    count = serializers.IntegerField()
+    usage = serializers.FloatField()
+    wastage = serializers.FloatField()
+    cut_count = serializers.IntegerField()
 
 
 class GetRollFedMachineSheetLayoutSerializer(serializers.Serializer):
@@ -208,6 +343,12 @@ class GetRollFedMachineSheetLayoutSerializer(serializers.Serializer):
     spoilage_rate = serializers.DecimalField(decimal_places=2, max_digits=8)
     apply_breakpoint = serializers.BooleanField(default=False)
 
+    def validate_material_layout(self, value):
+        return validate_sheet_layout(value)
+
+    def validate_item_layout(self, value):
+        return validate_sheet_layout(value)
+
     def parse(self, validated_data):
         material_layout_data = validated_data.get('material_layout')
         material_layout = ChildSheet.Layout(**material_layout_data)
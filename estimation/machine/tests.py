@@ -1,8 +1,11 @@
 import pytest, math
-from estimation.machine.models import Machine, ChildSheet, ParentSheet
+from estimation.machine.models import Machine, ChildSheet, ParentSheet, SheetFedPressMachine, \
+    RollFedPressMachine
 from estimation.product.models import Material, Component, Product
 from core.utils.shapes import Rectangle
 from core.utils.measures import Measure
+from core.utils.geometry import to_um
+from core.utils.imposition import Imposition
 from inventory.models import Item
 from inventory.tests import item_factory, base_unit__sheet, alt_unit__ream
 
@@ -110,6 +113,20 @@ def test_sheet_fed_press__get_sheet_layouts(db, create_sheetfed_machine):
     assert runsheet_cutsheet.cut_count == 5
     
 
+def test_sheet_fed_press__get_sheet_layouts__mixed_units(db, create_sheetfed_machine):
+    machine = create_sheetfed_machine(name='Some Machine', uom='mm',
+        min_width=254, max_width=508, min_length=254, max_length=508)
+    item = Rectangle.Layout(width=20, length=40, uom='inch')
+    material = Rectangle.Layout(width=10, length=10, uom='inch')
+
+    layouts, layout_type = machine.get_sheet_layouts(item, material, True)
+    parent_runsheet = layouts[0]
+
+    assert parent_runsheet.rect.width == 20 and parent_runsheet.rect.length == 20
+    assert parent_runsheet.count == 2
+    assert layouts[1].count == 4
+
+
 def test_sheet_fed_press__get_sheet_layouts__rotated_sheet(db, create_sheetfed_machine):
     machine = create_sheetfed_machine(name='Some Machine', uom='inch',
         min_width=2, max_width=5, min_length=2, max_length=5)
@@ -253,4 +270,226 @@ def test_roll_fed_press__get_sheet_layouts__machine_has_vertical_margin(
     assert layout_type == Machine.ROLL_FED_PRESS
     assert len(layouts) == 2
     assert layout1.bin.width == 42 and layout1.bin.length == 48
-    assert layout1.count == 224
\ No newline at end of file
+    assert layout1.count == 224
+
+def test_child_sheet__get_layout_does_not_corrupt_cache(db):
+    parent_layout = ParentSheet.Layout(width=36, length=28, uom='inch')
+    child_layout = ChildSheet.Layout(width=14, length=7, uom='inch',
+        margin_top=1, margin_bottom=0, margin_right=0, margin_left=0)
+
+    first = ChildSheet.get_layout(parent_layout, child_layout, True)
+    rotated = [layout for layout in first.layouts if layout.is_rotated]
+    second = ChildSheet.get_layout(parent_layout, child_layout, True)
+
+    assert len(rotated) > 0
+    assert [(x.x, x.y, x.width, x.length) for x in first.layouts] == \
+        [(x.x, x.y, x.width, x.length) for x in second.layouts]
+    assert child_layout.width == 14 and child_layout.margin_top == 1
+
+
+def test_parent_sheet__get_layout_is_lazy(db):
+    rect_layout = Rectangle.Layout(width=32, length=27, uom='inch')
+    parent_layout = ParentSheet.Layout(width=10, length=8, uom='inch', padding_top=1)
+
+    layout_meta = ParentSheet.get_layout(rect_layout, parent_layout, True)
+    parent_layout.padding_top = 0
+
+    assert isinstance(layout_meta.layouts, Rectangle.LayoutSequence)
+    assert len(layout_meta.layouts) == layout_meta.count
+    assert all(isinstance(x, ParentSheet.Layout) for x in layout_meta.layouts)
+    assert all(x.padding_top == 1 or x.padding_left == 1 for x in layout_meta.layouts)
+
+
+def test_sheet_fed_press__get_layouts_meta__parallel(db, create_sheetfed_machine):
+    machine = create_sheetfed_machine(name='Some Machine', uom='inch',
+        min_width=8, max_width=20, min_length=10, max_length=26)
+    item = Rectangle.Layout(width=25, length=38, uom='inch')
+    material = Rectangle.Layout(width=3, length=2, uom='inch')
+
+    Rectangle.layout_cache.clear()
+    layouts, layout_type = machine.get_layouts_meta(material, item, True, parallel=False)
+    Rectangle.layout_cache.clear()
+    parallel_layouts, layout_type = machine.get_layouts_meta(material, item, True, parallel=True)
+
+    assert [(x.count, x.rect.width, x.rect.length) for x in parallel_layouts] == \
+        [(x.count, x.rect.width, x.rect.length) for x in layouts]
+    assert [(x.x, x.y) for x in parallel_layouts[1].layouts] == \
+        [(x.x, x.y) for x in layouts[1].layouts]
+    # Both orientations were packed by the pool and shared through the layout cache
+    assert len(Rectangle.layout_cache) == 4
+
+
+def test_sheet_fed_press__get_runsheet_split(db, create_sheetfed_machine):
+    machine = create_sheetfed_machine(name='Some Machine', uom='inch',
+        min_width=8, max_width=20, min_length=10, max_length=26)
+    item = Rectangle.Layout(width=25, length=38, uom='inch')
+    material = ChildSheet.Layout(width=4, length=6, uom='inch')
+
+    runsheet_split = machine.get_runsheet_split(material, item, True)
+
+    # Greedy halves into 20x19 runsheets; thirds of the 25" side give more outs
+    assert runsheet_split.greedy_count == 30
+    assert runsheet_split.count == 36
+    assert runsheet_split.improvement == 6 and runsheet_split.improvement_rate == 20
+    assert runsheet_split.layouts_meta[0].count == 3
+    assert runsheet_split.layouts_meta[0].rect.length == 25
+
+    layouts, layout_type = machine.get_sheet_layouts(item, material, True, 
+        strategy=SheetFedPressMachine.EXHAUSTIVE)
+    assert layouts[0].count * layouts[1].count == 36
+
+
+def test_roll_fed_press__get_layouts_meta_for_quantities(db, hplatex_machine):
+    item = Rectangle.Layout(width=48, length=2000, uom='inch')
+    material = ChildSheet.Layout(width=3, length=3, uom='inch', 
+        margin_top=1, margin_right=1, margin_bottom=1, margin_left=1)
+    quantities = [40, 500, 5000]
+
+    layouts_per_quantity = hplatex_machine.get_layouts_meta_for_quantities(
+        material, item, quantities, apply_breakpoint=True)
+
+    assert len(layouts_per_quantity) == 3
+    for (quantity, layouts) in zip(quantities, layouts_per_quantity):
+        expected, layout_type = hplatex_machine.get_sheet_layouts(item, material,
+            order_quantity=quantity, apply_breakpoint=True)
+        assert [(x.name, x.count, x.bin.length, x.cut_count) for x in layouts] == \
+            [(x.name, x.count, x.bin.length, x.cut_count) for x in expected]
+    assert layouts_per_quantity[2][1].count == 270
+
+
+def test_roll_fed_press__get_runs_for_quantities(db, hplatex_machine):
+    item = Rectangle.Layout(width=48, length=200, uom='inch')
+    material = ChildSheet.Layout(width=3.3, length=2.9, uom='inch')
+    quantities = list(range(1, 3000, 7))
+
+    runs = hplatex_machine.get_runs_for_quantities(material, item, quantities, 7.5)
+    layouts_per_quantity = hplatex_machine.get_layouts_meta_for_quantities(
+        material, item, quantities, 7.5)
+    assert runs['runsheet_length'].tolist() == \
+        [layouts[0].rect.length for layouts in layouts_per_quantity]
+    assert [(x[0].count, x[1].count, x[0].cut_count, x[1].cut_count)
+            for x in layouts_per_quantity] == \
+        list(zip(runs['runsheet_count'].tolist(), runs['cutsheet_count'].tolist(),
+            runs['runsheet_cut_count'].tolist(), runs['cutsheet_cut_count'].tolist()))
+    # Short runs leave most of the roll, long ones do not fit it
+    assert set(runs['runsheet_count'].tolist()) == {0, 1}
+
+
+def test_sheet_layouts_batch_serializer__get_entries(db):
+    from estimation.machine.serializers import SheetLayoutsBatchSerializer
+    finals = [{'width': 8.5, 'length': 11, 'uom': 'inch'}, {'width': 4, 'length': 6, 'uom': 'inch'}]
+    items = [{'width': 18, 'length': 22, 'uom': 'inch'}, {'width': 25, 'length': 38, 'uom': 'inch'}]
+    serializer = SheetLayoutsBatchSerializer(data={'material_layouts': finals, 
+        'item_layouts': items, 'rotate': True})
+    assert serializer.is_valid()
+    entries = serializer.get_entries(serializer.validated_data)
+    assert [(x['material_layout']['width'], x['item_layout']['width']) for x in entries] == \
+        [(8.5, 18), (8.5, 25), (4, 18), (4, 25)]
+    assert all([x['rotate'] == True for x in entries])
+
+    serializer = SheetLayoutsBatchSerializer(data={'entries': [{'material_layout': finals[0]}]})
+    assert serializer.is_valid()
+    assert serializer.get_entries(serializer.validated_data) == [{'material_layout': finals[0]}]
+
+    serializer = SheetLayoutsBatchSerializer(data={'material_layout': finals[0], 
+        'item_layouts': items, 'summary': True}, context={'summary': True})
+    assert serializer.is_valid()
+    assert len(serializer.get_entries(serializer.validated_data)) == 2
+
+    assert not SheetLayoutsBatchSerializer(data={'material_layouts': finals}).is_valid()
+    assert not SheetLayoutsBatchSerializer(data={'entries': [], 'item_layouts': items}).is_valid()
+    assert not SheetLayoutsBatchSerializer(data={'entries': []}).is_valid()
+    assert not SheetLayoutsBatchSerializer(data={'material_layout': finals[0], 
+        'item_layouts': items, 'summary': True}).is_valid()
+
+
+def test_get_sheet_layout_serializer__validate_layouts(db):
+    from estimation.machine.serializers import GetSheetLayoutSerializer
+    item = {'width': 25, 'length': 38, 'uom': 'inch'}
+
+    assert GetSheetLayoutSerializer(data={'item_layout': item,
+        'material_layout': {'width': 8.5, 'length': 11, 'uom': 'inch'}}).is_valid()
+    for material in [{'width': 8.5, 'length': 11, 'uom': 'sheets'}, 
+            {'width': 0, 'length': 11, 'uom': 'inch'}]:
+        serializer = GetSheetLayoutSerializer(data={'item_layout': item, 
+            'material_layout': material})
+        assert not serializer.is_valid()
+        assert 'material_layout' in serializer.errors
+
+
+def test_press_machine__constraints(db, hplatex_machine):
+    constraints = hplatex_machine.constraints
+    assert constraints.min_width == 25 * 25400 and constraints.max_width == 48 * 25400
+    assert constraints.min_breakpoint_length == 48 * 25400
+    assert hplatex_machine.constraints is constraints
+    with pytest.raises(AttributeError):
+        constraints.max_width = 0
+
+    # Saving drops the versions the machine no longer has
+    version = hplatex_machine.constraints_version
+    hplatex_machine.horizontal_margin = 1.5
+    hplatex_machine.save()
+    assert (hplatex_machine.pk, version) not in RollFedPressMachine.constraints_cache
+    assert hplatex_machine.constraints is not constraints
+    assert hplatex_machine.constraints.max_printable_width == 45 * 25400
+    assert Machine.objects.get(pk=hplatex_machine.pk).constraints.margin_x == 1.5 * 25400
+
+
+def test_sheet_fed_press__get_gang_layout(db, gto_machine):
+    item = Rectangle.Layout(width=25, length=38, uom='inch')
+    materials = [ChildSheet.Layout(width=8.5, length=11, uom='inch'),
+        ChildSheet.Layout(width=4, length=6, uom='inch')]
+    gang_layout = gto_machine.get_gang_layout(materials, [1000, 5000], item, True)
+
+    assert gang_layout.runsheet.width == 25 and gang_layout.runsheet.length == 19
+    assert gang_layout.parent_to_runsheet.count == 2
+    assert [job.count for job in gang_layout.jobs] == [2, 10]
+    assert gang_layout.run_length == 500
+    assert gang_layout.sheet_count == 250
+    assert all([job.produced >= job.quantity for job in gang_layout.jobs])
+    assert [layout.i for layout in gang_layout.layouts].count(1) == 10
+
+    with pytest.raises(ValueError):
+        gto_machine.get_gang_layout([ChildSheet.Layout(width=50, length=11, uom='inch')], 
+            [100], item, True)
+
+
+def test_press_machine__imposition_table(db, gto_machine):
+    table = gto_machine.imposition_table
+    assert (table.width, table.length) == (30 * 25400, 30 * 25400)
+    assert gto_machine.imposition_table is table
+    page_width, page_length = to_um(8.5, 'inch'), to_um(11, 'inch')
+    assert table.get(page_width, page_length, 8).outs == 1
+    assert table.get(page_width, page_length, 16).outs == 0
+
+    gto_machine.max_sheet_length = 40
+    gto_machine.save()
+    assert gto_machine.imposition_table is not table
+    assert gto_machine.imposition_table.get(page_width, page_length, 16).outs == 1
+
+
+def test_press_machine__imposition_table(db, gto_machine):
+    table = gto_machine.imposition_table
+    assert gto_machine.imposition_table is table
+    page_width, page_length = to_um(8.5, 'inch'), to_um(11, 'inch')
+
+    entry = table.get(page_width, page_length, 8)
+    assert (entry.signature.across, entry.signature.around, entry.outs) == (2, 2, 1)
+    assert table.get(page_width, page_length, 8) is entry
+    assert table.get(page_width, page_length, 16).outs == 0
+    assert table.get(page_width, page_length, 4, Imposition.WORK_AND_TURN).outs == 2
+
+    booklet = table.get_booklet(page_width, page_length, 22)
+    assert [entry.pages for entry in booklet] == [8, 8, 8]
+    assert sum([entry.plate_count for entry in booklet]) == 6
+    booklet = table.get_booklet(page_width, page_length, 24, Imposition.WORK_AND_TURN)
+    assert [entry.pages for entry in booklet] == [4] * 6
+    assert sum([entry.get_sheet_count(1000) for entry in booklet]) == 3000
+
+    with pytest.raises(ValueError):
+        table.get_booklet(to_um(20, 'inch'), to_um(20, 'inch'), 8)
+
+    gto_machine.max_sheet_width = 40
+    gto_machine.save()
+    assert gto_machine.imposition_table is not table
+    assert gto_machine.imposition_table.get(page_width, page_length, 16).outs == 1
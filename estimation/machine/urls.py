@@ -11,14 +11,22 @@ urlpatterns = [
         views.SheetFedPressMachineViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'})),
     path('api/machines/sheetfedpress/<pk>/getlayout', 
         views.SheetFedPressMachineGetSheetLayoutsView.as_view({'post': 'create'})),
+    path('api/machines/sheetfedpress/<pk>/getlayout/batch', 
+        views.SheetFedPressMachineGetSheetLayoutsView.as_view({'post': 'batch'})),
+    path('api/machines/sheetfedpress/<pk>/ganglayout', 
+        views.SheetFedPressMachineGangLayoutView.as_view({'post': 'create'})),
     path('api/machines/rollfedpress', 
         views.RollFedPressMachineViewSet.as_view({'get': 'list', 'post': 'create'})),
     path('api/machines/rollfedpress/<pk>/', 
         views.RollFedPressMachineViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'})),
     path('api/machines/rollfedpress/<pk>/getlayout',
         views.RollFedPressMachineGetSheetLayoutsView.as_view({'post': 'create'})),
+    path('api/machines/rollfedpress/<pk>/getlayout/batch',
+        views.RollFedPressMachineGetSheetLayoutsView.as_view({'post': 'batch'})),
 
     # ChildSheet Viewsets
     path('api/childsheets/getlayout',
         views.GetSheetLayoutsView.as_view({'post': 'create'})),
+    path('api/childsheets/getlayouts',
+        views.GetSheetLayoutsView.as_view({'post': 'batch'})),
 ]
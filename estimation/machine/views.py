@@ -1,6 +1,9 @@
+from abc import ABC, abstractmethod
+from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, mixins, status
 from rest_framework.response import Response
+from core.utils.layoutpool import get_layout_pool, is_parallel
 from core.utils.shapes import Rectangle, RectangleLayoutMetaSerializer
 from estimation.models import Machine, SheetFedPressMachine, RollFedPressMachine, \
     ParentSheet, ChildSheet
@@ -69,70 +72,230 @@ class RollFedPressMachineViewSet(viewsets.ModelViewSet):
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
 
+# Runs the layouts of a batch of entries in one request, see
+# SheetLayoutsBatchSerializer. Every entry is validated with the entry
+# serializer, the body of the single request. The entries are packed at once
+# in the layout pool when parallel, which defaults to is_parallel of the batch,
+# and are then evaluated against the warm layout cache. Results keep the input
+# order, with the errors of an entry in place of its layouts. Views give the
+# layouts data of an entry with get_layouts_data, and summaries of every entry
+# at once with get_summaries_data when they support them.
+class SheetLayoutsBatchMixin(ABC):
+    entry_serializer_class = None
+    # Errors of an entry that sizes or quantities the packers cannot lay out raise
+    entry_errors = (ValueError, TypeError, ArithmeticError, ObjectDoesNotExist)
+
+    @classmethod
+    @abstractmethod
+    def get_layouts_data(cls, machine, parsed):
+        pass
+
+    get_summaries_data = None
+
+    def create_batch(self, request, machine=None):
+        def __error__(e):
+            return str(e.args[0]) if len(e.args) > 0 else str(e)
+
+        serializer = serializers.SheetLayoutsBatchSerializer(data=request.data,
+            context={'summary': self.get_summaries_data is not None})
+
+        if serializer.is_valid():
+            validated_data = serializer.validated_data
+            entries = []
+            for entry in serializer.get_entries(validated_data):
+                entry_serializer = self.entry_serializer_class(data=entry)
+                if entry_serializer.is_valid():
+                    entries.append((entry_serializer.parse(entry_serializer.validated_data), None))
+                else:
+                    entries.append((None, entry_serializer.errors))
+            parsed_entries = [parsed for (parsed, errors) in entries if parsed is not None]
+
+            if validated_data.get('summary'):
+                data = iter(self.get_summaries_data(machine, parsed_entries))
+                return Response({"results": [{**next(data), "error": None} 
+                    if parsed is not None else {"layouts": None, "error": errors}
+                    for (parsed, errors) in entries]})
+
+            tasks = [(machine, parsed) for parsed in parsed_entries]
+            parallel = validated_data.get('parallel')
+            if parallel is None:
+                parallel = is_parallel(tasks)
+            if parallel:
+                get_layout_pool().warm(self.get_layouts_data, tasks)
+
+            results = []
+            for (parsed, errors) in entries:
+                if parsed is not None:
+                    try:
+                        results.append({**self.get_layouts_data(machine, parsed), "error": None})
+                        continue
+                    except self.entry_errors as e:
+                        errors = __error__(e)
+                results.append({"layouts": None, "error": errors})
+
+            return Response({"results": results})
+        else:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+
 # For getting sheet layouts that do not involved any printers
-class GetSheetLayoutsView(mixins.CreateModelMixin, viewsets.GenericViewSet):
+class GetSheetLayoutsView(SheetLayoutsBatchMixin, mixins.CreateModelMixin, 
+        viewsets.GenericViewSet):
     queryset = []
     serializer_class = serializers.GetSheetLayoutSerializer
+    entry_serializer_class = serializers.GetSheetLayoutSerializer
+
+    @classmethod
+    def get_layouts_data(cls, machine, parsed):
+        material_layout, item_layout, bleed, rotate, guillotine = parsed
+        sheet_layout = ChildSheet.get_layout(item_layout, material_layout, 
+            rotate, guillotine=guillotine)
+        layouts = {}
+
+        if sheet_layout is not None:
+            serializer = serializers.SheetLayoutMetaSerializer(sheet_layout)
+            layouts = serializer.data
+
+        return {
+            "machine_type": None,
+            "layouts": [layouts]
+        }
+
+    # Scores many item sheets and materials at once with the closed-form
+    # evaluator, one call for the entries of every rotation
+    @classmethod
+    def get_summaries_data(cls, machine, parsed_entries):
+        summaries = [None] * len(parsed_entries)
+        for rotate in [False, True]:
+            indices = [i for (i, parsed) in enumerate(parsed_entries) if parsed[3] == rotate]
+            if len(indices) == 0:
+                continue
+            sheet_layouts = Rectangle.get_layouts_batch(
+                [parsed_entries[i][1] for i in indices], 
+                [parsed_entries[i][0] for i in indices], rotate)
+            for (i, sheet_layout) in zip(indices, sheet_layouts):
+                summaries[i] = {
+                    "machine_type": None,
+                    "layouts": [serializers.SheetLayoutSummarySerializer(sheet_layout).data]
+                }
+        return summaries
 
     def create(self, request):
         serializer = serializers.GetSheetLayoutSerializer(data=request.data)
 
         if serializer.is_valid():
             validated_data = serializer.validated_data
-            material_layout, item_layout, bleed, rotate = \
-                    serializer.parse(validated_data)
-            sheet_layout = ChildSheet.get_layout(item_layout, material_layout, 
-                rotate)
-            layouts = {}
-
-            if sheet_layout is not None:
-                serializer = serializers.SheetLayoutMetaSerializer(sheet_layout)
-                layouts = serializer.data
-
-            return Response({
-                    "machine_type": None,
-                    "layouts": [layouts]
-                })
+            return Response(self.get_layouts_data(None, serializer.parse(validated_data)))
         else:
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
+    def batch(self, request):
+        return self.create_batch(request)
 
-class SheetFedPressMachineGetSheetLayoutsView(mixins.CreateModelMixin,  
-        viewsets.GenericViewSet):
+
+class SheetFedPressMachineGetSheetLayoutsView(SheetLayoutsBatchMixin, 
+        mixins.CreateModelMixin, viewsets.GenericViewSet):
     queryset = []
-    serializer_class = serializers.GetSheetLayoutSerializer
+    serializer_class = serializers.GetSheetFedMachineSheetLayoutSerializer
+    entry_serializer_class = serializers.GetSheetFedMachineSheetLayoutSerializer
+
+    @classmethod
+    def get_layouts_data(cls, press_machine, parsed):
+        material_layout, item_layout, bleed, rotate, guillotine, strategy = parsed
+        runsheet_split = None
+        layout_type = Machine.SHEET_FED_PRESS
+
+        if strategy == SheetFedPressMachine.EXHAUSTIVE:
+            runsheet_split = press_machine.get_runsheet_split(material_layout, 
+                item_layout, rotate, guillotine)
+            sheet_layouts = runsheet_split.layouts_meta
+        else:
+            sheet_layouts, layout_type = press_machine.get_sheet_layouts(item_layout, 
+                material_layout, rotate, guillotine=guillotine)
+
+        layouts = {}
+        if sheet_layouts is not None:
+            serializer = serializers.SheetLayoutMetaSerializer(sheet_layouts, many=True)
+            layouts = serializer.data
+
+        data = {
+            "machine_type": layout_type,
+            "layouts": layouts
+        }
+        if runsheet_split is not None:
+            data["runsheet_split"] = \
+                serializers.RunsheetSplitSerializer(runsheet_split).data
+        return data
 
     def create(self, request, pk):
         if pk is not None:
             press_machine = get_object_or_404(SheetFedPressMachine, pk=pk)
-            serializer = serializers.GetSheetLayoutSerializer(data=request.data)
+            serializer = serializers.GetSheetFedMachineSheetLayoutSerializer(data=request.data)
             
             if serializer.is_valid():
                 validated_data = serializer.validated_data
-                material_layout, item_layout, bleed, rotate = \
-                    serializer.parse(validated_data)
-                sheet_layouts, layout_type = press_machine.get_sheet_layouts(item_layout, 
-                    material_layout, rotate)
-
-                layouts = {}
-                if sheet_layouts is not None:
-                    serializer = serializers.SheetLayoutMetaSerializer(sheet_layouts, many=True)
-                    layouts = serializer.data
-
-                return Response({
-                    "machine_type": layout_type,
-                    "layouts": layouts
-                })
+                return Response(self.get_layouts_data(press_machine, 
+                    serializer.parse(validated_data)))
             else:
                 return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
         else:
             return Response({'error': "missing machine pk"}, status.HTTP_400_BAD_REQUEST)
 
+    def batch(self, request, pk):
+        return self.create_batch(request, get_object_or_404(SheetFedPressMachine, pk=pk))
 
-class RollFedPressMachineGetSheetLayoutsView(mixins.CreateModelMixin,  
+
+# Gangs several final sizes with their quantities on the runsheets of the press
+class SheetFedPressMachineGangLayoutView(mixins.CreateModelMixin, 
         viewsets.GenericViewSet):
     queryset = []
+    serializer_class = serializers.GetSheetFedMachineGangLayoutSerializer
+
+    def create(self, request, pk):
+        press_machine = get_object_or_404(SheetFedPressMachine, pk=pk)
+        serializer = serializers.GetSheetFedMachineGangLayoutSerializer(data=request.data)
+
+        if serializer.is_valid():
+            validated_data = serializer.validated_data
+            material_layouts, quantities, item_layout, rotate = \
+                serializer.parse(validated_data)
+            try:
+                gang_layout = press_machine.get_gang_layout(material_layouts, 
+                    quantities, item_layout, rotate)
+            except ValueError as e:
+                return Response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+            return Response({
+                "machine_type": Machine.SHEET_FED_PRESS,
+                "gang_layout": serializers.GangLayoutSerializer(gang_layout).data
+            })
+        else:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+
+class RollFedPressMachineGetSheetLayoutsView(SheetLayoutsBatchMixin, 
+        mixins.CreateModelMixin, viewsets.GenericViewSet):
+    queryset = []
     serializer_class = serializers.GetRollFedMachineSheetLayoutSerializer
+    entry_serializer_class = serializers.GetRollFedMachineSheetLayoutSerializer
+
+    @classmethod
+    def get_layouts_data(cls, press_machine, parsed):
+        (material_layout, item_layout, order_quantity,
+            spoilage_rate, apply_breakpoint) = parsed
+        sheet_layouts, layout_type = press_machine.get_sheet_layouts(item_layout, 
+            material_layout, False, order_quantity=order_quantity, 
+            spoilage_rate=spoilage_rate, apply_breakpoint=apply_breakpoint)
+
+        layouts = {}
+        if sheet_layouts is not None:
+            serializer = serializers.SheetLayoutMetaSerializer(sheet_layouts, many=True)
+            layouts = serializer.data
+
+        return {
+            "machine_type": layout_type,
+            "layouts": layouts
+        }
 
     def create(self, request, pk):
         if pk is not None:
@@ -141,22 +304,12 @@ class RollFedPressMachineGetSheetLayoutsView(mixins.CreateModelMixin,
             
             if serializer.is_valid():
                 validated_data = serializer.validated_data
-                (material_layout, item_layout, order_quantity,
-                    spoilage_rate, apply_breakpoint) = serializer.parse(validated_data)
-                sheet_layouts, layout_type = press_machine.get_sheet_layouts(item_layout, 
-                    material_layout, False, order_quantity=order_quantity, 
-                    spoilage_rate=spoilage_rate, apply_breakpoint=apply_breakpoint)
-
-                layouts = {}
-                if sheet_layouts is not None:
-                    serializer = serializers.SheetLayoutMetaSerializer(sheet_layouts, many=True)
-                    layouts = serializer.data
-
-                return Response({
-                    "machine_type": layout_type,
-                    "layouts": layouts
-                })
+                return Response(self.get_layouts_data(press_machine, 
+                    serializer.parse(validated_data)))
             else:
                 return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
         else:
-            return Response({'error': "missing machine pk"}, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': "missing machine pk"}, status.HTTP_400_BAD_REQUEST)
+
+    def batch(self, request, pk):
+        return self.create_batch(request, get_object_or_404(RollFedPressMachine, pk=pk))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.utils.layoutstore import get_layout_store, configure_layout_store
+from inventory.properties.models import PaperProperties
+from estimation.template.models import PaperComponentTemplate
+from estimation.machine.models import Machine, ChildSheet
+
+
+class Command(BaseCommand):
+    help = 'Precomputes sheet layouts of parent sheets from PaperProperties ' \
+        'against final sizes from PaperComponentTemplate into the layout store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Layout store file, defaults to LAYOUT_STORE_PATH')
+        parser.add_argument('--no-rotate', action='store_true',
+            help='Only precompute layouts without rotation')
+
+    def handle(self, *args, **options):
+        path = options.get('path')
+        layout_store = configure_layout_store(path) if path else get_layout_store()
+        if layout_store is None:
+            raise CommandError('No layout store configured. '
+                'Set LAYOUT_STORE_PATH or pass --path.')
+
+        rotations = [False] if options.get('no_rotate') else [False, True]
+        parents = self.get_parent_layouts()
+        finals = self.get_final_layouts()
+        count = 0
+
+        for (machine, final_layout) in finals:
+            for parent_layout in parents:
+                for rotate in rotations:
+                    # Roll-fed layouts depend on the order quantity, warm the cut sheets only
+                    if machine is not None and machine.type == Machine.SHEET_FED_PRESS:
+                        machine.get_sheet_layouts(parent_layout, final_layout, rotate)
+                    else:
+                        ChildSheet.get_layout(parent_layout, final_layout, rotate)
+                    count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            'Warmed %s layout combinations (%s parent sheets, %s final sizes). '
+            'Layout store holds %s entries.' %
+            (count, len(parents), len(finals), len(layout_store))))
+
+    # Distinct parent sheet sizes
+    def get_parent_layouts(self):
+        sizes = PaperProperties.objects.filter(width_value__gt=0, length_value__gt=0) \
+            .values_list('width_value', 'length_value', 'size_uom').distinct()
+        return [PaperProperties(width_value=width, length_value=length,
+            size_uom=uom).layout for (width, length, uom) in sizes]
+
+    # Distinct final sizes per machine option
+    def get_final_layouts(self):
+        templates = PaperComponentTemplate.objects \
+            .filter(width_value__gt=0, length_value__gt=0) \
+            .select_related('machine_option')
+        finals = {}
+        for template in templates:
+            machine = template.machine_option.machine.get_real_instance() \
+                if template.machine_option is not None else None
+            key = (machine.pk if machine is not None else None,
+                template.width_value, template.length_value, template.size_uom)
+            if key not in finals:
+                finals[key] = (machine, template.layout)
+        return list(finals.values())
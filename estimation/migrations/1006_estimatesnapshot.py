@@ -0,0 +1,24 @@
+# Generated by Django 3.1 on 2022-08-27 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estimation', '1005_auto_20220820_1300'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstimateSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64)),
+                ('blob', models.BinaryField()),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('product_estimate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='estimation.productestimate')),
+            ],
+        ),
+    ]
@@ -1,22 +1,30 @@
-import math, decimal
+import math, decimal, bisect, hashlib, json, zlib
+import numpy as np
 from measurement.utils import guess
 from cached_property import cached_property
 from decimal import Decimal
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django_measurement.models import MeasurementField
 from core.utils.measures import Quantity, CostingMeasure, Measure
 from measurement.measures import Time
 from inventory.models import Item
-from inventory.properties.models import Shape, Tape, Line, Paper, Panel, Liquid
-from estimation.metaproduct.models import MetaEstimateVariable, MetaService
+from inventory.properties.models import Shape, Tape, Line, Paper, Panel, Liquid, \
+    ItemProperties
+from estimation.metaproduct.models import MetaEstimateVariable, MetaService, MetaOperation
 from estimation.process.models import ActivityExpense, Speed
 from estimation.template.models import ProductTemplate, ComponentTemplate, OperationOptionTemplate
 from estimation.machine.models import Machine, ChildSheet, RollFedPressMachine
+from core.utils.layoutpool import get_layout_pool, is_parallel
+from core.utils.costing import CostingKernel
+from core.utils.shapes import Rectangle
+from core.utils.geometry import to_um
 from estimation.exceptions import MaterialTypeMismatch, MeasurementMismatch
 from polymorphic.models import PolymorphicModel
 from polymorphic.managers import PolymorphicManager
 from djmoney.models.fields import MoneyField
+from djmoney.money import Money
 
 class ProductEstimateManager(models.Manager):
 
@@ -32,6 +40,26 @@ class ProductEstimateManager(models.Manager):
 
         return product_estimate
 
+    # Product estimates with everything ProductEstimate.estimates walks, fetched
+    # in a fixed number of queries. Polymorphic relations are prefetched through
+    # their polymorphic managers so that they resolve to the concrete models.
+    def prefetch_estimates(self):
+        operation_estimates = 'product__services__operation_estimates'
+        return self.get_queryset().select_related('product_template', 'product').prefetch_related(
+            models.Prefetch('estimate_quantities', 
+                queryset=EstimateQuantity.objects.order_by('quantity')),
+            models.Prefetch('product__components', queryset=Component.objects.all()),
+            models.Prefetch('product__components__machine', queryset=Machine.objects.all()),
+            models.Prefetch('product__components__materials', 
+                queryset=Material.objects.select_related('item', 'item__base_uom')),
+            models.Prefetch('product__components__materials__item__properties', 
+                queryset=ItemProperties.objects.all()),
+            'product__services', operation_estimates,
+            models.Prefetch('%s__activity_estimates' % operation_estimates, 
+                queryset=ActivityEstimate.objects.select_related('speed_estimate')),
+            '%s__activity_estimates__activity_expense_estimates' % operation_estimates,
+            'estimate_addon_set__estimate_addon_items')
+
 
 class ProductEstimate(models.Model):
     class Summary:
@@ -126,9 +154,9 @@ class ProductEstimate(models.Model):
 
     @property
     def order_quantities(self):
-        quantities = [estimate_quantity.quantity 
+        quantities = sorted([estimate_quantity.quantity 
             for estimate_quantity 
-            in self.estimate_quantities.order_by('quantity').all()]
+            in self.estimate_quantities.all()])
         return quantities
 
     @property
@@ -174,12 +202,28 @@ class ProductEstimate(models.Model):
         order_quantities = [estimate_quantity.quantity 
             for estimate_quantity in self.estimate_quantities.all()]
 
+        # Services and operations share the components and materials of the
+        # product, so that each material is estimated on a single instance
+        def _link_services(components, services):
+            components_map = {component.pk: component for component in components}
+            materials_map = {material.pk: material for component in components
+                for material in component.materials.all()}
+            for service in services:
+                if service.component_id in components_map:
+                    service.component = components_map[service.component_id]
+                for operation_estimate in service.operation_estimates.all():
+                    if operation_estimate.material_id in materials_map:
+                        operation_estimate.material = materials_map[operation_estimate.material_id]
+
         product = self.product
         product_template_id = (self.product_template.pk 
             if self.product_template is not None else None)
             
-        material_estimates = _get_material_estimates(product.components.all())
-        service_estimates = _get_service_estimates(product.services.all())
+        components = product.components.all()
+        services = product.services.all()
+        _link_services(components, services)
+        material_estimates = _get_material_estimates(components)
+        service_estimates = _get_service_estimates(services)
 
         product_estimate = ProductEstimate.Estimate(
             self.pk, product_template_id, order_quantities,
@@ -187,6 +231,49 @@ class ProductEstimate(models.Model):
 
         return product_estimate
     
+    # Hash of every input of the estimates: the estimate, its product and
+    # template, the product tree, item prices, machines, activity rates and 
+    # cost addons. Reads the tree loaded by ProductEstimateManager.prefetch_estimates.
+    @property
+    def estimate_version(self):
+        def __fields__(instance):
+            if instance is None:
+                return None
+            return [str(getattr(instance, field.attname)) 
+                for field in instance._meta.concrete_fields
+                if not getattr(field, 'auto_now', False) and 
+                    not getattr(field, 'auto_now_add', False)]
+
+        def __speed_estimate__(activity_estimate):
+            try:
+                return activity_estimate.speed_estimate
+            except SpeedEstimate.DoesNotExist:
+                return None
+
+        product = self.product
+        inputs = [EstimateSnapshot.VERSION, __fields__(self), self.order_quantities,
+            __fields__(product), __fields__(self.product_template)]
+        for component in product.components.all():
+            inputs += [__fields__(component), __fields__(component.machine)]
+            for material in component.materials.all():
+                item = material.item
+                inputs += [__fields__(material), __fields__(item), 
+                    __fields__(item.properties), str(item.price)]
+        for service in product.services.all():
+            inputs.append(__fields__(service))
+            for operation_estimate in service.operation_estimates.all():
+                inputs.append(__fields__(operation_estimate))
+                for activity_estimate in operation_estimate.activity_estimates.all():
+                    inputs += [__fields__(activity_estimate), 
+                        __fields__(__speed_estimate__(activity_estimate))]
+                    inputs += [__fields__(activity_expense_estimate) for activity_expense_estimate
+                        in activity_estimate.activity_expense_estimates.all()]
+        if hasattr(self, 'estimate_addon_set'):
+            inputs += [__fields__(addon_item) for addon_item in sorted(
+                self.estimate_addon_set.estimate_addon_items.all(), key=lambda x: x.pk)]
+
+        return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
     @property
     def cost_addons(self):
         cost_addons = []
@@ -230,6 +317,38 @@ class EstimateQuantity(models.Model):
     quantity = models.IntegerField(default=1)
 
 
+class EstimateSnapshotManager(models.Manager):
+    # Data of the snapshot of a product estimate, computed again and saved
+    # only when the version of the estimate changed
+    def get_data(self, product_estimate, compute):
+        version = product_estimate.estimate_version
+        snapshot = EstimateSnapshot.objects.filter(product_estimate=product_estimate).first()
+        if snapshot is not None and snapshot.version == version:
+            return snapshot.data
+
+        data = compute()
+        blob = zlib.compress(json.dumps(data, cls=DjangoJSONEncoder).encode())
+        EstimateSnapshot.objects.update_or_create(product_estimate=product_estimate,
+            defaults={'version': version, 'blob': blob})
+        return data
+
+
+class EstimateSnapshot(models.Model):
+    # Bumped whenever the way estimates are computed changes
+    VERSION = 1
+
+    objects = EstimateSnapshotManager()
+    product_estimate = models.OneToOneField(ProductEstimate, on_delete=models.CASCADE,
+        related_name='snapshot')
+    version = models.CharField(max_length=64)
+    blob = models.BinaryField()
+    updated_date = models.DateTimeField(auto_now=True)
+
+    @property
+    def data(self):
+        return json.loads(zlib.decompress(self.blob).decode())
+
+
 class ProductManager(models.Manager):
     def create_product(self, product_template, product_estimate=None):
         product = Product.objects.create(name=product_template.name, 
@@ -310,6 +429,10 @@ class Component(PolymorphicModel, Shape):
         null=True)
     quantity = models.IntegerField(default=1)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.__dict__.pop('measures_mappings', None)
+
     def get_costing_measurements_map(self, order_quantity):
         set_material_measures = {
             CostingMeasure.QUANTITY: Quantity(pc=order_quantity)}
@@ -419,6 +542,24 @@ class Material(PolymorphicModel):
             self.spoilage_rate = spoilage_rate
             self.layouts_meta = layouts_meta
             self.layout_type = layout_type
+            # stock and spoilage quantities worked out by compute_quantities
+            self.quantities = None
+
+        # Stock and spoilage quantities of estimates of every order quantity 
+        # of a material, in one pass of the costing kernel
+        @classmethod
+        def compute_quantities(cls, estimates):
+            if len(estimates) == 0:
+                return estimates
+            stock_quantities = CostingKernel.get_stock_quantities(
+                [estimate.total_material_quantity for estimate in estimates],
+                estimates[0].output_per_item)
+            spoilage_quantities = CostingKernel.get_spoilage_quantities(
+                stock_quantities, estimates[0].spoilage_rate)
+            for (estimate, stock_quantity, spoilage_quantity) in zip(
+                    estimates, stock_quantities, spoilage_quantities):
+                estimate.quantities = (int(stock_quantity), int(spoilage_quantity))
+            return estimates
         
         @property
         def layouts(self):
@@ -426,6 +567,8 @@ class Material(PolymorphicModel):
 
         @property
         def estimated_stock_quantity(self):
+            if self.quantities is not None:
+                return self.quantities[0]
             output_per_item = max(self.output_per_item, 1)
             total_material_quantity = self.total_material_measures.get(CostingMeasure.QUANTITY)
             total_material = total_material_quantity.value if total_material_quantity is not None else 0
@@ -433,8 +576,10 @@ class Material(PolymorphicModel):
 
         @property
         def estimated_spoilage_quantity(self):
-            spoilage_multiplier = (self.spoilage_rate / 100)
-            return math.ceil(self.estimated_stock_quantity * spoilage_multiplier)
+            if self.quantities is not None:
+                return self.quantities[1]
+            return CostingKernel.get_spoilage_quantity(self.estimated_stock_quantity, 
+                self.spoilage_rate)
 
         @property
         def estimated_total_quantity(self):
@@ -491,6 +636,10 @@ class Material(PolymorphicModel):
     def get_class(cls, type):
         return cls.objects.get_class(type)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.__dict__.pop('measures_mappings', None)
+
     @property
     def label(self):
         return '%s %s' % (self.item.name, self.component)
@@ -529,7 +678,7 @@ class Material(PolymorphicModel):
             estimate = Material.Estimate(quantity, self.component.quantity,
                 spoilage_rate)
             estimates.append(estimate)
-        material_estimate.estimates = estimates
+        material_estimate.estimates = Material.Estimate.compute_quantities(estimates)
         
         return material_estimate
         
@@ -544,6 +693,13 @@ class LineMaterial(Material):
 
 class PaperMaterial(Material):
     class Estimate(Material.Estimate):
+        def __init__(self, order_quantity, material_quantity, 
+                spoilage_rate=0, layouts_meta=None, layout_type=None, imposition_table=None):
+            super().__init__(order_quantity, material_quantity, 
+                spoilage_rate=spoilage_rate, layouts_meta=layouts_meta, 
+                layout_type=layout_type)
+            # signature layouts of the machine, for booklets
+            self.imposition_table = imposition_table
 
         @property
         def layouts(self):
@@ -706,6 +862,22 @@ class PaperMaterial(Material):
                 }
             return measures
 
+        # Signatures of a booklet with pages the size of the final sheet, 
+        # see Imposition.Table.get_booklet
+        def get_imposition(self, page_count, method=None):
+            final_sheet = self.layouts.get('final_sheet')
+            if self.imposition_table is None or final_sheet is None:
+                return []
+            return self.imposition_table.get_booklet(final_sheet.width_um, 
+                final_sheet.length_um, page_count, method)
+
+        def get_press_sheet_count(self, page_count, method=None):
+            return sum([entry.get_sheet_count(self.total_material_quantity) 
+                for entry in self.get_imposition(page_count, method)])
+
+        def get_plate_count(self, page_count, method=None):
+            return sum([entry.plate_count for entry in self.get_imposition(page_count, method)])
+
     class RollFedMachineEstimate(Estimate):
         def __init__(self, order_quantity, material_quantity, 
                 spoilage_rate=0, layouts_meta=None, layout_type=None):
@@ -815,13 +987,13 @@ class PaperMaterial(Material):
         machine = self.component.machine
         machine_layout_type = None
 
-        for quantity in order_quantities:
-            set_quantity = self.component.quantity
-            total_quantity = quantity * set_quantity
-            layouts, machine_layout_type = machine.get_sheet_layouts(raw_material_layout, 
-                final_material_layout, rotate, order_quantity=total_quantity, 
-                spoilage_rate=spoilage_rate)
+        set_quantity = self.component.quantity
+        total_quantities = [quantity * set_quantity for quantity in order_quantities]
+        layouts_per_quantity = machine.get_layouts_meta_for_quantities(final_material_layout,
+            raw_material_layout, total_quantities, spoilage_rate=spoilage_rate)
 
+        for (quantity, layouts) in zip(order_quantities, layouts_per_quantity):
+            machine_layout_type = Machine.ROLL_FED_PRESS
             estimate = PaperMaterial.RollFedMachineEstimate(quantity, 
                 self.component.quantity, spoilage_rate, layouts, machine_layout_type)
             estimates.append(estimate)
@@ -841,13 +1013,14 @@ class PaperMaterial(Material):
             layouts = [ChildSheet.get_layout(raw_material_layout, 
                 final_material_layout, rotate)]
         
+        imposition_table = getattr(machine, 'imposition_table', None)
         estimates = []
         for quantity in order_quantities:
             estimate = PaperMaterial.Estimate(quantity, self.component.quantity,
-                spoilage_rate, layouts, machine_layout_type)
+                spoilage_rate, layouts, machine_layout_type, imposition_table)
             estimates.append(estimate)
         
-        return layouts, estimates
+        return layouts, PaperMaterial.Estimate.compute_quantities(estimates)
 
     def estimate(self, order_quantities, spoilage_rate=0, rotate=True):
         machine_type = (self.component.machine.type 
@@ -876,6 +1049,304 @@ class PaperMaterial(Material):
         return paper_estimate
  
  
+class MachineRecommendation:
+    # Ranks every machine option of a component template by the cost of its
+    # materials plus the cost of the operations that run on the machine, 
+    # summed over the order quantities. The layouts of all machines are packed
+    # at once in the layout pool when parallel, and are shared between machines
+    # through the layout cache.
+    class Option:
+        def __init__(self, machine_option, machine, is_selected=False, 
+                estimates=None, error=None):
+            self.machine_option = machine_option
+            self.machine = machine
+            self.is_selected = is_selected
+            self.estimates = estimates if estimates is not None else []
+            self.error = error
+
+        @property
+        def is_eligible(self):
+            return self.error is None
+
+        @property
+        def total_cost(self):
+            return sum([estimate.total_cost for estimate in self.estimates])
+
+        @property
+        def total_duration(self):
+            return Time(hr=sum([estimate.duration.hr for estimate in self.estimates]))
+
+    class Estimate:
+        def __init__(self, order_quantity, output_per_item, material_cost, 
+                operation_cost, duration):
+            self.order_quantity = order_quantity
+            self.output_per_item = output_per_item
+            self.material_cost = material_cost
+            self.operation_cost = operation_cost
+            self.duration = duration
+
+        @property
+        def total_cost(self):
+            return self.material_cost + self.operation_cost
+
+    def __init__(self, component_template, order_quantities, spoilage_rate=0, rotate=True):
+        self.component_template = component_template
+        self.order_quantities = order_quantities
+        self.spoilage_rate = spoilage_rate
+        self.rotate = rotate
+
+    # Returns the layouts meta of every order quantity
+    @classmethod
+    def get_layouts_meta(cls, machine, raw_material_layout, final_material_layout, 
+            order_quantities, rotate=True, spoilage_rate=0):
+        if machine.type == Machine.ROLL_FED_PRESS:
+            return machine.get_layouts_meta_for_quantities(final_material_layout, 
+                raw_material_layout, order_quantities, spoilage_rate=spoilage_rate)
+        # Layouts are packed serially here, in the pool workers as well as 
+        # against the cache warmed by recommend
+        kwargs = {'parallel': False} if machine.type == Machine.SHEET_FED_PRESS else {}
+        layouts, layout_type = machine.get_sheet_layouts(raw_material_layout, 
+            final_material_layout, rotate, **kwargs)
+        return [layouts] * len(order_quantities)
+
+    @property
+    def machine_options(self):
+        meta_component = self.component_template.meta_component
+        return [(machine_option, machine_option.machine.get_real_instance())
+            for machine_option in meta_component.meta_machine_options.all()]
+
+    # Meta operations of the component and its services with their options, 
+    # and the estimate variable and costing measure to measure them by
+    @property
+    def meta_operations(self):
+        meta_component = self.component_template.meta_component
+        meta_product_datas = [meta_component] + list(
+            MetaService.objects.filter(meta_component=meta_component))
+        meta_operations = []
+
+        for meta_product_data in meta_product_datas:
+            if isinstance(meta_product_data, MetaService):
+                variable_type = meta_product_data.estimate_variable_type
+                costing_measure = meta_product_data.costing_measure
+                is_material_based = meta_product_data.measure_basis == \
+                    MetaService.MeasureBasis.MATERIAL
+            else:
+                variable_type = MetaEstimateVariable.MACHINE_RUN
+                costing_measure = None
+                is_material_based = True
+
+            for meta_operation in meta_product_data.meta_operations.all():
+                options = meta_operation.meta_operation_options \
+                    .select_related('operation__workstation').all()
+                meta_operations.append((meta_operation, options, variable_type,
+                    costing_measure or getattr(meta_operation.get_real_instance(), 
+                        'costing_measure', CostingMeasure.QUANTITY), 
+                    is_material_based))
+
+        return meta_operations
+
+    def recommend(self, parallel=None):
+        quantity = self.component_template.quantity
+        total_quantities = [order_quantity * quantity for order_quantity in self.order_quantities]
+        final_material_layout = self.component_template.layout
+        items = [material_template.item for material_template 
+            in self.component_template.material_templates.all()]
+        selected = self.component_template.machine_option
+        machine_options = [(machine_option, machine) for (machine_option, machine) 
+            in self.machine_options if machine.material_type == self.component_template.type]
+
+        tasks = [(machine, item.properties.layout, final_material_layout, 
+                total_quantities, self.rotate, self.spoilage_rate) 
+            for (machine_option, machine) in machine_options for item in items]
+        if parallel is None:
+            parallel = is_parallel(tasks)
+        if parallel:
+            get_layout_pool().warm(MachineRecommendation.get_layouts_meta, tasks)
+
+        meta_operations = self.meta_operations
+        options = []
+        for (machine_option, machine) in machine_options:
+            option = MachineRecommendation.Option(machine_option, machine,
+                selected is not None and selected.pk == machine_option.pk)
+            try:
+                option.estimates = self._estimate(machine, items, 
+                    final_material_layout, total_quantities, meta_operations)
+            except ValueError as e:
+                option.error = str(e.args[0]) if len(e.args) > 0 else str(e)
+            options.append(option)
+
+        return sorted(options, key=lambda option: (not option.is_eligible, 
+            option.total_cost, option.total_duration.hr))
+
+    def _estimate(self, machine, items, final_material_layout, total_quantities, 
+            meta_operations):
+        estimate_class = PaperMaterial.RollFedMachineEstimate \
+            if machine.type == Machine.ROLL_FED_PRESS else PaperMaterial.Estimate
+        material_estimates = []
+
+        # Operations measured by the machine run are done on the press, so the 
+        # machine has to run one of their options unless they can be left off
+        for (meta_operation, options, variable_type, costing_measure, 
+                is_material_based) in meta_operations:
+            if variable_type != MetaEstimateVariable.MACHINE_RUN or (not \
+                    meta_operation.is_required and 
+                    meta_operation.options_type == MetaOperation.BOOLEAN_OPTION):
+                continue
+            if not any([option.operation.workstation.machine_id == machine.pk 
+                    for option in options]):
+                raise ValueError('%s cannot run %s.' % (machine.name, meta_operation.name))
+
+        for item in items:
+            layouts_per_quantity = MachineRecommendation.get_layouts_meta(machine, 
+                item.properties.layout, final_material_layout, total_quantities,
+                self.rotate, self.spoilage_rate)
+            estimates = [estimate_class(order_quantity, self.component_template.quantity,
+                    self.spoilage_rate, layouts, machine.type)
+                for (order_quantity, layouts) in zip(self.order_quantities, layouts_per_quantity)]
+            if any([estimate.output_per_item == 0 for estimate in estimates]):
+                raise ValueError('Final material does not fit in %s.' % item.full_name)
+            price = Decimal(item.price.amount) if item.price is not None else Decimal(0)
+            material_estimates.append((item, price, estimates))
+
+        estimates = []
+        for (i, order_quantity) in enumerate(self.order_quantities):
+            material_cost = Decimal(0)
+            operation_cost = Decimal(0)
+            duration = 0
+
+            for (item, price, item_estimates) in material_estimates:
+                material_cost += item_estimates[i].estimated_total_quantity * price
+
+            for (meta_operation, options, variable_type, costing_measure, 
+                    is_material_based) in meta_operations:
+                options = [option for option in options 
+                    if option.operation.workstation.machine_id == machine.pk]
+                if len(options) == 0:
+                    continue
+                measured = material_estimates if is_material_based else material_estimates[:1]
+                costs = []
+                for option in options:
+                    cost, hours = Decimal(0), 0
+                    for (item, price, item_estimates) in measured:
+                        measurement = item_estimates[i].costing_measurements_map \
+                            .get(variable_type, {}).get(costing_measure)
+                        if measurement is not None:
+                            option_cost = option.operation.get_cost(measurement)
+                            cost += Decimal(getattr(option_cost, 'amount', option_cost))
+                            hours += option.operation.get_duration(measurement).hr
+                    costs.append((cost, hours))
+                # The estimator picks one option of each operation, take the cheapest
+                cost, hours = min(costs, key=lambda x: x[0])
+                operation_cost += cost
+                duration += hours
+
+            output_per_item = material_estimates[0][2][i].output_per_item \
+                if len(material_estimates) > 0 else 0
+            estimates.append(MachineRecommendation.Estimate(order_quantity, output_per_item,
+                round(material_cost, 2), round(operation_cost, 2), Time(hr=duration)))
+
+        return estimates
+
+
+class MaterialSelection:
+    # Ranks the parent sheets of the material options of a paper component by
+    # what they cost per order quantity: the sheets needed at their outs, plus
+    # spoilage, times the price of the item. Sheets too small for the final size
+    # are skipped by the size index, the rest are packed in one batch.
+    class SizeIndex:
+        # Sheets sorted by their short side, so the sheets that cannot take
+        # a size are cut off by a bisect before looking at the long side
+        def __init__(self, entries):
+            self.entries = sorted([(min(width, length), max(width, length), width, length, 
+                value) for (width, length, value) in entries], key=lambda x: x[0])
+            self.keys = [entry[0] for entry in self.entries]
+
+        def find(self, width, length, rotate=True):
+            start = bisect.bisect_left(self.keys, min(width, length))
+            if rotate:
+                return [value for (short, long, w, l, value) in self.entries[start:]
+                    if long >= max(width, length)]
+            return [value for (short, long, w, l, value) in self.entries[start:]
+                if w >= width and l >= length]
+
+    class Estimate:
+        def __init__(self, item, order_quantity, output_per_item, stock_quantity,
+                spoilage_quantity, price):
+            self.item = item
+            self.order_quantity = order_quantity
+            self.output_per_item = output_per_item
+            self.stock_quantity = stock_quantity
+            self.spoilage_quantity = spoilage_quantity
+            self.price = price
+
+        @property
+        def total_quantity(self):
+            return self.stock_quantity + self.spoilage_quantity
+
+        @property
+        def total_cost(self):
+            return round(self.total_quantity * self.price, 2)
+
+    class Selection:
+        def __init__(self, order_quantity, estimates):
+            self.order_quantity = order_quantity
+            self.estimates = estimates
+
+        @property
+        def best(self):
+            return self.estimates[0] if len(self.estimates) > 0 else None
+
+    def __init__(self, component_template, order_quantities, spoilage_rate=0, rotate=True):
+        self.component_template = component_template
+        self.order_quantities = order_quantities
+        self.spoilage_rate = spoilage_rate
+        self.rotate = rotate
+        self.candidates = 0
+        self.evaluated = 0
+
+    @property
+    def items(self):
+        meta_component = self.component_template.meta_component
+        return [meta_material_option.item for meta_material_option 
+            in meta_component.meta_material_options.select_related('item').all()
+            if meta_material_option.item.type == Item.PAPER]
+
+    def select(self):
+        if self.component_template.type != Item.PAPER:
+            raise MaterialTypeMismatch(self.component_template.type, Item.PAPER)
+
+        final_material_layout = self.component_template.layout
+        width, length, uom = final_material_layout.get_pack_size_as_rect()
+        items = self.items
+        layouts = [(item, item.properties.layout) for item in items]
+        index = MaterialSelection.SizeIndex([(to_um(w, u), to_um(l, u), (item, layout)) 
+            for (item, layout) in layouts
+            for (w, l, u) in [layout.get_pack_size_as_bin()]])
+        fits = index.find(to_um(width, uom), to_um(length, uom), self.rotate)
+        self.candidates = len(items)
+        self.evaluated = len(fits)
+
+        estimates = [[] for order_quantity in self.order_quantities]
+        if len(fits) > 0:
+            layouts_meta = Rectangle.get_layouts_batch([layout for (item, layout) in fits], 
+                [final_material_layout], self.rotate)
+            for ((item, layout), layout_meta) in zip(fits, layouts_meta):
+                if layout_meta.count == 0:
+                    continue
+                price = Decimal(item.price.amount) if item.price is not None else Decimal(0)
+                for (i, order_quantity) in enumerate(self.order_quantities):
+                    total_quantity = order_quantity * self.component_template.quantity
+                    stock_quantity = math.ceil(total_quantity / layout_meta.count)
+                    spoilage_quantity = CostingKernel.get_spoilage_quantity(stock_quantity, 
+                        self.spoilage_rate)
+                    estimates[i].append(MaterialSelection.Estimate(item, order_quantity, 
+                        layout_meta.count, stock_quantity, spoilage_quantity, price))
+
+        return [MaterialSelection.Selection(order_quantity, sorted(quantity_estimates, 
+                key=lambda estimate: (estimate.total_cost, estimate.total_quantity)))
+            for (order_quantity, quantity_estimates) in zip(self.order_quantities, estimates)]
+
+
 class PanelMaterial(Material):
     pass
 
@@ -973,19 +1444,28 @@ class Service(models.Model):
         if not isinstance(order_quantities, list):
             raise Exception("Provided argument to method 'estimate' must be a list of integers.")
 
-        def _get_activity_expense_estimates(activity_expense_estimates):
+        def _get_activity_expense_estimates(activity_expense_estimates, 
+                measurements, durations):
             results = []
             for activity_expense_estimate in activity_expense_estimates:
                 aee = ActivityExpenseEstimate.Expense.create(
-                    activity_expense_estimate, order_quantities)
+                    activity_expense_estimate, order_quantities, measurements, durations)
                 results.append(aee)
             return results
 
         def _get_activity_estimates(activity_estimates):
             results = []
             for activity_estimate in activity_estimates:
+                # Expenses of an activity share its measurements and durations
+                expenses = activity_estimate.activity_expense_estimates.all()
+                measurements, durations = None, None
+                if len(expenses) > 0:
+                    operation = activity_estimate.operation_estimate
+                    measurements = [operation.get_costing_measurement(order_quantity)
+                        for order_quantity in order_quantities]
+                    durations = activity_estimate.get_durations(measurements)
                 activity_expense_estimates = _get_activity_expense_estimates(
-                    activity_estimate.activity_expense_estimates.all())
+                    expenses, measurements, durations)
                 ae = ActivityEstimate.Estimate(activity_estimate.name,
                     activity_estimate.notes, activity_expense_estimates)
                 results.append(ae)
@@ -1062,8 +1542,6 @@ class OperationEstimate(models.Model):
         related_name='operation_estimates')
     material = models.ForeignKey(Material, on_delete=models.SET_NULL,
         null=True, blank=True, related_name='operation_estimates')
-    measures_mapping_cache = {}
-
     def get_costing_measurement(self, order_quantity):
         estimate_variable_type = self.service.estimate_variable_type
         is_material_based = self.material is not None
@@ -1076,15 +1554,13 @@ class OperationEstimate(models.Model):
         elif estimate_variable_type is not None and \
                 self.service.costing_measure is not None:
 
-            prefix = 'o'
-            
-            if is_material_based:
-                prefix = 'm%s' % (self.material.pk)
-            elif is_component_based:
-                prefix = 'c%s' % (self.service.component.pk)
-
-            key = '%s-%s' % (prefix, order_quantity)
-            measures_mapping = self.measures_mapping_cache.get(key)
+            # Costing measurements per order quantity are kept on the material or
+            # component instance. The operations of a product estimate are linked
+            # to the same instances, so they share them for one estimate computation,
+            # and they go with the loaded instances, or when those are saved.
+            owner = self.material if is_material_based else self.service.component
+            measures_mappings = owner.__dict__.setdefault('measures_mappings', {})
+            measures_mapping = measures_mappings.get(order_quantity)
             
             if measures_mapping is None:
                 if is_material_based:
@@ -1094,7 +1570,7 @@ class OperationEstimate(models.Model):
                 elif is_component_based:
                     measures_mapping = self.service.component.get_costing_measurements_map(order_quantity)
 
-                self.measures_mapping_cache[key] = measures_mapping
+                measures_mappings[order_quantity] = measures_mapping
             
             measures = measures_mapping.get(estimate_variable_type)
 
@@ -1169,36 +1645,39 @@ class ActivityEstimate(models.Model):
 
     def get_duration(self, measurement, contingency=0, hours_per_day=10):
         self._validate_measurement(measurement)
-        
+        return self.get_durations([measurement], contingency, hours_per_day)[0]
+
+    # Durations of every measurement in one pass of the costing kernel, 
+    # None where there is no measurement
+    def get_durations(self, measurements, contingency=0, hours_per_day=10):
         if self.speed_estimate is None:
             raise Exception('Activity speed is currently null and has not been initialized.')
 
-        # factor hours for setup and teardown, multiplied by estimate num of days
-        def __compute_overall(base_duration):
-            overall = base_duration
-            if self.set_up is not None and self.tear_down is not None:
-                misc_hrs = (self.set_up.hr + self.tear_down.hr)
-                run_hours = hours_per_day - misc_hrs
-                estimate_days = math.ceil(base_duration / run_hours)
-                overall = base_duration + (misc_hrs * estimate_days)
-            return round(overall, 2)
-
-        duration = 0
         measure_uom = Measure.STANDARD_UNITS[self.speed_estimate.measure]
         speed_uom = Measure.STANDARD_SPEED_UNITS[self.speed_estimate.measure]
+        indices = [i for (i, measurement) in enumerate(measurements) if measurement is not None]
+        for i in indices:
+            self._validate_measurement(measurements[i])
 
-        if measure_uom is not None and speed_uom is not None and \
-                measurement is not None and self.speed_estimate is not None:
-                
-            mval = getattr(measurement, measure_uom)
+        durations = [0] * len(indices)
+        if measure_uom is not None and speed_uom is not None and len(indices) > 0:
+            mvals = [getattr(measurements[i], measure_uom) for i in indices]
             sval = getattr(self.speed_estimate.rate, speed_uom)
 
-            if mval is not None and sval is not None:
-                base = mval / sval
-                multiplier = (contingency / 100) + 1
-                duration = __compute_overall(base * multiplier)
-                
-        return Time(hr=duration)
+            valid = [k for (k, mval) in enumerate(mvals) if mval is not None]
+            if sval is not None and len(valid) > 0:
+                set_up, tear_down = None, None
+                if self.set_up is not None and self.tear_down is not None:
+                    set_up, tear_down = self.set_up.hr, self.tear_down.hr
+                computed = CostingKernel.get_durations([mvals[k] for k in valid], sval, 
+                    set_up, tear_down, contingency, hours_per_day)
+                for (k, duration) in zip(valid, CostingKernel.round_durations(computed)):
+                    durations[k] = float(duration)
+
+        results = [None] * len(measurements)
+        for (i, duration) in zip(indices, durations):
+            results[i] = Time(hr=duration)
+        return results
 
     def _validate_measurement(self, measurement):
         try:
@@ -1236,12 +1715,13 @@ class ActivityExpenseEstimate(models.Model):
             return {estimate.order_quantity: estimate.cost 
                 for estimate in self.estimates}
 
+        # Measurements and durations of the activity may be given, so that the
+        # expenses of an activity share them
         @classmethod
-        def create(cls, activity_expense_estimate, order_quantities):
-            expense_estimates = []
-            for quantity in order_quantities:
-                estimate = activity_expense_estimate.estimate(quantity)
-                expense_estimates.append(estimate)
+        def create(cls, activity_expense_estimate, order_quantities, 
+                measurements=None, durations=None):
+            expense_estimates = activity_expense_estimate.estimate_quantities(
+                order_quantities, measurements, durations)
             aee = ActivityExpenseEstimate.Expense(
                 activity_expense_estimate.name,
                 activity_expense_estimate.rate,
@@ -1259,6 +1739,23 @@ class ActivityExpenseEstimate(models.Model):
             self.order_quantity = order_quantity
             self.measurement = measurement
             self.duration = duration
+            # cost worked out by compute_costs
+            self.computed_cost = None
+
+        # Costs of the estimates of every order quantity of an expense, 
+        # in one pass of the costing kernel
+        @classmethod
+        def compute_costs(cls, estimates):
+            charged = [estimate for estimate in estimates if estimate is not None and 
+                estimate.type in [ActivityExpense.HOUR_BASED, ActivityExpense.MEASURE_BASED]]
+            if len(charged) == 0:
+                return estimates
+            rate = charged[0].rate
+            costs = CostingKernel.get_costs(rate.amount, 
+                [estimate.quantity for estimate in charged])
+            for (estimate, cost) in zip(charged, costs):
+                estimate.computed_cost = Money(Decimal(float(cost)), rate.currency)
+            return estimates
 
         @property
         def quantity(self):
@@ -1270,9 +1767,12 @@ class ActivityExpenseEstimate(models.Model):
         
         @property
         def cost(self):
+            if self.computed_cost is not None:
+                return self.computed_cost
             total = self.rate
             if self.type in [ActivityExpense.HOUR_BASED, ActivityExpense.MEASURE_BASED]:
-                total = self.rate * Decimal(self.quantity)
+                ActivityExpenseEstimate.Estimate.compute_costs([self])
+                total = self.computed_cost
             return total
 
     name = models.CharField(max_length=50, null=True)
@@ -1298,6 +1798,23 @@ class ActivityExpenseEstimate(models.Model):
             label = '%s / %s' % (self.rate, self.uom)
         return label
 
+    # Estimates of every order quantity, with the durations and costs worked 
+    # out in one pass of the costing kernel each
+    def estimate_quantities(self, order_quantities, measurements=None, durations=None):
+        activity_estimate = self.activity_estimate
+        if measurements is None:
+            operation = activity_estimate.operation_estimate
+            measurements = [operation.get_costing_measurement(order_quantity)
+                for order_quantity in order_quantities]
+        if durations is None:
+            durations = activity_estimate.get_durations(measurements)
+
+        return ActivityExpenseEstimate.Estimate.compute_costs([
+            ActivityExpenseEstimate.Estimate(self.uom, self.type, self.rate, 
+                order_quantity, measurement, duration) if measurement is not None else None
+            for (order_quantity, measurement, duration) 
+            in zip(order_quantities, measurements, durations)])
+
     def estimate(self, order_quantity):
         activity_estimate = self.activity_estimate
         operation = activity_estimate.operation_estimate
@@ -1310,4 +1827,221 @@ class ActivityExpenseEstimate(models.Model):
                 self.uom, self.type, self.rate, 
                 order_quantity, costing_measurement, duration)
         
-        return estimate
\ No newline at end of file
+        return estimate
+
+class PriceCurve:
+    # Total and unit prices of a product estimate over a dense range of order
+    # quantities. Layouts, rates and set-up times are worked out once, from a
+    # reference estimate of one order; the measurements of every quantity are
+    # those of the reference scaled by the counts they are proportional to,
+    # and the costs of all quantities are evaluated on arrays. Roll-fed layouts
+    # depend on the length of the run, which the machine works out for all
+    # quantities on arrays instead.
+    MAX_POINTS = 100000
+    SPOILAGE = 'spoilage'
+    BREAKPOINT = 'breakpoint'
+
+    class Source:
+        # Measurements of a material or component over the quantities
+        def __init__(self, measurements_map, counts=None):
+            # measurements of the reference estimate, and for each variable, or
+            # variable and costing measure, the count of the reference and of
+            # every quantity they scale with
+            self.measurements_map = measurements_map
+            self.counts = counts if counts is not None else {}
+
+        def get_values(self, variable, costing_measure, uom):
+            measures = self.measurements_map.get(variable)
+            measurement = measures.get(costing_measure) if measures is not None else None
+            if measurement is None:
+                return None
+            value = getattr(measurement, uom)
+            (reference, counts) = self.counts.get((variable, costing_measure), 
+                self.counts.get(variable, (None, None)))
+            if counts is None or reference == 0:
+                return np.full(self.size, float(value))
+            return float(value) * counts / reference
+
+        @property
+        def size(self):
+            return len(next(iter(self.counts.values()))[1])
+
+    class Break:
+        def __init__(self, order_quantity, reasons):
+            self.order_quantity = order_quantity
+            self.reasons = reasons
+
+    def __init__(self, product_estimate, start=1, stop=MAX_POINTS, step=1):
+        self.product_estimate = product_estimate
+        self.order_quantities = np.arange(start, stop + 1, step, dtype=np.int64)
+        self.total_prices = None
+        self.breaks = []
+
+    @property
+    def unit_prices(self):
+        return self.total_prices / self.order_quantities
+
+    def _get_material_source(self, material, breaks):
+        quantities = self.order_quantities
+        reference = material.estimate([1], material.spoilage_rate)
+        estimate = reference.estimates[0]
+        rate = float(getattr(material.price, 'amount', material.price) or 0)
+
+        if isinstance(estimate, PaperMaterial.RollFedMachineEstimate):
+            return self._get_rollfed_source(material, estimate, rate, breaks)
+
+        material_quantities = quantities * estimate.material_quantity
+        stock_quantities = CostingKernel.get_stock_quantities(material_quantities, 
+            estimate.output_per_item)
+        spoilage_quantities = CostingKernel.get_spoilage_quantities(stock_quantities, 
+            estimate.spoilage_rate)
+        for i in np.flatnonzero(np.diff(spoilage_quantities) > 0) + 1:
+            breaks.setdefault(int(i), set()).add(PriceCurve.SPOILAGE)
+
+        total_quantities = stock_quantities + spoilage_quantities
+        raw_counts = (estimate.estimated_total_quantity, total_quantities)
+        counts = {
+            MetaEstimateVariable.RAW_MATERIAL: raw_counts,
+            MetaEstimateVariable.MACHINE_RUN: raw_counts,
+            MetaEstimateVariable.SET_MATERIAL: (estimate.order_quantity, quantities),
+            MetaEstimateVariable.TOTAL_MATERIAL: (estimate.total_material_quantity, material_quantities)}
+        return PriceCurve.Source(estimate.costing_measurements_map, counts), total_quantities * rate
+
+    # Roll-fed materials are measured on the runs of every quantity, which
+    # follow RollFedMachineEstimate. Cut counts and the final sheets run do
+    # not scale with the material, so they are measured per unit.
+    def _get_rollfed_source(self, material, estimate, rate, breaks):
+        quantities = self.order_quantities
+        component = material.component
+        material_quantities = quantities * estimate.material_quantity
+        runs = component.machine.get_runs_for_quantities(component.layout,
+            material.item_properties.layout, material_quantities.tolist(), 
+            estimate.spoilage_rate)
+        for i in np.flatnonzero(np.diff(runs['runsheet_length']) < 0) + 1:
+            breaks.setdefault(int(i), set()).add(PriceCurve.BREAKPOINT)
+
+        raw_length = estimate.layouts_meta[0].bin.length
+        running_lengths = runs['runsheet_length']
+        running_per_raw = runs['runsheet_count']
+        final_sheets_counts = running_per_raw * runs['cutsheet_count']
+        is_multiple = (running_per_raw > 0) & ((raw_length > running_lengths) | \
+            (material_quantities > final_sheets_counts))
+        multipliers = material_quantities / np.maximum(final_sheets_counts, 1)
+        output_per_items = np.where(is_multiple, 
+            running_per_raw * multipliers * running_lengths, running_lengths) / raw_length
+        spoilage_rate = float(estimate.spoilage_rate) / 100
+        total_quantities = (output_per_items / (spoilage_rate + 1)) + \
+            (output_per_items * spoilage_rate)
+
+        raw_to_running_cuts = np.maximum(runs['runsheet_cut_count'], 4)
+        running_to_final_cuts = runs['cutsheet_cut_count']
+        measurements_map = {variable: dict(measures) 
+            for (variable, measures) in estimate.costing_measurements_map.items()}
+        measurements_map[MetaEstimateVariable.MACHINE_RUN][CostingMeasure.PERIMETER] = \
+            estimate.layouts.get('final_sheet').perimeter_measurement
+        for variable in [MetaEstimateVariable.RAW_TO_RUNNING_CUT, 
+                MetaEstimateVariable.RUNNING_TO_FINAL_CUT, MetaEstimateVariable.RAW_TO_FINAL_CUT]:
+            measurements_map[variable] = {CostingMeasure.QUANTITY: Quantity(count=1)}
+
+        raw_counts = (float(estimate.estimated_total_quantity), total_quantities)
+        counts = {
+            MetaEstimateVariable.RAW_MATERIAL: raw_counts,
+            MetaEstimateVariable.MACHINE_RUN: raw_counts,
+            (MetaEstimateVariable.MACHINE_RUN, CostingMeasure.PERIMETER): (1, final_sheets_counts),
+            MetaEstimateVariable.SET_MATERIAL: (estimate.order_quantity, quantities),
+            MetaEstimateVariable.TOTAL_MATERIAL: (estimate.total_material_quantity, material_quantities),
+            MetaEstimateVariable.RAW_TO_RUNNING_CUT: (1, raw_to_running_cuts),
+            MetaEstimateVariable.RUNNING_TO_FINAL_CUT: (1, running_to_final_cuts),
+            MetaEstimateVariable.RAW_TO_FINAL_CUT: (1, raw_to_running_cuts + running_to_final_cuts)}
+        return PriceCurve.Source(measurements_map, counts), total_quantities * rate
+
+    def _get_component_source(self, component):
+        quantities = self.order_quantities
+        counts = {
+            MetaEstimateVariable.SET_MATERIAL: (1, quantities),
+            MetaEstimateVariable.TOTAL_MATERIAL: (component.quantity, quantities * component.quantity)}
+        return PriceCurve.Source(component.get_costing_measurements_map(1), counts)
+
+    def _get_expense_costs(self, activity_estimate, expenses, values, standard_values):
+        size = len(self.order_quantities)
+        durations = np.zeros(size)
+        speed_estimate = activity_estimate.speed_estimate
+        speed = getattr(speed_estimate.rate, Measure.STANDARD_SPEED_UNITS[speed_estimate.measure])
+        if standard_values is not None and speed is not None:
+            set_up, tear_down = None, None
+            if activity_estimate.set_up is not None and activity_estimate.tear_down is not None:
+                set_up, tear_down = activity_estimate.set_up.hr, activity_estimate.tear_down.hr
+            durations = CostingKernel.round_durations(CostingKernel.get_durations(
+                standard_values, speed, set_up, tear_down))
+
+        costs = np.zeros(size)
+        for expense in expenses:
+            rate = float(expense.rate.amount)
+            if expense.type == ActivityExpense.HOUR_BASED:
+                costs += CostingKernel.get_costs(expense.rate.amount, durations)
+            elif expense.type == ActivityExpense.MEASURE_BASED:
+                costs += CostingKernel.get_costs(expense.rate.amount, values) \
+                    if values is not None else 0
+            else:
+                costs += rate
+        return costs
+
+    def compute(self):
+        product_estimate = self.product_estimate
+        product = product_estimate.product
+        size = len(self.order_quantities)
+        breaks = {}
+        totals = np.zeros(size)
+
+        sources = {}
+        for component in product.components.all():
+            for material in component.materials.all():
+                (source, prices) = self._get_material_source(material, breaks)
+                sources[('m', material.pk)] = source
+                totals += prices
+
+        for service in product.services.all():
+            for operation_estimate in service.operation_estimates.all():
+                source = None
+                if operation_estimate.material is not None:
+                    source = sources.get(('m', operation_estimate.material.pk))
+                    if source is None:
+                        (source, prices) = self._get_material_source(
+                            operation_estimate.material, {})
+                elif service.component is not None:
+                    source = sources.get(('c', service.component.pk))
+                    if source is None:
+                        source = self._get_component_source(service.component)
+                        sources[('c', service.component.pk)] = source
+                
+                for activity_estimate in operation_estimate.activity_estimates.all():
+                    expenses = activity_estimate.activity_expense_estimates.all()
+                    if len(expenses) == 0:
+                        continue
+                    measure_uom = Measure.STANDARD_UNITS[activity_estimate.speed_estimate.measure]
+
+                    def __get_values__(uom):
+                        if uom is None:
+                            return None
+                        if source is None:
+                            measurement = service.input_measure
+                            return np.full(size, float(getattr(measurement, uom))) \
+                                if measurement is not None else None
+                        if service.estimate_variable_type is None or \
+                                service.costing_measure is None:
+                            return None
+                        return source.get_values(service.estimate_variable_type, 
+                            service.costing_measure, uom)
+
+                    values = __get_values__(activity_estimate.measure_unit)
+                    standard_values = __get_values__(measure_uom)
+
+                    totals += self._get_expense_costs(activity_estimate, expenses, 
+                        values, standard_values)
+
+        self.total_prices = np.round(totals, 2)
+        # Only the steps after which a unit costs more than before are breaks
+        rises = set((np.flatnonzero(np.diff(self.unit_prices) > 0) + 1).tolist())
+        self.breaks = [PriceCurve.Break(int(self.order_quantities[i]), sorted(reasons))
+            for (i, reasons) in sorted(breaks.items()) if i in rises]
+        return self
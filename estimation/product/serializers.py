@@ -9,7 +9,7 @@ from estimation.machine.models import Machine
 from estimation.template.models import ProductTemplate
 from estimation.product.models import ProductEstimate, \
     EstimateQuantity, Product, Component, Service, \
-    ActivityEstimate, OperationEstimate, Material
+    ActivityEstimate, OperationEstimate, Material, PriceCurve
 from estimation.costaddons.models import EstimateAddonItem, EstimateAddonSet
 from estimation.machine.serializers import SheetLayoutMetaSerializer
 from estimation.costaddons.serializers import AddonCostSetSerializer, \
@@ -292,4 +292,27 @@ class ProductEstimateCostsSerializer(ProductEstimateSerializer):
     class Meta:
         model = ProductEstimate
         fields = ['id', 'name', 'description', 'template_code', 
-            'summary', 'estimates', 'cost_addons']
\ No newline at end of file
+            'summary', 'estimates', 'cost_addons']
+
+class PriceCurveInputSerializer(serializers.Serializer):
+    start = serializers.IntegerField(min_value=1, default=1)
+    stop = serializers.IntegerField(min_value=1)
+    step = serializers.IntegerField(min_value=1, default=1)
+
+    def validate(self, data):
+        errors = {}
+
+        if data['start'] > data['stop']:
+            errors["stop"] = "value must be greater than 'start'."
+        elif (data['stop'] - data['start']) // data['step'] + 1 > PriceCurve.MAX_POINTS:
+            errors["step"] = "value must give at most %d quantities." % PriceCurve.MAX_POINTS
+
+        if len(errors.items()) > 0:
+            raise serializers.ValidationError(errors)
+
+        return data
+
+
+class PriceCurveBreakSerializer(serializers.Serializer):
+    order_quantity = serializers.IntegerField()
+    reasons = serializers.ListField(child=serializers.CharField())
@@ -1,12 +1,16 @@
 import pytest, math, time, multiprocessing
+from decimal import Decimal
+from djmoney.money import Money
 from core.utils.measures import CostingMeasure
+from core.utils.shapes import Rectangle
 from inventory.models import Item
 from inventory.tests import item_factory, base_unit__sheet, alt_unit__ream
 from estimation.template.tests import meta_product, gto_workstation, \
     gto_machine, finishing_workstation
 from estimation.template.models import ProductTemplate
 from estimation.product.models import ProductEstimate, Product, \
-    Component, Material, EstimateQuantity, Service, OperationEstimate
+    Component, Material, EstimateQuantity, Service, OperationEstimate, MachineRecommendation, MaterialSelection, \
+    EstimateSnapshot, PriceCurve
 from estimation.product import serializers
 from estimation.machine.models import Machine
 
@@ -302,7 +306,9 @@ def test_material_estimate__without_machine(db, carbonless_item):
 
     assert estimate.raw_to_running_cut == 0
     assert estimate.running_to_final_cut == 0
-    assert estimate.raw_to_final_cut == 15
+    # 6 strip cuts, 5 cuts down the single 4x5 strip and
+    # 6 cuts through the five stacked 5x4 strips
+    assert estimate.raw_to_final_cut == 17
 
 
 def test_service__estimate(db, product_template):
@@ -511,4 +517,286 @@ def test_product_estimate_output_json(db, product_template):
 
     for duration in summary.durations:
         expected = expected_durations.get(duration.order_quantity)
-        assert duration.duration_value == expected
\ No newline at end of file
+        assert duration.duration_value == expected
+
+def test_product_estimate__prefetch_estimates(db, product_template, 
+        django_assert_max_num_queries):
+    product_estimate = ProductEstimate.objects.create_product_estimate(
+        product_template, [300, 100, 200])
+    expected = product_estimate.estimates.total_prices_map
+
+    with django_assert_max_num_queries(20):
+        product_estimate = ProductEstimate.objects.prefetch_estimates().get(
+            pk=product_estimate.pk)
+        assert product_estimate.order_quantities == [100, 200, 300]
+        assert product_estimate.estimates.total_prices_map == expected
+        assert len(product_estimate.estimates.service_estimates) == \
+            product_estimate.product.services.count()
+
+
+def test_estimate_snapshot__get_data(db, product_template):
+    product_estimate = ProductEstimate.objects.create_product_estimate(
+        product_template, [100, 200])
+    computed = []
+
+    def _compute(product_estimate):
+        def __compute__():
+            computed.append(product_estimate.pk)
+            return {'prices': {str(key): str(value) 
+                for (key, value) in product_estimate.estimates.total_prices_map.items()}}
+        return __compute__
+
+    def _load():
+        return ProductEstimate.objects.prefetch_estimates().get(pk=product_estimate.pk)
+
+    version = _load().estimate_version
+    assert _load().estimate_version == version
+    data = EstimateSnapshot.objects.get_data(_load(), _compute(product_estimate))
+    assert EstimateSnapshot.objects.get_data(_load(), _compute(product_estimate)) == data
+    assert len(computed) == 1
+
+    material = product_estimate.product.components.first().materials.first()
+    material.price = Money(2, 'PHP')
+    material.save()
+    assert _load().estimate_version != version
+    EstimateSnapshot.objects.get_data(_load(), _compute(product_estimate))
+    assert len(computed) == 2
+
+    product_estimate.set_estimate_quantities([100, 200, 300])
+    EstimateSnapshot.objects.get_data(_load(), _compute(product_estimate))
+    assert len(computed) == 3
+    assert EstimateSnapshot.objects.count() == 1
+
+    # The product and template are served along with the costs
+    version = _load().estimate_version
+    product = product_estimate.product
+    product.name = 'Renamed'
+    product.save()
+    assert _load().estimate_version != version
+    version = _load().estimate_version
+    product_template.name = 'Renamed Template'
+    product_template.save()
+    assert _load().estimate_version != version
+
+
+def test_operation_estimate__measures_mappings(db, product_template):
+    def _load():
+        return ProductEstimate.objects.prefetch_estimates().get(pk=product_estimate.pk)
+
+    def _get_measurements(product_estimate):
+        product_estimate.estimates.total_prices_map
+        material = product_estimate.product.components.all()[0].materials.all()[0]
+        return material, {key: str(measures_mapping) 
+            for (key, measures_mapping) in material.measures_mappings.items()}
+
+    product_estimate = ProductEstimate.objects.create_product_estimate(
+        product_template, [100, 200])
+
+    # Operations of one estimate share the mappings of their material
+    material, measurements = _get_measurements(_load())
+    assert list(measurements.keys()) == [100, 200]
+
+    properties = material.item.properties
+    properties.width_value = properties.width_value * 2
+    properties.save()
+    assert _get_measurements(_load())[1] != measurements
+
+    material.save()
+    assert not hasattr(material, 'measures_mappings')
+
+
+def test_material_estimate__compute_quantities(db, product_template):
+    product_estimate = ProductEstimate.objects.create_product_estimate(
+        product_template, [100, 250, 333])
+
+    # Rates whose float multiples land just above an integer
+    for spoilage_rate in [12.5, 7, 0.1, 33.33]:
+        product_estimate.set_material_spoilage_rate(spoilage_rate)
+        material = product_estimate.product.components.first().materials.first()
+
+        for estimate in material.estimates.estimates:
+            stock_quantity, spoilage_quantity = estimate.quantities
+            estimate.quantities = None
+            assert estimate.estimated_stock_quantity == stock_quantity
+            assert estimate.estimated_spoilage_quantity == spoilage_quantity
+
+    # Float rates give the spoilage of the kernel too
+    for spoilage_rate in [7.0, 0.1, 14.0, 33.33]:
+        estimates = Material.Estimate.compute_quantities([Material.Estimate(
+            order_quantity, 1, spoilage_rate) for order_quantity in [100, 700, 1000]])
+        for estimate in estimates:
+            spoilage_quantity = estimate.quantities[1]
+            estimate.quantities = None
+            assert estimate.estimated_spoilage_quantity == spoilage_quantity
+
+
+def test_activity_expense_estimate__estimate_quantities(db, product_template):
+    order_quantities = [100, 250, 333]
+    product_estimate = ProductEstimate.objects.create_product_estimate(
+        product_template, order_quantities)
+    expenses = [expense for service in product_estimate.product.services.all()
+        for operation_estimate in service.operation_estimates.all()
+        for activity_estimate in operation_estimate.activity_estimates.all()
+        for expense in activity_estimate.activity_expense_estimates.all()]
+
+    assert len(expenses) > 0
+    for expense in expenses:
+        estimates = expense.estimate_quantities(order_quantities)
+        for (order_quantity, estimate) in zip(order_quantities, estimates):
+            scalar = expense.estimate(order_quantity)
+            scalar_cost = scalar.cost if scalar is not None else None
+            assert (estimate.cost if estimate is not None else None) == scalar_cost
+
+
+def test_price_curve__compute(db, product_template):
+    product_estimate = ProductEstimate.objects.create_product_estimate(
+        product_template, [100, 200, 300])
+    product_estimate.set_material_spoilage_rate(10)
+    material = product_estimate.product.components.first().materials.first()
+    material.price = Money(2, 'PHP')
+    material.save()
+
+    product_estimate = ProductEstimate.objects.prefetch_estimates().get(pk=product_estimate.pk)
+    total_prices_map = product_estimate.estimates.total_prices_map
+    curve = PriceCurve(product_estimate, 100, 300, 100).compute()
+    assert curve.order_quantities.tolist() == [100, 200, 300]
+    assert [Decimal(str(price)) for price in curve.total_prices] == \
+        [round(total_prices_map[quantity].amount, 2) for quantity in [100, 200, 300]]
+
+    curve = PriceCurve(product_estimate, 1, 1000).compute()
+    assert len(curve.total_prices) == 1000
+    assert len(curve.breaks) > 0
+    for curve_break in curve.breaks:
+        i = curve_break.order_quantity - 1
+        assert curve_break.reasons == [PriceCurve.SPOILAGE]
+        assert curve.unit_prices[i] > curve.unit_prices[i - 1]
+
+
+def test_price_curve__compute_rollfed(db, product_template):
+    product_estimate = ProductEstimate.objects.create_product_estimate(
+        product_template, [100, 200, 300])
+    product_estimate.set_material_spoilage_rate(10)
+    component = product_estimate.product.components.first()
+    component.machine = Machine.objects.create_machine(name='Roll Press',
+        type=Machine.ROLL_FED_PRESS, uom='inch',
+        min_sheet_width=25, max_sheet_width=48,
+        min_sheet_breakpoint_length=48, max_sheet_breakpoint_length=150)
+    component.save()
+    for material in component.materials.all():
+        properties = material.item.properties
+        properties.width_value = 36
+        properties.length_value = 1800
+        properties.save()
+    material = component.materials.first()
+    material.price = Money(2, 'PHP')
+    material.save()
+
+    product_estimate = ProductEstimate.objects.prefetch_estimates().get(pk=product_estimate.pk)
+    total_prices_map = product_estimate.estimates.total_prices_map
+    curve = PriceCurve(product_estimate, 100, 300, 100).compute()
+    assert [price for price in curve.total_prices] == pytest.approx(
+        [float(total_prices_map[quantity].amount) for quantity in [100, 200, 300]])
+
+    # Runs of every quantity are worked out without a layout each
+    Rectangle.layout_cache.clear()
+    curve = PriceCurve(product_estimate, 1, 5000).compute()
+    assert len(Rectangle.layout_cache) <= 2
+    material = product_estimate.product.components.first().materials.first()
+    for quantity in [1, 37, 100, 1999, 5000]:
+        estimate = material.estimate([quantity], material.spoilage_rate).estimates[0]
+        assert curve.total_prices[quantity - 1] >= float(estimate.estimated_total_quantity) * 2
+    assert curve.total_prices[[99, 199, 299]].tolist() == pytest.approx(
+        [float(total_prices_map[quantity].amount) for quantity in [100, 200, 300]])
+
+
+def test_machine_recommendation__recommend(db, product_template):
+    meta_component = product_template.meta_product.meta_product_datas.filter(name='Sheets').first()
+    small_press = Machine.objects.create_machine(name='Small Press', 
+        type=Machine.SHEET_FED_PRESS, uom='inch',
+        min_sheet_width=8, max_sheet_width=12,
+        min_sheet_length=8, max_sheet_length=18)
+    roll_press = Machine.objects.create_machine(name='Roll Press', 
+        type=Machine.ROLL_FED_PRESS, uom='inch',
+        min_sheet_width=25, max_sheet_width=48,
+        min_sheet_breakpoint_length=48, max_sheet_breakpoint_length=150)
+    meta_component.add_meta_machine_option(small_press)
+    meta_component.add_meta_machine_option(roll_press)
+    component_template = product_template.component_templates.first()
+
+    recommendation = MachineRecommendation(component_template, [100, 1000])
+    options = recommendation.recommend(parallel=False)
+    assert [option.machine.name for option in options] == \
+        ['GTO Press', 'Small Press', 'Roll Press']
+
+    # GTO runs the operations of the template, the small press none of them
+    gto = options[0]
+    assert gto.is_selected == True
+    assert [estimate.output_per_item for estimate in gto.estimates] == [4, 4]
+    assert [estimate.operation_cost for estimate in gto.estimates] == \
+        [Decimal('22950.00'), Decimal('180900.00')]
+    assert gto.total_cost == Decimal('203850.00')
+    assert gto.total_duration.hr == 60.75
+    assert options[1].is_eligible == False
+    assert options[1].error == 'Small Press cannot run Front Print.'
+    assert options[1].is_selected == False
+
+    assert options[2].is_eligible == False
+    assert options[2].error is not None
+    assert options[2].estimates == []
+
+
+def test_machine_recommendation__recommend__parallel(db, product_template, settings):
+    meta_component = product_template.meta_product.meta_product_datas.filter(name='Sheets').first()
+    small_press = Machine.objects.create_machine(name='Small Press', 
+        type=Machine.SHEET_FED_PRESS, uom='inch',
+        min_sheet_width=8, max_sheet_width=12,
+        min_sheet_length=8, max_sheet_length=18)
+    meta_component.add_meta_machine_option(small_press)
+    component_template = product_template.component_templates.first()
+    settings.LAYOUT_WORKERS = 2
+
+    # Pool workers pack serially rather than submitting to the inherited pool
+    recommendation = MachineRecommendation(component_template, [100, 1000])
+    options = recommendation.recommend(parallel=True)
+    serial_options = recommendation.recommend(parallel=False)
+    assert [(option.machine.name, option.total_cost, option.error) for option in options] == \
+        [(option.machine.name, option.total_cost, option.error) for option in serial_options]
+    assert [[estimate.output_per_item for estimate in option.estimates] 
+        for option in options] == [[estimate.output_per_item for estimate in option.estimates] 
+            for option in serial_options]
+
+
+def test_material_selection__select(db, product_template, item_factory):
+    def _create_paper_item(name, width, length, price=None):
+        item = item_factory(name=name, type=Item.PAPER, override_price=price)
+        item.properties.width_value = width
+        item.properties.length_value = length
+        item.properties.size_uom = 'inch'
+        item.properties.save()
+        return item
+
+    meta_component = product_template.meta_product.meta_product_datas.filter(name='Sheets').first()
+    for item in [item.item for item in meta_component.meta_material_options.all()]:
+        item.override_price = 3 if item.name == 'Carbonless White' else 4
+        item.save()
+    meta_component.add_meta_material_option(_create_paper_item('Memo', 8, 10, 1))
+    meta_component.add_meta_material_option(_create_paper_item('Bond', 25, 38, 5))
+    component_template = product_template.component_templates.first()
+
+    selection = MaterialSelection(component_template, [10, 100], spoilage_rate=10)
+    selections = selection.select()
+    assert [x.order_quantity for x in selections] == [10, 100]
+    # The memo sheet is smaller than the final size and is never packed
+    assert selection.candidates == 5
+    assert selection.evaluated == 4
+
+    estimates = selections[0].estimates
+    assert [estimate.item.name for estimate in estimates] == \
+        ['Bond', 'Carbonless White', 'Carbonless Blue', 'Carbonless Yellow']
+    assert selections[0].best.output_per_item == 8
+    assert selections[0].best.stock_quantity == 125
+    assert selections[0].best.spoilage_quantity == 13
+    assert selections[0].best.total_cost == Decimal('690.00')
+    assert estimates[1].output_per_item == 4
+    assert estimates[1].total_cost == Decimal('825.00')
+    assert selections[1].best.total_cost == Decimal('6875.00')
@@ -9,5 +9,7 @@ urlpatterns = [
         views.ProductEstimateView.as_view({'get':'retrieve', 'put': 'update', 
             'delete': 'destroy'})),
     path('api/products/estimates/<pk>/costs',
-        views.ProductEstimateCostView.as_view({'get':'retrieve'}))
+        views.ProductEstimateCostView.as_view({'get':'retrieve'})),
+    path('api/products/estimates/<pk>/pricecurve',
+        views.PriceCurveView.as_view({'post':'create'}))
 ]
\ No newline at end of file
@@ -2,7 +2,7 @@ from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, mixins, status
 from rest_framework.response import Response
 from estimation.product import serializers
-from estimation.product.models import ProductEstimate
+from estimation.product.models import ProductEstimate, EstimateSnapshot, PriceCurve
 from estimation.template.models import ProductTemplate
 
 
@@ -28,5 +28,38 @@ class ProductEstimateView(mixins.ListModelMixin,
 
 class ProductEstimateCostView(mixins.RetrieveModelMixin, 
         viewsets.GenericViewSet):
-    queryset = ProductEstimate.objects.all()
-    serializer_class = serializers.ProductEstimateCostsSerializer
\ No newline at end of file
+    queryset = ProductEstimate.objects.prefetch_estimates()
+    serializer_class = serializers.ProductEstimateCostsSerializer
+
+    # Costs are served from the snapshot of the estimate while none of its inputs change
+    def retrieve(self, request, pk=None):
+        product_estimate = self.get_object()
+        data = EstimateSnapshot.objects.get_data(product_estimate,
+            lambda: self.get_serializer(product_estimate).data)
+        return Response(data)
+
+
+# Total and unit prices of an estimate over a range of order quantities
+class PriceCurveView(mixins.CreateModelMixin, viewsets.GenericViewSet):
+    queryset = ProductEstimate.objects.prefetch_estimates()
+    serializer_class = serializers.PriceCurveInputSerializer
+
+    def create(self, request, pk):
+        product_estimate = self.get_object()
+        serializer = serializers.PriceCurveInputSerializer(data=request.data)
+
+        if serializer.is_valid():
+            validated_data = serializer.validated_data
+            curve = PriceCurve(product_estimate, validated_data.get('start'), 
+                validated_data.get('stop'), validated_data.get('step')).compute()
+            serializer = serializers.PriceCurveBreakSerializer(curve.breaks, many=True)
+
+            return Response({
+                "product_estimate_id": product_estimate.pk,
+                "order_quantities": curve.order_quantities.tolist(),
+                "total_prices": curve.total_prices.tolist(),
+                "unit_prices": curve.unit_prices.round(4).tolist(),
+                "breaks": serializer.data
+            })
+        else:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
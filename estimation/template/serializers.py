@@ -2,6 +2,7 @@ from rest_framework import serializers
 from rest_polymorphic.serializers import PolymorphicSerializer
 from inventory.models import Item
 from estimation.product.models import ProductEstimate
+from core.utils.measures import MeasurementSerializerField
 from djmoney.contrib.django_rest_framework import MoneyField
 from estimation.machine.serializers import MachineSerializer
 from estimation.template.models import ProductTemplate, ComponentTemplate, \
@@ -241,4 +242,54 @@ class ProductTemplateListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProductTemplate
-        fields = ['id', 'code', 'name', 'description', 'meta_product']
\ No newline at end of file
+        fields = ['id', 'code', 'name', 'description', 'meta_product']
+
+
+class MachineRecommendationInputSerializer(serializers.Serializer):
+    order_quantities = serializers.ListField(child=serializers.IntegerField(min_value=1),
+        allow_empty=False)
+    spoilage_rate = serializers.DecimalField(decimal_places=2, max_digits=5, 
+        min_value=0, max_value=100, default=0)
+    rotate = serializers.BooleanField(default=True)
+
+
+class MachineRecommendationEstimateSerializer(serializers.Serializer):
+    order_quantity = serializers.IntegerField()
+    output_per_item = serializers.IntegerField()
+    material_cost = serializers.DecimalField(decimal_places=2, max_digits=14)
+    operation_cost = serializers.DecimalField(decimal_places=2, max_digits=14)
+    total_cost = serializers.DecimalField(decimal_places=2, max_digits=14)
+    duration = MeasurementSerializerField(decimal_places=2)
+
+
+class MachineRecommendationOptionSerializer(serializers.Serializer):
+    machine_option_id = serializers.IntegerField(source='machine_option.pk')
+    machine_id = serializers.IntegerField(source='machine.pk')
+    machine_name = serializers.CharField(source='machine.name')
+    machine_type = serializers.CharField(source='machine.type')
+    is_selected = serializers.BooleanField()
+    is_eligible = serializers.BooleanField()
+    error = serializers.CharField(allow_null=True)
+    total_cost = serializers.DecimalField(decimal_places=2, max_digits=14)
+    total_duration = MeasurementSerializerField(decimal_places=2)
+    estimates = MachineRecommendationEstimateSerializer(many=True)
+
+
+class MaterialSelectionInputSerializer(MachineRecommendationInputSerializer):
+    pass
+
+
+class MaterialSelectionEstimateSerializer(serializers.Serializer):
+    item_id = serializers.IntegerField(source='item.pk')
+    item_name = serializers.CharField(source='item.full_name')
+    output_per_item = serializers.IntegerField()
+    stock_quantity = serializers.IntegerField()
+    spoilage_quantity = serializers.IntegerField()
+    total_quantity = serializers.IntegerField()
+    price = serializers.DecimalField(decimal_places=2, max_digits=14)
+    total_cost = serializers.DecimalField(decimal_places=2, max_digits=14)
+
+
+class MaterialSelectionSerializer(serializers.Serializer):
+    order_quantity = serializers.IntegerField()
+    estimates = MaterialSelectionEstimateSerializer(many=True)
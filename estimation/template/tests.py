@@ -1,4 +1,6 @@
 import pytest
+from django.core.management import call_command
+from core.utils.layoutstore import configure_layout_store
 from core.utils.measures import CostingMeasure
 from estimation.machine.models import Machine
 from estimation.process.models import Workstation
@@ -155,6 +157,24 @@ def test_product_template__add_service_template(db, meta_product):
     assert service_template is not None
     assert service_template.sequence == 1
     assert service_template.component_template == sheet_template
+
+
+def test_warmlayouts__paper_component_templates(db, meta_product, tmp_path):
+    product_template = ProductTemplate.objects.create(meta_product=meta_product,
+        name=meta_product.name, description=meta_product.description)
+    sheet_component = meta_product.meta_product_datas.filter(name='Sheets').first()
+    machine_option = sheet_component.meta_machine_options.first()
+    product_template.add_component_template(sheet_component, 100, 
+        length_value=11, width_value=8.5, size_uom='inch', machine_option=machine_option)
+    product_template.add_component_template(sheet_component, 100, 
+        length_value=11, width_value=8.5, size_uom='inch')
+
+    try:
+        call_command('warmlayouts', path=str(tmp_path / 'layouts.sqlite3'))
+        layout_store = configure_layout_store(tmp_path / 'layouts.sqlite3')
+        assert len(layout_store) > 0
+    finally:
+        configure_layout_store(None)
     
 '''
 def test_delete_meta_operation_option__template_option_restrict_delete(db, meta_product):
@@ -10,5 +10,13 @@ urlpatterns = [
             'delete': 'destroy'})),
 
     path('api/templates/products/components/metadata',
-        views.ComponentTemplateMetaView.as_view({'get': 'list'}))
+        views.ComponentTemplateMetaView.as_view({'get': 'list'})),
+
+    # Machine recommendations for a component template
+    path('api/templates/components/<pk>/recommendmachines',
+        views.MachineRecommendationView.as_view({'post':'create'})),
+
+    # Parent sheet selection for a component template
+    path('api/templates/components/<pk>/selectmaterials',
+        views.MaterialSelectionView.as_view({'post':'create'}))
 ]
\ No newline at end of file
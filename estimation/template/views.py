@@ -5,6 +5,8 @@ from rest_framework.response import Response
 from estimation.template import serializers
 from estimation.template.models import ProductTemplate, ComponentTemplate, \
     MaterialTemplate, ServiceTemplate, OperationTemplate, OperationOptionTemplate
+from estimation.product.models import MachineRecommendation, MaterialSelection
+from estimation.exceptions import MaterialTypeMismatch
 
 
 class ProductTemplateViewUtils:
@@ -185,3 +187,59 @@ class ComponentTemplateMetaView(viewsets.ViewSet):
             response.append({"type": resourcetype, "fields": filtered})
 
         return Response(response)
+
+
+# Ranks the machine options of a component template for the given order quantities
+class MachineRecommendationView(mixins.CreateModelMixin, viewsets.GenericViewSet):
+    queryset = []
+    serializer_class = serializers.MachineRecommendationInputSerializer
+
+    def create(self, request, pk):
+        component_template = get_object_or_404(ComponentTemplate, pk=pk)
+        serializer = serializers.MachineRecommendationInputSerializer(data=request.data)
+
+        if serializer.is_valid():
+            validated_data = serializer.validated_data
+            recommendation = MachineRecommendation(component_template, 
+                validated_data.get('order_quantities'), 
+                validated_data.get('spoilage_rate'), validated_data.get('rotate'))
+            options = recommendation.recommend()
+            serializer = serializers.MachineRecommendationOptionSerializer(options, many=True)
+
+            return Response({
+                "component_template_id": component_template.pk,
+                "order_quantities": recommendation.order_quantities,
+                "options": serializer.data
+            })
+        else:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+
+# Ranks the parent sheets of a paper component template per order quantity
+class MaterialSelectionView(mixins.CreateModelMixin, viewsets.GenericViewSet):
+    queryset = []
+    serializer_class = serializers.MaterialSelectionInputSerializer
+
+    def create(self, request, pk):
+        component_template = get_object_or_404(ComponentTemplate, pk=pk)
+        serializer = serializers.MaterialSelectionInputSerializer(data=request.data)
+
+        if serializer.is_valid():
+            validated_data = serializer.validated_data
+            selection = MaterialSelection(component_template, 
+                validated_data.get('order_quantities'), 
+                validated_data.get('spoilage_rate'), validated_data.get('rotate'))
+            try:
+                selections = selection.select()
+            except MaterialTypeMismatch as e:
+                return Response({'error': e.message}, status.HTTP_400_BAD_REQUEST)
+            serializer = serializers.MaterialSelectionSerializer(selections, many=True)
+
+            return Response({
+                "component_template_id": component_template.pk,
+                "candidates": selection.candidates,
+                "evaluated": selection.evaluated,
+                "selections": serializer.data
+            })
+        else:
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
@@ -28,7 +28,7 @@ def product(db, product_template):
     return product_estimate
 
 
-def test_product_summary_sheet(db, product):
+def test_product_summary_sheet(db, product, tmp_path):
     workbook = CostEstimateWorkbook(product, 'estimate-workbook')
 
     assert workbook.sheets is not None
@@ -53,6 +53,6 @@ def test_product_summary_sheet(db, product):
     assert service_section.start_row == 7
     assert service_section.start_col == 0
 
-    path_to_file = 'test_write_excel.xlsx'
+    path_to_file = tmp_path / 'test_write_excel.xlsx'
     with pd.ExcelWriter(path_to_file, engine='xlsxwriter') as writer:
         workbook.write(writer)
\ No newline at end of file
@@ -24,8 +24,8 @@ def item_factory(db, base_unit__sheet: BaseStockUnit, alt_unit__ream: AlternateS
         return item
     return create_item
 
-def test_itemsheet__write_excel(db, item_factory):
-    path_to_file = 'test_write_excel.xlsx'
+def test_itemsheet__write_excel(db, item_factory, tmp_path):
+    path_to_file = tmp_path / 'test_write_excel.xlsx'
     paper_items = []
 
     item = item_factory(type=Item.PAPER, name='Carbonless White')
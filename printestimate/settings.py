@@ -162,4 +162,17 @@ STATIC_URL = '/static/'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination'
-}
\ No newline at end of file
+}
+
+
+# Maximum number of sheet layouts kept in the in-process layout cache
+LAYOUT_CACHE_SIZE = 2048
+
+# Optional on-disk layout store shared by all workers on a node, disabled when unset
+LAYOUT_STORE_PATH = os.environ.get('LAYOUT_STORE_PATH')
+LAYOUT_STORE_MAX_ENTRIES = int(os.environ.get('LAYOUT_STORE_MAX_ENTRIES', 100000))
+
+# Worker processes packing layouts in parallel, disabled when 0 or 1, and the
+# fewest layout tasks in a batch for it to go through the workers by default
+LAYOUT_WORKERS = int(os.environ.get('LAYOUT_WORKERS', 0))
+LAYOUT_POOL_MIN_TASKS = int(os.environ.get('LAYOUT_POOL_MIN_TASKS', 8))